@@ -0,0 +1,330 @@
+"""Carga HTTP na API: vazão e latência (p50/p90/p99) por rota e concorrência.
+
+Sobe o app de src/main.py num processo separado (servidor threaded do
+werkzeug), com banco SQLite e o serviço WhatsApp substituído pelo
+benchmarks/gateway_stub.py, e mede login, listagem de instâncias,
+get_instance (com e sem ?fresh=true), contatos e send-message em cada nível
+de concorrência. --server gevent sobe src/gevent_server.py no lugar do
+servidor com threads. Com --target, mede uma API já em execução (ex.: gunicorn),
+que deve estar apontada para um gateway/stub com as sessões iniciadas.
+
+Os resultados são gravados em JSON (--output) com o commit atual, para
+comparar com uma execução anterior (--compare).
+
+Uso:
+    python benchmarks/bench_api.py --concurrency 1,8,32 --requests 500 --output resultados.json
+    python benchmarks/bench_api.py --latency 0.05 --error-rate 0.01 --compare base.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_EMAIL = 'admin@sieapi.com'
+ADMIN_PASSWORD = 'admin123'
+
+# Cada cenário recebe (sessão HTTP, url base, headers, id da instância)
+SCENARIOS = {
+    'login': lambda http, url, headers, instance_id: http.post(
+        f"{url}/api/auth/login", json={'email': ADMIN_EMAIL, 'password': ADMIN_PASSWORD}
+    ),
+    'list_instances': lambda http, url, headers, instance_id: http.get(
+        f"{url}/api/whatsapp/instances", headers=headers
+    ),
+    'get_instance': lambda http, url, headers, instance_id: http.get(
+        f"{url}/api/whatsapp/instances/{instance_id}", headers=headers
+    ),
+    'get_instance_fresh': lambda http, url, headers, instance_id: http.get(
+        f"{url}/api/whatsapp/instances/{instance_id}?fresh=true", headers=headers
+    ),
+    'contacts': lambda http, url, headers, instance_id: http.get(
+        f"{url}/api/whatsapp/instances/{instance_id}/contacts?limit=50", headers=headers
+    ),
+    'send_message': lambda http, url, headers, instance_id: http.post(
+        f"{url}/api/whatsapp/instances/{instance_id}/send-message",
+        json={'to': '5511999999999@c.us', 'message': 'Mensagem de benchmark'},
+        headers=headers
+    ),
+}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_until_ready(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} não respondeu em {timeout}s")
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Processo do servidor: configura o ambiente e só então monta o app (o banco
+# já foi preparado pelo comando init-db)
+def serve(port):
+    import logging
+    import warnings
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    warnings.simplefilter('ignore')
+
+    sys.path.insert(0, BASE_DIR)
+    from src.main import app
+
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+def start_processes(args, workdir):
+    stub_port = free_port()
+    api_port = free_port()
+
+    if args.database in ('memory', 'file'):
+        database_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    else:
+        database_url = args.database
+
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        WHATSAPP_SERVICE_URL=f"http://127.0.0.1:{stub_port}/api",
+        METRICS_DIR=os.path.join(workdir, 'metrics'),
+        MEDIA_STORE_PATH=os.path.join(workdir, 'media'),
+        MESSAGE_QUEUE_WORKERS='0',
+        STATUS_POLL_INTERVAL='0',
+        MAIL_OUTBOX_INTERVAL='0',
+        TOKEN_SWEEP_INTERVAL='0'
+    )
+
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(BASE_DIR, 'benchmarks', 'gateway_stub.py'),
+        '--port', str(stub_port),
+        '--latency', str(args.latency),
+        '--jitter', str(args.jitter),
+        '--error-rate', str(args.error_rate)
+    ], stdout=subprocess.DEVNULL)
+    if args.server == 'gevent':
+        command = [sys.executable, os.path.join(BASE_DIR, 'src', 'gevent_server.py')]
+        env.update(PORT=str(api_port), WHATSAPP_POOL_SIZE=str(args.gateway_pool_size or 1000))
+    else:
+        command = [sys.executable, os.path.abspath(__file__), '--serve', str(api_port)]
+        if args.gateway_pool_size:
+            env['WHATSAPP_POOL_SIZE'] = str(args.gateway_pool_size)
+    subprocess.run(
+        [sys.executable, '-m', 'flask', '--app', 'src.main', 'init-db'],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, check=True
+    )
+    api = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+
+    url = f"http://127.0.0.1:{api_port}"
+    wait_until_ready(f"http://127.0.0.1:{stub_port}/api/instances")
+    wait_until_ready(f"{url}/api/status")
+    return url, [stub, api]
+
+def prepare(url, instances):
+    http = requests.Session()
+    response = http.post(f"{url}/api/auth/login", json={'email': ADMIN_EMAIL, 'password': ADMIN_PASSWORD})
+    response.raise_for_status()
+    headers = {'Authorization': f"Bearer {response.json()['token']}"}
+
+    instance_ids = []
+    for index in range(instances):
+        response = http.post(f"{url}/api/whatsapp/instances", json={'name': f"Benchmark {index}"}, headers=headers)
+        response.raise_for_status()
+        instance_id = response.json()['instance']['id']
+        http.post(f"{url}/api/whatsapp/instances/{instance_id}/init", headers=headers)
+        instance_ids.append(instance_id)
+    return headers, instance_ids
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def run_level(scenario, url, headers, instance_ids, concurrency, total, warmup):
+    call = SCENARIOS[scenario]
+
+    def worker(worker_index):
+        http = requests.Session()
+        latencies = []
+        statuses = Counter()
+        count = total // concurrency + (1 if worker_index < total % concurrency else 0)
+
+        for request_index in range(warmup + count):
+            instance_id = instance_ids[(worker_index + request_index) % len(instance_ids)]
+            started = time.perf_counter()
+            try:
+                status = str(call(http, url, headers, instance_id).status_code)
+            except requests.RequestException as e:
+                status = type(e).__name__
+            if request_index >= warmup:
+                latencies.append(time.perf_counter() - started)
+                statuses[status] += 1
+        return latencies, statuses
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(value for worker_latencies, _ in results for value in worker_latencies)
+    statuses = sum((worker_statuses for _, worker_statuses in results), Counter())
+    errors = sum(count for status, count in statuses.items() if not status.startswith(('2', '3')))
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'statuses': dict(statuses),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p90_ms': percentile(latencies, 0.90) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0
+    }
+
+def print_results(results, baseline=None):
+    previous = {}
+    if baseline:
+        previous = {(row['scenario'], row['concurrency']): row for row in baseline['results']}
+
+    header = f"{'cenário':20}{'conc.':>6}{'req/s':>10}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'erros':>7}"
+    if previous:
+        header += f"{'Δ req/s':>10}{'Δ p99':>9}"
+    print(header)
+
+    for row in results:
+        line = (
+            f"{row['scenario']:20}{row['concurrency']:6}{row['throughput']:10.1f}"
+            f"{row['p50_ms']:9.1f}{row['p90_ms']:9.1f}{row['p99_ms']:9.1f}{row['errors']:7}"
+        )
+        old = previous.get((row['scenario'], row['concurrency']))
+        if old:
+            line += f"{(row['throughput'] / old['throughput'] - 1) * 100 if old['throughput'] else 0:+9.1f}%"
+            line += f"{(row['p99_ms'] / old['p99_ms'] - 1) * 100 if old['p99_ms'] else 0:+8.1f}%"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--target', help='URL de uma API já em execução (não sobe app nem stub)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--requests', type=int, default=500, help='requisições medidas por cenário e nível')
+    parser.add_argument('--warmup', type=int, default=5, help='requisições descartadas por thread')
+    parser.add_argument('--instances', type=int, default=10)
+    parser.add_argument('--database', default='file', help="'file' (SQLite temporário), 'memory' (SQLite em /dev/shm) ou uma URL do SQLAlchemy")
+    parser.add_argument('--server', choices=('threaded', 'gevent'), default='threaded',
+                        help='threaded (werkzeug, como src/main.py) ou gevent (src/gevent_server.py)')
+    parser.add_argument('--gateway-pool-size', type=int, help='WHATSAPP_POOL_SIZE do app')
+    parser.add_argument('--latency', type=float, default=0.0, help='latência do stub, em segundos')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='arquivo JSON com os resultados')
+    parser.add_argument('--compare', help='JSON de uma execução anterior para comparação')
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve)
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"cenários desconhecidos: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    # Com --database memory o diretório de trabalho (e o SQLite) fica em tmpfs:
+    # os dados ficam na memória, mas com o bloqueio por arquivo do SQLite (um
+    # banco :memory: compartilhado bloqueia por tabela e falha sob escrita
+    # concorrente)
+    parent = '/dev/shm' if args.database == 'memory' and os.path.isdir('/dev/shm') else None
+
+    processes = []
+    with tempfile.TemporaryDirectory(prefix='sie_bench_', dir=parent) as workdir:
+        try:
+            if args.target:
+                url = args.target.rstrip('/')
+            else:
+                url, processes = start_processes(args, workdir)
+
+            headers, instance_ids = prepare(url, args.instances)
+            results = []
+            for scenario in scenarios:
+                for concurrency in levels:
+                    results.append(run_level(
+                        scenario, url, headers, instance_ids, concurrency, args.requests, args.warmup
+                    ))
+        finally:
+            # SIGINT encerra o app normalmente (e o pool de hash de senhas junto)
+            for process in processes:
+                process.send_signal(signal.SIGINT)
+            for process in processes:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'target': args.target,
+            'database': None if args.target else args.database,
+            'server': None if args.target else args.server,
+            'stub': None if args.target else {
+                'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate
+            },
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'instances': args.instances
+        },
+        'results': results
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as source:
+            baseline = json.load(source)
+        print(f"comparando com {baseline['meta'].get('commit') or args.compare}")
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"resultados gravados em {args.output}")
+
+if __name__ == '__main__':
+    main()
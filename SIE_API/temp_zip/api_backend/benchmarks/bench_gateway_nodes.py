@@ -0,0 +1,110 @@
+"""Distribuição das sessões entre nós do serviço WhatsApp e custo do roteamento.
+
+Para --sessions sessões e 2..--nodes nós, mostra o desvio da carga em relação
+à média (maior e menor nó) com o anel de hash consistente e quantas sessões
+mudam de nó ao incluir mais um, comparando com `hash(session_id) % nós`. Depois
+mede o custo de gateway_nodes.url_for() por chamada, com a rota em cache e sem
+ela (consulta ao banco), num SQLite temporário.
+
+Uso:
+    python benchmarks/bench_gateway_nodes.py --sessions 20000 --nodes 8
+    python benchmarks/bench_gateway_nodes.py --vnodes 40 --lookups 50000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.models.user import db, User, WhatsAppInstance
+from src.services.whatsapp_gateway import gateway
+from src.services.gateway_nodes import gateway_nodes, HashRing, _hash
+
+def spread(assignment, nodes):
+    counts = {node: 0 for node in nodes}
+    for node in assignment.values():
+        counts[node] += 1
+    mean = len(assignment) / len(nodes)
+    return (max(counts.values()) / mean - 1) * 100, (min(counts.values()) / mean - 1) * 100
+
+def distribution(sessions, max_nodes, vnodes):
+    print(f"{'nós':>4} {'maior nó':>10} {'menor nó':>10} {'movidas (anel)':>16} {'movidas (módulo)':>18}")
+    previous_ring = previous_modulo = None
+    for count in range(2, max_nodes + 1):
+        nodes = list(range(1, count + 1))
+        ring = HashRing([(node, 1) for node in nodes], vnodes)
+        by_ring = {session: ring.lookup(session) for session in sessions}
+        by_modulo = {session: nodes[_hash(session) % count] for session in sessions}
+
+        high, low = spread(by_ring, nodes)
+        moved = ''
+        if previous_ring:
+            ring_moved = sum(1 for session in sessions if by_ring[session] != previous_ring[session]) / len(sessions) * 100
+            modulo_moved = sum(1 for session in sessions if by_modulo[session] != previous_modulo[session]) / len(sessions) * 100
+            moved = f"{ring_moved:>15.1f}% {modulo_moved:>17.1f}%"
+        print(f"{count:>4} {high:>+9.1f}% {low:>+9.1f}% {moved}")
+        previous_ring, previous_modulo = by_ring, by_modulo
+
+def routing(lookups, sessions):
+    with tempfile.TemporaryDirectory(prefix='sie_bench_') as workdir:
+        app = Flask(__name__)
+        app.config.update(
+            SECRET_KEY='segredo-de-benchmark',
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            SQLALCHEMY_TRACK_MODIFICATIONS=False,
+            WHATSAPP_SERVICE_URL='http://127.0.0.1:3000/api'
+        )
+        db.init_app(app)
+        gateway.init_app(app)
+        gateway_nodes.init_app(app)
+
+        with app.app_context():
+            db.create_all()
+            user = User('bench@bench.local', 'senha-de-teste', 'Bench')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add_all(
+                WhatsAppInstance(name=f"Bench {index}", session_id=f"session_bench_{index}", user_id=user.id)
+                for index in range(sessions)
+            )
+            db.session.commit()
+            gateway_nodes.ensure_default()
+
+            keys = [f"session_bench_{index % sessions}" for index in range(lookups)]
+            for key in keys:
+                gateway_nodes.url_for(key)
+
+            started = time.perf_counter()
+            for key in keys:
+                gateway_nodes.url_for(key)
+            cached = (time.perf_counter() - started) / lookups * 1e6
+
+            cold_lookups = min(lookups, 2000)
+            started = time.perf_counter()
+            for key in keys[:cold_lookups]:
+                gateway_nodes.invalidate(key)
+                gateway_nodes.url_for(key)
+            cold = (time.perf_counter() - started) / cold_lookups * 1e6
+
+    print(f"url_for com a rota em cache: {cached:8.1f} µs por chamada")
+    print(f"url_for consultando o banco: {cold:8.1f} µs por chamada")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=10000)
+    parser.add_argument('--nodes', type=int, default=6, help='número máximo de nós')
+    parser.add_argument('--vnodes', type=int, default=160, help='pontos de cada nó no anel')
+    parser.add_argument('--lookups', type=int, default=20000, help='chamadas a url_for na medição do roteamento')
+    args = parser.parse_args()
+
+    sessions = [f"session_{index}_{1700000000 + index * 7.3:.6f}" for index in range(args.sessions)]
+    print(f"sessões={args.sessions} vnodes={args.vnodes}")
+    distribution(sessions, args.nodes, args.vnodes)
+    print()
+    routing(args.lookups, min(args.sessions, 1000))
+
+if __name__ == '__main__':
+    main()
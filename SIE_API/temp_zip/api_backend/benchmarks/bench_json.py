@@ -0,0 +1,117 @@
+"""Serialização de listagens grandes: objetos do ORM + to_dict() x linhas por colunas.
+
+Para cada quantidade de instâncias (--rows), mede o tempo de consulta +
+serialização e só o de serialização (linhas já carregadas) em quatro caminhos:
+
+- orm + jsonify padrão: Model.query.all(), to_dict() e o provider JSON padrão
+- orm + orjson: o mesmo, com o OrjsonProvider
+- colunas + json: consulta por colunas e json.dumps por linha (listagem antiga)
+- colunas + encode_rows: consulta por colunas e fast_json.encode_rows() por
+  lote, como em stream_listing()
+
+Uso:
+    python benchmarks/bench_json.py --rows 10000,100000
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from src.models.user import db, User, WhatsAppInstance
+from src.services.fast_json import fast_json, OrjsonProvider, orjson
+
+def build_app(database_url):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=database_url,
+        SQLALCHEMY_TRACK_MODIFICATIONS=False
+    )
+    db.init_app(app)
+    return app
+
+def seed(rows):
+    db.drop_all()
+    db.create_all()
+    user = User('bench@bench.local', 'senha-de-teste', 'Bench')
+    db.session.add(user)
+    db.session.flush()
+    now = datetime.datetime.utcnow()
+    table = WhatsAppInstance.__table__
+    for start in range(0, rows, 5000):
+        db.session.execute(table.insert(), [
+            {
+                'name': f"Instância {index}", 'session_id': f"session_{index}", 'phone_number': f"55119{index:08d}",
+                'instance_type': 'whatsapp-web.js', 'is_connected': index % 2 == 0, 'status_checked_at': now,
+                'is_active': True, 'webhook_url': None, 'ignore_groups': False, 'block_calls': False,
+                'prevent_message_deletion': False, 'user_id': user.id, 'gateway_node_id': 1,
+                'created_at': now, 'updated_at': now
+            }
+            for index in range(start, min(start + 5000, rows))
+        ])
+    db.session.commit()
+
+def orm_rows():
+    db.session.expunge_all()
+    return WhatsAppInstance.query.order_by(WhatsAppInstance.id).all()
+
+def column_rows():
+    fields = list(WhatsAppInstance.PUBLIC_FIELDS)
+    return fields, db.session.execute(
+        db.select(*[getattr(WhatsAppInstance, field) for field in fields]).order_by(WhatsAppInstance.id)
+    ).all()
+
+def serialize_orm(provider, instances):
+    return provider.response({'instances': [instance.to_dict() for instance in instances]}).get_data()
+
+def serialize_columns_json(fields, rows):
+    def value(item):
+        return item.isoformat() if isinstance(item, datetime.datetime) else item
+    parts = [json.dumps({field: value(item) for field, item in zip(fields, row)}, ensure_ascii=False) for row in rows]
+    return ('{"instances":[' + ','.join(parts) + ']}').encode('utf-8')
+
+def serialize_columns_fast(fields, rows):
+    chunks = [fast_json.encode_rows(fields, rows[start:start + 500]) for start in range(0, len(rows), 500)]
+    return b'{"instances":[' + b','.join(chunks) + b']}'
+
+def timed(call):
+    started = time.perf_counter()
+    result = call()
+    return time.perf_counter() - started, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='10000,100000', help='quantidades de linhas, separadas por vírgula')
+    args = parser.parse_args()
+
+    if orjson is None:
+        print('orjson não instalado: os caminhos rápidos usam o módulo json')
+
+    with tempfile.TemporaryDirectory(prefix='sie_bench_') as workdir:
+        app = build_app(f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+        default_provider = DefaultJSONProvider(app)
+        fast_provider = OrjsonProvider(app) if orjson else default_provider
+
+        print(f"{'linhas':>8} {'caminho':<24} {'consulta+json (ms)':>20} {'só json (ms)':>14} {'bytes':>12}")
+        with app.app_context():
+            for count in [int(value) for value in args.rows.split(',')]:
+                seed(count)
+                paths = (
+                    ('orm + jsonify padrão', orm_rows, lambda rows: serialize_orm(default_provider, rows)),
+                    ('orm + orjson', orm_rows, lambda rows: serialize_orm(fast_provider, rows)),
+                    ('colunas + json', column_rows, lambda data: serialize_columns_json(*data)),
+                    ('colunas + encode_rows', column_rows, lambda data: serialize_columns_fast(*data)),
+                )
+                for name, load, serialize in paths:
+                    load_time, data = timed(load)
+                    encode_time, body = timed(lambda: serialize(data))
+                    print(f"{count:>8} {name:<24} {(load_time + encode_time) * 1000:>20.1f} {encode_time * 1000:>14.1f} {len(body):>12}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Eventos em tempo real: painéis em GET /api/whatsapp/events/stream.
+
+O serviço WhatsApp é o benchmarks/gateway_stub.py numa thread, que publica os
+eventos no seu /api/events/stream. --subscribers painéis (fluxos abertos pelo
+cliente de teste do Flask, cada um lido por uma thread) se dividem entre
+--users usuários, cada um com uma instância. O benchmark confere:
+
+- uma única conexão do processo com o serviço WhatsApp, qualquer que seja o
+  número de painéis
+- cada mudança de status chega a todos os painéis do dono da instância e a
+  nenhum outro (mede a latência do stub até o painel)
+- --messages mensagens de uma instância viram poucos eventos `messages`, com
+  a soma exata de recebidas e enviadas
+- ao fechar os fluxos, nenhuma inscrição fica para trás
+
+Uso:
+    python benchmarks/bench_live_events.py --subscribers 500 --users 50 --events 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import jwt
+from src.main import create_app
+from src.cli import init_database
+from src.models.user import db, User, WhatsAppInstance
+from src.services.live_events import live_events
+from gateway_stub import start_stub
+
+COUNT_INTERVAL = 0.05
+
+def build(workdir, stub):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'WHATSAPP_SERVICE_URL': stub.url,
+        'RATE_LIMIT_PATH': os.path.join(workdir, 'rate_limit.bin'),
+        'DATABASE_ROUTING_PATH': os.path.join(workdir, 'routing.bin'),
+        'METRICS_DIR': os.path.join(tempfile.gettempdir(), 'sie_bench_metrics'),
+        'LIVE_EVENTS_HEARTBEAT': 0.5,
+        'LIVE_EVENTS_COUNT_INTERVAL': COUNT_INTERVAL,
+        'LIVE_EVENTS_MAX_SUBSCRIBERS': 100000,
+        'LIVE_EVENTS_QUEUE_SIZE': 100000
+    })
+    init_database(app)
+    return app
+
+def seed(app, users):
+    owners = {}
+    with app.app_context():
+        for index in range(users):
+            user = User(f"painel{index}@bench.local", 'senha-de-teste', f"Painel {index}")
+            user.confirm_email()
+            db.session.add(user)
+            db.session.flush()
+            instance = WhatsAppInstance(name=f"Bench {index}", session_id=f"session_bench_{index}", user_id=user.id)
+            db.session.add(instance)
+            db.session.flush()
+            owners[index] = (user.id, instance.id, instance.session_id)
+        db.session.commit()
+    return owners
+
+# Painel: lê o fluxo numa thread e guarda (evento, dados, instante de chegada)
+class Panel:
+    def __init__(self, app, user_id):
+        token = jwt.encode({'user_id': user_id}, app.config['SECRET_KEY'], algorithm='HS256')
+        self.response = app.test_client().get(
+            f"/api/whatsapp/events/stream?token={token}", buffered=False, environ_overrides={'wsgi.multithread': True}
+        )
+        self.events = []
+        self.stop = False
+        self.thread = threading.Thread(target=self.read, daemon=True)
+        self.thread.start()
+
+    def read(self):
+        buffer = b''
+        for chunk in self.response.response:
+            buffer += chunk
+            while b'\n\n' in buffer:
+                message, buffer = buffer.split(b'\n\n', 1)
+                fields = dict(line.split(': ', 1) for line in message.decode('utf-8').split('\n') if ': ' in line and not line.startswith(':'))
+                if 'event' in fields:
+                    self.events.append((fields['event'], json.loads(fields['data']), time.perf_counter()))
+            if self.stop:
+                break
+        self.response.close()
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def check(name, ok, detail=''):
+    print(f"{'ok  ' if ok else 'ERRO'} {name:<52} {detail}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', type=int, default=200)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--events', type=int, default=500, help='mudanças de status publicadas')
+    parser.add_argument('--messages', type=int, default=5000, help='mensagens publicadas numa instância')
+    args = parser.parse_args()
+
+    stub = start_stub()
+    stub.heartbeat = 0.5
+    results = []
+    with tempfile.TemporaryDirectory(prefix='sie_bench_') as workdir:
+        app = build(workdir, stub)
+        owners = seed(app, args.users)
+
+        started = time.perf_counter()
+        panels = [(index % args.users, Panel(app, owners[index % args.users][0])) for index in range(args.subscribers)]
+        opened = time.perf_counter() - started
+        wait_for(lambda: stub.stream_connections >= 1)
+        wait_for(lambda: all(panel.events for _, panel in panels))
+        results.append(check(f"{args.subscribers} painéis, conexões com o serviço WhatsApp", stub.stream_connections == 1,
+                             f"{stub.stream_connections} ({opened / args.subscribers * 1e3:.2f} ms para abrir cada painel)"))
+        results.append(check('retrato inicial com o status de cada instância',
+                             all(panel.events[0][0] == 'state' and panel.events[0][1]['instanceId'] == owners[owner][1]
+                                 for owner, panel in panels)))
+
+        # Mudanças de status: o motivo leva o número do evento
+        for _, panel in panels:
+            panel.events.clear()
+        sent = {}
+        for sequence in range(args.events):
+            owner = sequence % args.users
+            sent[str(sequence)] = (owner, time.perf_counter())
+            stub.publish('state', {'sessionId': owners[owner][2], 'state': 'connected' if sequence % 2 else 'disconnected',
+                                   'reason': str(sequence)})
+            time.sleep(0.001)
+
+        expected = {owner: sum(1 for sequence in range(args.events) if sequence % args.users == owner) for owner in owners}
+        state_events = lambda panel: [event for event in panel.events if event[0] == 'state']
+        wait_for(lambda: all(len(state_events(panel)) >= expected[owner] for owner, panel in panels))
+
+        latencies = []
+        misrouted = 0
+        missing = 0
+        for owner, panel in panels:
+            events = state_events(panel)
+            missing += max(0, expected[owner] - len(events))
+            for _, data, arrived in events:
+                source, published = sent[data['reason']]
+                misrouted += source != owner or data['instanceId'] != owners[owner][1]
+                latencies.append(arrived - published)
+        latencies.sort()
+        results.append(check('status entregue a todos os painéis do dono', missing == 0,
+                             f"{len(latencies)} entregas, {missing} faltando"))
+        results.append(check('nenhum evento em painel de outro usuário', misrouted == 0, f"{misrouted} fora do lugar"))
+        if latencies:
+            print(f"     latência stub → painel: mediana {statistics.median(latencies) * 1e3:.2f} ms, "
+                  f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1e3:.2f} ms, máx {latencies[-1] * 1e3:.2f} ms")
+
+        # Mensagens somadas por instância
+        for _, panel in panels:
+            panel.events.clear()
+        started = time.perf_counter()
+        for index in range(args.messages):
+            stub.publish('message', {'sessionId': owners[0][2], 'fromMe': index % 4 == 0})
+        message_events = lambda panel: [data for event, data, _ in panel.events if event == 'messages']
+        total = lambda panel: sum(data['received'] + data['sent'] for data in message_events(panel))
+        owner_panels = [panel for owner, panel in panels if owner == 0]
+        wait_for(lambda: all(total(panel) >= args.messages for panel in owner_panels))
+        elapsed = time.perf_counter() - started
+        time.sleep(COUNT_INTERVAL * 3)
+        batches = max(len(message_events(panel)) for panel in owner_panels)
+        sent_count = sum(data['sent'] for data in message_events(owner_panels[0]))
+        results.append(check(f"{args.messages} mensagens somadas para os painéis do dono",
+                             all(total(panel) == args.messages for panel in owner_panels) and sent_count == (args.messages + 3) // 4,
+                             f"{batches} eventos por painel em {elapsed * 1e3:.0f} ms"))
+        results.append(check('contagem não chega a outros usuários',
+                             not any(message_events(panel) for owner, panel in panels if owner != 0)))
+
+        for _, panel in panels:
+            panel.stop = True
+        for _, panel in panels:
+            panel.thread.join(5)
+        results.append(check('inscrições encerradas com os fluxos', wait_for(lambda: live_events.subscriber_count == 0),
+                             f"{live_events.subscriber_count} restantes"))
+        live_events.stop(1)
+    stub.shutdown()
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Latência do mention-all em grupos grandes, com e sem o cache de membros.
+
+Para cada tamanho de grupo mede POST .../mention-all (p50/p90) em três
+situações: cache frio (a API consulta os membros antes de cada envio, como o
+serviço WhatsApp fazia a cada chamada), cache quente (a lista vai pronta no
+corpo) e cache quente atualizado por eventos de entrada/saída recebidos em
+POST /api/events. O serviço WhatsApp é o benchmarks/gateway_stub.py, em que a
+consulta aos membros custa --participant-latency segundos por membro.
+
+Uso:
+    python benchmarks/bench_mention_all.py --sizes 1000,5000 --requests 30
+    python benchmarks/bench_mention_all.py --participant-latency 0.002 --latency 0.05
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.models.user import db, User, WhatsAppInstance
+from src.routes.auth import auth_bp, mail
+from src.routes.whatsapp import whatsapp_bp
+from src.routes.events import events_bp
+from src.services.whatsapp_gateway import gateway
+from src.services.group_cache import group_cache
+from gateway_stub import start_stub
+
+PASSWORD = 'senha-de-teste'
+SECRET = 'segredo-de-benchmark'
+GROUP_ID = '120363000000000000@g.us'
+
+def build_app(database_url, stub_url):
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY='segredo-de-benchmark',
+        SQLALCHEMY_DATABASE_URI=database_url,
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        WHATSAPP_SERVICE_URL=stub_url,
+        EVENTS_SECRET=SECRET
+    )
+    db.init_app(app)
+    mail.init_app(app)
+    gateway.init_app(app)
+    group_cache.init_app(app)
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(whatsapp_bp, url_prefix='/api/whatsapp')
+    app.register_blueprint(events_bp, url_prefix='/api/events')
+    return app
+
+def seed(app):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User('bench@bench.local', PASSWORD, 'Bench')
+        user.confirm_email()
+        db.session.add(user)
+        db.session.flush()
+        instance = WhatsAppInstance(name='Bench', session_id='session_bench', user_id=user.id)
+        db.session.add(instance)
+        db.session.commit()
+        return instance.id
+
+def measure(requests, call, before=None):
+    timings = []
+    for _ in range(requests):
+        if before:
+            before()
+        started = time.perf_counter()
+        response = call()
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    timings.sort()
+    return statistics.median(timings) * 1000, timings[int(len(timings) * 0.9) - 1] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,5000', help='tamanhos de grupo, separados por vírgula')
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--participant-latency', type=float, default=0.0005, help='custo da consulta por membro, em segundos')
+    parser.add_argument('--latency', type=float, default=0.0, help='atraso do stub por chamada, em segundos')
+    args = parser.parse_args()
+
+    stub = start_stub(latency=args.latency, participant_latency=args.participant_latency)
+    with tempfile.TemporaryDirectory(prefix='sie_bench_') as workdir:
+        app = build_app(f"sqlite:///{os.path.join(workdir, 'bench.db')}", stub.url)
+        instance_id = seed(app)
+        client = app.test_client()
+        token = client.post('/api/auth/login', json={'email': 'bench@bench.local', 'password': PASSWORD}).json['token']
+        headers = {'Authorization': f"Bearer {token}"}
+        url = f"/api/whatsapp/instances/{instance_id}/mention-all"
+        body = {'groupId': GROUP_ID, 'message': 'Aviso para todos'}
+
+        def mention():
+            return client.post(url, json=body, headers=headers)
+
+        def membership_event():
+            index = int(time.perf_counter_ns() % 1000000)
+            client.post('/api/events', headers={'X-Events-Secret': SECRET}, json={'events': [
+                {'type': 'group_participants', 'sessionId': 'session_bench', 'groupId': GROUP_ID,
+                 'action': 'add', 'participants': [f"55219{index:08d}@c.us"]}
+            ]})
+
+        print(f"custo da consulta por membro={args.participant_latency * 1000:.2f} ms, latência do stub={args.latency}s")
+        print(f"{'membros':>8} {'cenário':<24} {'p50 (ms)':>10} {'p90 (ms)':>10}")
+        for size in [int(value) for value in args.sizes.split(',')]:
+            stub.group_size = size
+            with app.app_context():
+                cold = measure(args.requests, mention, before=lambda: group_cache.invalidate(instance_id))
+                mention()
+                warm = measure(args.requests, mention)
+                events = measure(args.requests, mention, before=membership_event)
+
+            for name, (p50, p90) in (('cache frio', cold), ('cache quente', warm), ('quente + eventos', events)):
+                print(f"{size:>8} {name:<24} {p50:>10.1f} {p90:>10.1f}")
+
+    stub.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Vazão de verificação de senha (login) com hash na thread vs. pool de processos.
+
+Simula uma rajada de logins: `--concurrency` threads chamam check_password ao
+mesmo tempo. Compara o hash calculado na própria thread (PASSWORD_HASH_WORKERS=0,
+comportamento antigo) com o pool de processos do password_hasher, e mostra
+a vazão total e por núcleo.
+
+Uso:
+    python benchmarks/bench_password_hash.py --method scrypt --logins 200
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.services.password_hasher import PasswordHasher, HasherBusy
+
+def run(hasher, password_hash, logins, concurrency):
+    rejected = 0
+
+    def login(_):
+        try:
+            return hasher.verify(password_hash, 'senha-de-teste')
+        except HasherBusy:
+            return None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(login, range(logins)))
+    elapsed = time.perf_counter() - started
+
+    rejected = results.count(None)
+    return (logins - rejected) / elapsed, rejected
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--method', default='scrypt')
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    print(f"método={args.method} logins={args.logins} concorrência={args.concurrency} núcleos={cores}")
+    print(f"{'modo':28}{'logins/s':>12}{'logins/s/núcleo':>18}{'503':>8}")
+
+    for label, workers in (('na thread (sem pool)', 0), (f"pool de {args.workers} processos", args.workers)):
+        app = Flask(__name__)
+        app.config.update(
+            PASSWORD_HASH_METHOD=args.method,
+            PASSWORD_HASH_WORKERS=workers,
+            PASSWORD_HASH_MAX_PENDING=args.concurrency
+        )
+        hasher = PasswordHasher(app)
+        hasher.warm_up()
+        password_hash = hasher.hash('senha-de-teste')
+
+        throughput, rejected = run(hasher, password_hash, args.logins, args.concurrency)
+        used_cores = min(max(workers, 1), cores)
+        print(f"{label:28}{throughput:12.1f}{throughput / used_cores:18.1f}{rejected:8}")
+        hasher.shutdown()
+
+if __name__ == '__main__':
+    main()
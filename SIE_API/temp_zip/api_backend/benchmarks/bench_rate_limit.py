@@ -0,0 +1,89 @@
+"""Custo do limitador de requisições e precisão entre processos.
+
+Mede o tempo de rate_limiter.hit() por chamada (sempre a mesma chave e chaves
+espalhadas pela tabela) e de uma verificação completa dentro de uma requisição
+(rate_limiter.check(), com a chave por IP e os cabeçalhos RateLimit-*). Depois
+sobe --processes processos que disputam a mesma chave ao mesmo tempo, como
+workers do gunicorn, e confere que o total de requisições aceitas é o limite
+da regra, nem mais nem menos.
+
+Uso:
+    python benchmarks/bench_rate_limit.py --calls 100000 --processes 8
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.services.rate_limit import rate_limiter
+
+def build_app(path, slots):
+    app = Flask(__name__)
+    app.config.update(RATE_LIMIT_PATH=path, RATE_LIMIT_SLOTS=slots, RATE_LIMIT_BENCH='1000000000/second')
+    rate_limiter.init_app(app)
+    return app
+
+def per_call(calls, call):
+    started = time.perf_counter()
+    for index in range(calls):
+        call(index)
+    return (time.perf_counter() - started) / calls * 1e6
+
+def contend(path, slots, limit, attempts, start, results):
+    app = Flask(__name__)
+    app.config.update(RATE_LIMIT_PATH=path, RATE_LIMIT_SLOTS=slots)
+    rate_limiter.init_app(app)
+    start.wait()
+    results.put(sum(1 for _ in range(attempts) if rate_limiter.hit('contenção', limit, 3600)[0]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=50000)
+    parser.add_argument('--slots', type=int, default=65536)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--limit', type=int, default=1000, help='limite da regra disputada entre os processos')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='sie_bench_') as workdir:
+        path = os.path.join(workdir, 'rate_limit.bin')
+        app = build_app(path, args.slots)
+        keys = [f"10.0.{index // 256 % 256}.{index % 256}" for index in range(args.calls)]
+
+        same = per_call(args.calls, lambda index: rate_limiter.hit('mesma', 1e9, 1))
+        spread = per_call(args.calls, lambda index: rate_limiter.hit(keys[index], 1e9, 1))
+        print(f"hit(), mesma chave:          {same:6.2f} µs por chamada")
+        print(f"hit(), chaves espalhadas:    {spread:6.2f} µs por chamada")
+
+        with app.test_request_context('/', environ_base={'REMOTE_ADDR': '10.1.2.3'}):
+            check = per_call(args.calls, lambda index: rate_limiter.check('bench', 'ip', (), {}))
+        print(f"check() numa requisição:     {check:6.2f} µs por chamada")
+
+        context = multiprocessing.get_context('fork')
+        start = context.Event()
+        results = context.Queue()
+        attempts = args.limit
+        workers = [
+            context.Process(target=contend, args=(path, args.slots, args.limit, attempts, start, results))
+            for _ in range(args.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        time.sleep(0.5)
+        started = time.perf_counter()
+        start.set()
+        accepted = sum(results.get() for _ in workers)
+        elapsed = time.perf_counter() - started
+        for worker in workers:
+            worker.join()
+
+        total = attempts * args.processes
+        print(f"{args.processes} processos, {total} tentativas na mesma chave (limite {args.limit}/hora): "
+              f"{accepted} aceitas em {elapsed * 1000:.0f} ms ({'ok' if accepted == args.limit else 'ERRO'})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Custo do roteamento de leituras para a réplica, com dois arquivos SQLite.
+
+O banco principal é preparado com init_database() e copiado para o arquivo da
+réplica. Mede a latência de GET /api/whatsapp/instances sem réplica e com
+ela. Para onde vai cada consulta (réplica, banco principal, janela de leitura
+após escrita, réplica fora do ar) é conferido em tests/test_read_replica.py.
+
+Uso:
+    python benchmarks/bench_read_replica.py --requests 2000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+from src.main import create_app
+from src.cli import init_database
+from src.models.user import db, User
+
+def build(workdir, replica):
+    primary = os.path.join(workdir, 'primary.db')
+    config = {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{primary}",
+        'SQLALCHEMY_BINDS': {'replica_1': f"sqlite:///{os.path.join(workdir, 'replica.db')}"} if replica else {},
+        'DATABASE_ROUTING_PATH': os.path.join(workdir, 'routing.bin'),
+        'RATE_LIMIT_PATH': os.path.join(workdir, 'rate_limit.bin'),
+        'METRICS_DIR': os.path.join(tempfile.gettempdir(), 'sie_bench_metrics'),
+        'AUTH_CACHE_TTL': 0
+    }
+    return create_app(config)
+
+def prepare(workdir):
+    app = build(workdir, replica=False)
+    init_database(app)
+    with app.app_context():
+        user = User('leitor@bench.local', 'senha-de-teste', 'Leitor')
+        user.confirm_email()
+        db.session.add(user)
+        db.session.commit()
+        ids = {email: user_id for user_id, email in db.session.execute(db.select(User.id, User.email))}
+    shutil.copyfile(os.path.join(workdir, 'primary.db'), os.path.join(workdir, 'replica.db'))
+    return ids
+
+def headers_for(app, user_id):
+    token = jwt.encode({'user_id': user_id}, app.config['SECRET_KEY'], algorithm='HS256')
+    return {'Authorization': f"Bearer {token}"}
+
+def latency(workdir, ids, requests):
+    print(f"{'configuração':<14} {'µs por GET /api/whatsapp/instances':>36}")
+    for name, replica in (('sem réplica', False), ('com réplica', True)):
+        app = build(workdir, replica)
+        client = app.test_client()
+        headers = headers_for(app, ids['leitor@bench.local'])
+        client.get('/api/whatsapp/instances', headers=headers)
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.get('/api/whatsapp/instances', headers=headers).close()
+        print(f"{name:<14} {(time.perf_counter() - started) / requests * 1e6:>36.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='sie_bench_') as workdir:
+        ids = prepare(workdir)
+        latency(workdir, ids, args.requests)
+
+if __name__ == '__main__':
+    main()
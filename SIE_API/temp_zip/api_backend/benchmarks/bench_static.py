@@ -0,0 +1,93 @@
+"""Arquivos do painel: send_from_directory x manifesto em memória (static_assets).
+
+Para cada caminho (a página inicial, o CSS, a rota do painel que cai no
+index.html e uma revalidação com If-None-Match), mede o tempo por requisição
+e os bytes enviados em três formas:
+
+- disco: a rota antiga, com os.path.exists() e send_from_directory()
+- memória: static_assets sem compressão (cliente sem Accept-Encoding)
+- memória + gzip/br: static_assets com o navegador aceitando gzip e br
+
+Também mostra quanto tempo a montagem do manifesto (leitura, hash e compressão
+prévia) acrescenta à inicialização.
+
+Uso:
+    python benchmarks/bench_static.py --requests 5000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, send_from_directory
+from src.services.static_assets import static_assets, brotli
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'static')
+
+def disk_app():
+    app = Flask(__name__, static_folder=STATIC_FOLDER)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
+            return send_from_directory(app.static_folder, path)
+        else:
+            return send_from_directory(app.static_folder, 'index.html')
+
+    return app
+
+def memory_app():
+    app = Flask(__name__, static_folder=STATIC_FOLDER)
+    started = time.perf_counter()
+    static_assets.init_app(app)
+    return app, time.perf_counter() - started
+
+def measure(client, path, headers, requests):
+    response = client.get(path, headers=headers)
+    size = len(response.data)
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.get(path, headers=headers).close()
+    return (time.perf_counter() - started) / requests * 1e6, response.status_code, size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='requisições por caminho')
+    args = parser.parse_args()
+
+    disk = disk_app().test_client()
+    app, build_time = memory_app()
+    memory = app.test_client()
+    print(f"manifesto montado em {build_time * 1000:.1f} ms (brotli {'disponível' if brotli else 'não instalado'})")
+
+    fingerprinted = re.search(r'/css/styles\.[0-9a-f]+\.css', memory.get('/').get_data(as_text=True)).group(0)
+    compressed = {'Accept-Encoding': 'gzip, deflate, br'}
+    cases = (
+        ('/', '/', '/'),
+        ('/css/styles.css', '/css/styles.css', fingerprinted),
+        ('/instancias', '/instancias', '/instancias'),
+    )
+
+    print(f"{'caminho':<22} {'forma':<20} {'µs/req':>10} {'status':>7} {'bytes':>8}")
+    for name, old_path, new_path in cases:
+        rows = (
+            ('disco', disk, old_path, {}),
+            ('memória', memory, new_path, {}),
+            ('memória + gzip/br', memory, new_path, compressed),
+        )
+        for form, client, path, headers in rows:
+            elapsed, status, size = measure(client, path, headers, args.requests)
+            print(f"{name:<22} {form:<20} {elapsed:>10.1f} {status:>7} {size:>8}")
+
+    # Revalidação: o navegador já tem a página e envia o ETag
+    for form, client, headers in (('disco', disk, {}), ('memória + gzip/br', memory, compressed)):
+        etag = client.get('/', headers=headers).headers['ETag']
+        elapsed, status, size = measure(client, '/', dict(headers, **{'If-None-Match': etag}), args.requests)
+        print(f"{'/ (If-None-Match)':<22} {form:<20} {elapsed:>10.1f} {status:>7} {size:>8}")
+
+if __name__ == '__main__':
+    main()
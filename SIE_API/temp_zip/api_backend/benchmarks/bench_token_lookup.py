@@ -0,0 +1,103 @@
+"""Latência da busca de usuário por token, sem e com índice.
+
+Popula um banco SQLite com N usuários (padrão: 1 milhão) e mede as buscas
+feitas por confirm_email/reset_password (filter_by(confirmation_token=...) e
+filter_by(reset_password_token=...)) antes e depois de criar os índices.
+
+Uso:
+    python benchmarks/bench_token_lookup.py --users 1000000 --lookups 200
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select
+from src.models.user import User
+
+def seed(engine, total, chunk=50000):
+    table = User.__table__
+    now = datetime.datetime.utcnow()
+    tokens = []
+    with engine.begin() as connection:
+        for start in range(0, total, chunk):
+            rows = []
+            for index in range(start, min(start + chunk, total)):
+                confirmation_token = str(uuid.uuid4())
+                reset_token = str(uuid.uuid4())
+                rows.append({
+                    'email': f"user{index}@bench.local",
+                    'password_hash': 'x',
+                    'name': f"Usuário {index}",
+                    'is_admin': False,
+                    'is_active': True,
+                    'email_confirmed': False,
+                    'confirmation_token': confirmation_token,
+                    'reset_password_token': reset_token,
+                    'reset_token_expires_at': now,
+                    'created_at': now,
+                    'updated_at': now
+                })
+                if index % 5000 == 0:
+                    tokens.append((confirmation_token, reset_token))
+            connection.execute(table.insert(), rows)
+    return tokens
+
+def measure(engine, tokens, lookups):
+    table = User.__table__
+    samples = []
+    with engine.connect() as connection:
+        for _ in range(lookups):
+            confirmation_token, reset_token = random.choice(tokens)
+            for column, token in ((table.c.confirmation_token, confirmation_token),
+                                  (table.c.reset_password_token, reset_token)):
+                started = time.perf_counter()
+                connection.execute(select(table.c.id).where(column == token)).first()
+                samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': statistics.median(samples),
+        'p99_ms': samples[int(len(samples) * 0.99) - 1],
+        'mean_ms': statistics.fmean(samples)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.sqlite')}")
+        table = User.__table__
+        indexes = [index for index in table.indexes if index.name in (
+            'ix_users_confirmation_token', 'ix_users_reset_password_token'
+        )]
+
+        # Tabela sem os índices de token, como nos bancos antigos
+        table.create(engine)
+        for index in indexes:
+            index.drop(engine)
+
+        started = time.perf_counter()
+        tokens = seed(engine, args.users)
+        print(f"{args.users} usuários inseridos em {time.perf_counter() - started:.1f}s")
+
+        before = measure(engine, tokens, args.lookups)
+        for index in indexes:
+            index.create(engine)
+        after = measure(engine, tokens, max(args.lookups, 1000))
+
+        print(f"{'':12}{'p50 (ms)':>12}{'p99 (ms)':>12}{'média (ms)':>12}")
+        for label, result in (('sem índice', before), ('com índice', after)):
+            print(f"{label:12}{result['p50_ms']:12.3f}{result['p99_ms']:12.3f}{result['mean_ms']:12.3f}")
+
+if __name__ == '__main__':
+    main()
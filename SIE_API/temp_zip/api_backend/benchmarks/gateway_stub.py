@@ -0,0 +1,222 @@
+"""Substituto local do serviço WhatsApp (Node.js) para benchmarks.
+
+Responde às mesmas rotas de whatsapp_service/index.js (/api/instances,
+/api/status/<id>, /api/send-message, /api/contacts/<id>, ...) com respostas
+fixas, sem abrir sessões do WhatsApp. A latência e a taxa de erro são
+configuráveis para simular um gateway lento ou instável. Os grupos têm
+--group-size membros e a consulta aos membros (GET /api/group-participants e
+mention-all sem "participants") custa --participant-latency segundos por membro.
+GET /api/events/stream é o fluxo de eventos (Server-Sent Events) do
+whatsapp_service/event_stream.js; os eventos saem por GatewayStub.publish().
+
+Uso:
+    python benchmarks/gateway_stub.py --port 3999 --latency 0.05 --jitter 0.02 --error-rate 0.01
+    python benchmarks/gateway_stub.py --group-size 2000 --participant-latency 0.001
+"""
+import argparse
+import json
+import queue
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTACTS = [
+    {
+        'id': {'server': 'c.us', 'user': f"55119{index:08d}", '_serialized': f"55119{index:08d}@c.us"},
+        'number': f"55119{index:08d}",
+        'name': f"Contato {index}",
+        'pushname': f"Contato {index}",
+        'isMyContact': True,
+        'isBlocked': False
+    }
+    for index in range(500)
+]
+
+CHATS = [
+    {
+        'id': {'server': 'c.us', 'user': f"55119{index:08d}", '_serialized': f"55119{index:08d}@c.us"},
+        'name': f"Contato {index}",
+        'isGroup': False,
+        'unreadCount': index % 5,
+        'timestamp': 1700000000 + index
+    }
+    for index in range(200)
+]
+
+GET_ROUTES = {
+    'health': lambda server, session_id: {'success': True, 'instances': len(server.sessions)},
+    'instances': lambda server, session_id: [
+        {'id': session_id, 'type': 'whatsapp-web.js', 'status': 'connected'}
+        for session_id in sorted(server.sessions)
+    ],
+    'status': lambda server, session_id: {'success': True, 'status': {'connected': True, 'info': None}},
+    'contacts': lambda server, session_id: {'success': True, 'contacts': CONTACTS},
+    'chats': lambda server, session_id: {'success': True, 'chats': CHATS},
+}
+
+POST_ROUTES = (
+    'init', 'logout', 'release', 'send-message', 'send-media', 'send-buttons', 'mention-all',
+    'block-contact', 'unblock-contact', 'set-webhook'
+)
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalhos e corpo saem em writes separados; sem isso o Nagle soma ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _simulate(self):
+        server = self.server
+        delay = server.latency + random.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        with server.lock:
+            server.calls += 1
+        if random.random() < server.error_rate:
+            self._send(500, {'success': False, 'error': 'Erro simulado pelo stub'})
+            return False
+        return True
+
+    # Consulta dos membros de um grupo, proporcional ao tamanho
+    def _group_members(self):
+        server = self.server
+        if server.participant_latency:
+            time.sleep(server.group_size * server.participant_latency)
+        return [f"55119{index:08d}@c.us" for index in range(server.group_size)]
+
+    # Fluxo de eventos: uma fila por conexão, com heartbeat como no serviço real
+    def _event_stream(self):
+        events = queue.Queue()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        with self.server.lock:
+            self.server.streams.add(events)
+            self.server.stream_connections += 1
+        try:
+            while True:
+                try:
+                    payload = events.get(timeout=self.server.heartbeat)
+                except queue.Empty:
+                    payload = b': ping\n\n'
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(payload), payload))
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            with self.server.lock:
+                self.server.streams.discard(events)
+
+    def do_GET(self):
+        if self.path.split('?')[0] == '/api/events/stream':
+            return self._event_stream()
+
+        group = re.fullmatch(r'/api/group-participants/([^/?]+)/([^/?]+)(?:\?.*)?', self.path)
+        if group:
+            if self._simulate():
+                self._send(200, {'success': True, 'subject': 'Grupo do stub', 'participants': self._group_members()})
+            return
+
+        match = re.fullmatch(r'/api/(health|instances|status|contacts|chats)(?:/([^/?]+))?(?:\?.*)?', self.path)
+        if not match:
+            return self._send(404, {'success': False, 'error': 'Rota não encontrada'})
+        if self._simulate():
+            self._send(200, GET_ROUTES[match.group(1)](self.server, match.group(2)))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        route = self.path.split('?')[0][len('/api/'):]
+        if route not in POST_ROUTES:
+            return self._send(404, {'success': False, 'error': 'Rota não encontrada'})
+        if not self._simulate():
+            return
+
+        if route == 'mention-all':
+            participants = body.get('participants')
+            if not isinstance(participants, list):
+                participants = self._group_members()
+            return self._send(200, {'success': True, 'mentioned': len(participants)})
+
+        session_id = body.get('sessionId')
+        with self.server.lock:
+            if route == 'init' and session_id:
+                self.server.sessions.add(session_id)
+            elif route in ('logout', 'release'):
+                self.server.sessions.discard(session_id)
+        self._send(200, {'success': True, 'result': {'id': {'_serialized': f"stub_{time.time_ns()}"}}})
+
+class GatewayStub(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, group_size=256, participant_latency=0.0):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.group_size = group_size
+        self.participant_latency = participant_latency
+        self.sessions = set()
+        self.calls = 0
+        self.streams = set()
+        self.stream_connections = 0
+        self.heartbeat = 15.0
+        self.lock = threading.Lock()
+
+    # Envia um evento a todas as conexões abertas em /api/events/stream
+    def publish(self, event, data):
+        payload = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+        with self.lock:
+            streams = list(self.streams)
+        for events in streams:
+            events.put(payload)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+# Inicia o stub numa thread e retorna o servidor (use .shutdown() ao final)
+def start_stub(host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, group_size=256, participant_latency=0.0):
+    server = GatewayStub((host, port), latency, jitter, error_rate, group_size, participant_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3999)
+    parser.add_argument('--latency', type=float, default=0.0, help='atraso por chamada, em segundos')
+    parser.add_argument('--jitter', type=float, default=0.0, help='variação aleatória do atraso, em segundos')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fração das chamadas que retornam 500')
+    parser.add_argument('--group-size', type=int, default=256, help='membros de cada grupo')
+    parser.add_argument('--participant-latency', type=float, default=0.0, help='custo da consulta por membro, em segundos')
+    args = parser.parse_args()
+
+    server = GatewayStub(
+        (args.host, args.port), args.latency, args.jitter, args.error_rate,
+        args.group_size, args.participant_latency
+    )
+    print(f"stub do serviço WhatsApp em {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import os
+
+# Configuração do gunicorn
+#
+#   gunicorn -c gunicorn.conf.py
+#   GUNICORN_APP=src.gevent_server:app GUNICORN_WORKER_CLASS=gevent gunicorn -c gunicorn.conf.py
+#
+# Com preload_app, o processo principal importa e monta o app uma única vez e
+# os workers nascem por fork, compartilhando essa memória (copy-on-write) sem
+# repetir a importação. Como o app não abre conexões nem threads ao ser
+# montado, nada do processo principal é herdado pelos workers; cada um inicia
+# as próprias tarefas em segundo plano em post_worker_init.
+
+wsgi_app = os.getenv('GUNICORN_APP', 'src.main:app')
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 2000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+def post_worker_init(worker):
+    from src.main import start_background_services
+    from src.models.user import db
+
+    app = worker.wsgi
+    with app.app_context():
+        # Conexões do pool nunca são compartilhadas entre processos
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    start_background_services(app)
+
+# Métricas do worker encerrado vão para o acumulado de METRICS_DIR (com
+# preload_app; sem ele, o próximo worker a iniciar faz a junção)
+def child_exit(server, worker):
+    from src.services.metrics import metrics
+
+    metrics.merge_dead_processes(worker.pid)
@@ -0,0 +1,42 @@
+import click
+from flask import current_app
+from src.models.user import db, User
+from src.models.migrations import run_migrations
+from src.services.gateway_nodes import gateway_nodes
+
+# Prepara o banco: cria as tabelas, aplica as migrações, cadastra
+# WHATSAPP_SERVICE_URL como nó padrão e cria o usuário admin se não existir.
+# Pode ser executado a cada deploy. Retorna (migrações aplicadas, admin criado).
+def init_database(app):
+    with app.app_context():
+        # Só o banco principal: o esquema chega às réplicas pela replicação
+        db.create_all(bind_key=None)
+        applied = run_migrations()
+        gateway_nodes.ensure_default()
+
+        admin = User.query.filter_by(email=app.config['ADMIN_EMAIL']).first()
+        if admin:
+            return applied, False
+
+        admin = User(
+            email=app.config['ADMIN_EMAIL'],
+            password=app.config['ADMIN_PASSWORD'],
+            name='Administrador',
+            is_admin=True
+        )
+        admin.confirm_email()  # Confirmar e-mail automaticamente
+        db.session.add(admin)
+        db.session.commit()
+        return applied, True
+
+def register_commands(app):
+    # flask --app src.main init-db
+    @app.cli.command('init-db')
+    def init_db_command():
+        applied, admin_created = init_database(current_app._get_current_object())
+
+        if applied:
+            click.echo(f"Migrações aplicadas: {', '.join(str(version) for version in applied)}")
+        if admin_created:
+            click.echo('Usuário admin criado com sucesso!')
+        click.echo('Banco de dados pronto.')
@@ -0,0 +1,32 @@
+from gevent import monkey
+monkey.patch_all()
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+from src.main import create_app, start_background_services
+
+# Modo assíncrono (gevent)
+#
+# As rotas do WhatsApp passam quase todo o tempo esperando o serviço Node.js.
+# Com o monkey patching do gevent, sockets, requests/urllib3, PyMySQL, locks e
+# sleeps passam a ceder a vez enquanto esperam, e cada requisição roda numa
+# greenlet em vez de numa thread: um único processo mantém milhares de
+# chamadas ao gateway em andamento. O código das rotas é o mesmo do modo
+# síncrono (src/main.py).
+#
+# Uso direto:  python src/gevent_server.py
+# Com gunicorn: GUNICORN_APP=src.gevent_server:app GUNICORN_WORKER_CLASS=gevent gunicorn -c gunicorn.conf.py
+
+app = create_app()
+
+if __name__ == '__main__':
+    port = int(os.getenv('PORT', 5000))
+    max_connections = int(os.getenv('ASYNC_MAX_CONNECTIONS', 2000))
+
+    start_background_services(app)
+    print(f"SIE API (gevent) na porta {port}, até {max_connections} conexões simultâneas")
+    WSGIServer(('0.0.0.0', port), app, spawn=Pool(max_connections), log=None).serve_forever()
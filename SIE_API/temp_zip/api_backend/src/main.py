@@ -2,73 +2,318 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, jsonify, render_template, send_from_directory
+from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_mail import Mail
-from src.models.user import db, User, WhatsAppInstance
+from werkzeug.middleware.proxy_fix import ProxyFix
+from src.models.user import db
 from src.routes.auth import auth_bp, mail
 from src.routes.whatsapp import whatsapp_bp
-import os
+from src.routes.events import events_bp
+from src.routes.campaigns import campaigns_bp
+from src.services.whatsapp_gateway import gateway
+from src.services.gateway_nodes import gateway_nodes
+from src.services.message_queue import message_queue
+from src.services.auth_cache import auth_cache
+from src.services.status_poller import status_poller
+from src.services.token_sweeper import token_sweeper
+from src.services.mail_outbox import mail_outbox
+from src.services.password_hasher import password_hasher
+from src.services.contact_cache import contact_cache
+from src.services.group_cache import group_cache
+from src.services.media_store import media_store
+from src.services.metrics import metrics
+from src.services.idempotency import idempotency
+from src.services.campaigns import campaign_runner
+from src.services.fast_json import fast_json
+from src.services.static_assets import static_assets
+from src.services.rate_limit import rate_limiter
+from src.services.db_routing import replica_router
+from src.services.live_events import live_events
+from src.cli import register_commands, init_database
+import tempfile
+
+# Configurações lidas das variáveis de ambiente
+def load_config(app):
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'sie_api_secret_key')
+    # DATABASE_URL (URL completa do SQLAlchemy) tem precedência sobre as variáveis DB_*
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL') or f"mysql+pymysql://{os.getenv('DB_USERNAME', 'root')}:{os.getenv('DB_PASSWORD', 'password')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '3306')}/{os.getenv('DB_NAME', 'mydb')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Réplicas de leitura (URLs do SQLAlchemy separadas por vírgula): as consultas das
+    # requisições GET vão para elas, exceto nos segundos seguintes a uma escrita do usuário
+    app.config['SQLALCHEMY_BINDS'] = {
+        f"replica_{index}": url.strip()
+        for index, url in enumerate(os.getenv('DATABASE_REPLICA_URL', '').split(','), 1)
+        if url.strip()
+    }
+    app.config['DATABASE_READ_YOUR_WRITES_WINDOW'] = float(os.getenv('DATABASE_READ_YOUR_WRITES_WINDOW', 5))
+    app.config['DATABASE_ROUTING_PATH'] = os.getenv('DATABASE_ROUTING_PATH', os.path.join(tempfile.gettempdir(), 'sie_api_db_routing.bin'))
+    # Segundos sem usar uma réplica depois de uma falha nela (dobra a cada nova falha)
+    app.config['DATABASE_REPLICA_RETRY_AFTER'] = float(os.getenv('DATABASE_REPLICA_RETRY_AFTER', 5))
+
+    # Configurações de e-mail
+    app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
+    app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'True') == 'True'
+    app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
+    app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
+    app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@sieapi.com')
+    app.config['MAIL_OUTBOX_INTERVAL'] = float(os.getenv('MAIL_OUTBOX_INTERVAL', 2))
+    app.config['MAIL_OUTBOX_BATCH_SIZE'] = int(os.getenv('MAIL_OUTBOX_BATCH_SIZE', 50))
+    app.config['MAIL_OUTBOX_MAX_ATTEMPTS'] = int(os.getenv('MAIL_OUTBOX_MAX_ATTEMPTS', 5))
+
+    # Configurações do serviço WhatsApp
+    app.config['WHATSAPP_SERVICE_URL'] = os.getenv('WHATSAPP_SERVICE_URL', 'http://localhost:3000/api')
+    app.config['WHATSAPP_POOL_SIZE'] = int(os.getenv('WHATSAPP_POOL_SIZE', 20))
+    app.config['WHATSAPP_CONNECT_TIMEOUT'] = float(os.getenv('WHATSAPP_CONNECT_TIMEOUT', 3.05))
+    app.config['WHATSAPP_READ_TIMEOUT'] = float(os.getenv('WHATSAPP_READ_TIMEOUT', 30))
+    app.config['WHATSAPP_MAX_RETRIES'] = int(os.getenv('WHATSAPP_MAX_RETRIES', 2))
+    app.config['WHATSAPP_RETRY_BACKOFF'] = float(os.getenv('WHATSAPP_RETRY_BACKOFF', 0.3))
+
+    # Disjuntor do serviço WhatsApp: abre com WHATSAPP_BREAKER_FAILURE_RATE de falhas
+    # em WHATSAPP_BREAKER_WINDOW segundos (mínimo de WHATSAPP_BREAKER_MIN_CALLS chamadas)
+    app.config['WHATSAPP_BREAKER_ENABLED'] = os.getenv('WHATSAPP_BREAKER_ENABLED', 'True') == 'True'
+    app.config['WHATSAPP_BREAKER_FAILURE_RATE'] = float(os.getenv('WHATSAPP_BREAKER_FAILURE_RATE', 0.5))
+    app.config['WHATSAPP_BREAKER_MIN_CALLS'] = int(os.getenv('WHATSAPP_BREAKER_MIN_CALLS', 5))
+    app.config['WHATSAPP_BREAKER_WINDOW'] = float(os.getenv('WHATSAPP_BREAKER_WINDOW', 30))
+    app.config['WHATSAPP_BREAKER_OPEN_TIMEOUT'] = float(os.getenv('WHATSAPP_BREAKER_OPEN_TIMEOUT', 5))
+    app.config['WHATSAPP_BREAKER_MAX_OPEN_TIMEOUT'] = float(os.getenv('WHATSAPP_BREAKER_MAX_OPEN_TIMEOUT', 60))
+    app.config['WHATSAPP_HEALTH_TIMEOUT'] = float(os.getenv('WHATSAPP_HEALTH_TIMEOUT', 2))
+
+    # Nós do serviço WhatsApp: distribuição das sessões novas ('hash' ou 'least_load'),
+    # validade das rotas em cache (segundos) e intervalo da migração de sessões (0 desativa)
+    app.config['GATEWAY_ASSIGNMENT'] = os.getenv('GATEWAY_ASSIGNMENT', 'hash')
+    app.config['GATEWAY_NODES_REFRESH_INTERVAL'] = float(os.getenv('GATEWAY_NODES_REFRESH_INTERVAL', 10))
+    app.config['GATEWAY_ROUTE_CACHE_TTL'] = float(os.getenv('GATEWAY_ROUTE_CACHE_TTL', 10))
+    app.config['GATEWAY_REBALANCE_INTERVAL'] = float(os.getenv('GATEWAY_REBALANCE_INTERVAL', 5))
+    app.config['GATEWAY_REBALANCE_BATCH_SIZE'] = int(os.getenv('GATEWAY_REBALANCE_BATCH_SIZE', 5))
+
+    # Configurações da fila de envio assíncrono
+    app.config['MESSAGE_QUEUE_WORKERS'] = int(os.getenv('MESSAGE_QUEUE_WORKERS', 2))
+    app.config['MESSAGE_QUEUE_RATE_PER_INSTANCE'] = float(os.getenv('MESSAGE_QUEUE_RATE_PER_INSTANCE', 1.0))
+    app.config['MESSAGE_QUEUE_BURST_PER_INSTANCE'] = int(os.getenv('MESSAGE_QUEUE_BURST_PER_INSTANCE', 1))
+    # Limite por instância compartilhado pelos workers do servidor
+    app.config['MESSAGE_QUEUE_THROTTLE_PATH'] = os.getenv('MESSAGE_QUEUE_THROTTLE_PATH', os.path.join(tempfile.gettempdir(), 'sie_api_queue_throttle.bin'))
+    app.config['MESSAGE_QUEUE_MAX_ATTEMPTS'] = int(os.getenv('MESSAGE_QUEUE_MAX_ATTEMPTS', 5))
+    app.config['MESSAGE_QUEUE_RETRY_BACKOFF'] = float(os.getenv('MESSAGE_QUEUE_RETRY_BACKOFF', 5.0))
+
+    # Campanhas: workers de envio (0 desativa neste processo), ritmo padrão por
+    # instância (envios/segundo) e atraso aleatório máximo entre envios (segundos)
+    app.config['CAMPAIGN_WORKERS'] = int(os.getenv('CAMPAIGN_WORKERS', 2))
+    app.config['CAMPAIGN_RATE_PER_INSTANCE'] = float(os.getenv('CAMPAIGN_RATE_PER_INSTANCE', 1.0))
+    app.config['CAMPAIGN_MAX_RATE_PER_INSTANCE'] = float(os.getenv('CAMPAIGN_MAX_RATE_PER_INSTANCE', 10.0))
+    app.config['CAMPAIGN_JITTER'] = float(os.getenv('CAMPAIGN_JITTER', 1.0))
+    app.config['CAMPAIGN_MAX_RECIPIENTS'] = int(os.getenv('CAMPAIGN_MAX_RECIPIENTS', 100000))
+    app.config['CAMPAIGN_MAX_ATTEMPTS'] = int(os.getenv('CAMPAIGN_MAX_ATTEMPTS', 3))
+    # Próximo envio livre de cada instância, compartilhado pelos workers do servidor
+    app.config['CAMPAIGN_PACING_PATH'] = os.getenv('CAMPAIGN_PACING_PATH', os.path.join(tempfile.gettempdir(), 'sie_api_campaign_pacing.bin'))
+
+    # Intervalo (segundos) da verificação de status das instâncias; 0 desativa
+    app.config['STATUS_POLL_INTERVAL'] = float(os.getenv('STATUS_POLL_INTERVAL', 15))
+    # Trava que escolhe o único worker do servidor que faz a verificação
+    app.config['STATUS_POLL_LOCK_PATH'] = os.getenv('STATUS_POLL_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'sie_api_status_poller.lock'))
+
+    # Limpeza de tokens de recuperação expirados (intervalo em segundos; 0 desativa)
+    app.config['TOKEN_SWEEP_INTERVAL'] = float(os.getenv('TOKEN_SWEEP_INTERVAL', 3600))
+    app.config['TOKEN_SWEEP_BATCH_SIZE'] = int(os.getenv('TOKEN_SWEEP_BATCH_SIZE', 1000))
+
+    # Paginação das listagens
+    app.config['LIST_DEFAULT_LIMIT'] = int(os.getenv('LIST_DEFAULT_LIMIT', 100))
+    app.config['LIST_MAX_LIMIT'] = int(os.getenv('LIST_MAX_LIMIT', 1000))
+
+    # Hash de senhas (método do werkzeug, ex.: scrypt, scrypt:65536:8:1, pbkdf2:sha256:600000)
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 4 * (os.cpu_count() or 1)))
+
+    # Cache de contatos e conversas (segundos)
+    app.config['CONTACTS_CACHE_TTL'] = float(os.getenv('CONTACTS_CACHE_TTL', 300))
+
+    # Cache de membros dos grupos para o mention-all (segundos / quantidade de grupos)
+    app.config['GROUP_CACHE_TTL'] = float(os.getenv('GROUP_CACHE_TTL', 600))
+    app.config['GROUP_CACHE_SIZE'] = int(os.getenv('GROUP_CACHE_SIZE', 1024))
+
+    # Armazenamento de mídias enviadas por upload (precisa ser acessível ao serviço WhatsApp)
+    app.config['MEDIA_STORE_PATH'] = os.getenv('MEDIA_STORE_PATH', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'media'))
+    app.config['MEDIA_MAX_SIZE'] = int(os.getenv('MEDIA_MAX_SIZE', 64 * 1024 * 1024))
+
+    # Eventos do serviço WhatsApp (POST /api/events); sem segredo, o recebimento fica desativado
+    app.config['EVENTS_SECRET'] = os.getenv('EVENTS_SECRET', '')
+    app.config['EVENTS_MAX_BATCH'] = int(os.getenv('EVENTS_MAX_BATCH', 1000))
+
+    # Eventos em tempo real para o painel (GET /api/whatsapp/events/stream, só no modo
+    # gevent): heartbeat e duração máxima de cada fluxo (segundos), painéis por
+    # processo e intervalo da contagem de mensagens (segundos)
+    app.config['LIVE_EVENTS_ENABLED'] = os.getenv('LIVE_EVENTS_ENABLED', 'True') == 'True'
+    app.config['LIVE_EVENTS_HEARTBEAT'] = float(os.getenv('LIVE_EVENTS_HEARTBEAT', 15))
+    app.config['LIVE_EVENTS_MAX_DURATION'] = float(os.getenv('LIVE_EVENTS_MAX_DURATION', 3600))
+    app.config['LIVE_EVENTS_MAX_SUBSCRIBERS'] = int(os.getenv('LIVE_EVENTS_MAX_SUBSCRIBERS', 1000))
+    app.config['LIVE_EVENTS_QUEUE_SIZE'] = int(os.getenv('LIVE_EVENTS_QUEUE_SIZE', 256))
+    app.config['LIVE_EVENTS_COUNT_INTERVAL'] = float(os.getenv('LIVE_EVENTS_COUNT_INTERVAL', 1))
+
+    # Idempotency-Key nos envios: validade das respostas guardadas (segundos), tamanho
+    # do cache em memória e espera máxima por uma requisição igual em andamento
+    app.config['IDEMPOTENCY_TTL'] = int(os.getenv('IDEMPOTENCY_TTL', 86400))
+    app.config['IDEMPOTENCY_CACHE_SIZE'] = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000))
+    app.config['IDEMPOTENCY_WAIT_TIMEOUT'] = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', 30))
+    app.config['IDEMPOTENCY_SWEEP_INTERVAL'] = float(os.getenv('IDEMPOTENCY_SWEEP_INTERVAL', 3600))
+
+    # Métricas (/api/metrics): diretório compartilhado pelos workers do gunicorn
+    app.config['METRICS_DIR'] = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'sie_api_metrics'))
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+
+    # Serialização JSON com orjson (quando instalado)
+    app.config['JSON_FAST'] = os.getenv('JSON_FAST', 'True') == 'True'
+
+    # Arquivos do painel: compressão prévia (gzip e, se instalado, brotli), tamanho
+    # mínimo para comprimir (bytes), validade dos endereços com hash (segundos) e
+    # recarga quando os arquivos mudam (sempre ligada com o app em debug)
+    app.config['STATIC_PRECOMPRESS'] = os.getenv('STATIC_PRECOMPRESS', 'True') == 'True'
+    app.config['STATIC_COMPRESS_MIN_SIZE'] = int(os.getenv('STATIC_COMPRESS_MIN_SIZE', 512))
+    app.config['STATIC_MAX_AGE'] = int(os.getenv('STATIC_MAX_AGE', 31536000))
+    app.config['STATIC_AUTO_RELOAD'] = os.getenv('STATIC_AUTO_RELOAD', 'False') == 'True'
+
+    # Limites de requisições ('10/minute', '5/hour', '30/10s'; vazio ou 0 desativa a regra),
+    # compartilhados pelos workers pela tabela em RATE_LIMIT_PATH
+    app.config['RATE_LIMIT_ENABLED'] = os.getenv('RATE_LIMIT_ENABLED', 'True') == 'True'
+    app.config['RATE_LIMIT_PATH'] = os.getenv('RATE_LIMIT_PATH', os.path.join(tempfile.gettempdir(), 'sie_api_rate_limit.bin'))
+    app.config['RATE_LIMIT_SLOTS'] = int(os.getenv('RATE_LIMIT_SLOTS', 65536))
+    app.config['RATE_LIMIT_LOGIN'] = os.getenv('RATE_LIMIT_LOGIN', '10/minute')
+    app.config['RATE_LIMIT_LOGIN_ACCOUNT'] = os.getenv('RATE_LIMIT_LOGIN_ACCOUNT', '5/minute')
+    app.config['RATE_LIMIT_REGISTER'] = os.getenv('RATE_LIMIT_REGISTER', '5/hour')
+    app.config['RATE_LIMIT_FORGOT_PASSWORD'] = os.getenv('RATE_LIMIT_FORGOT_PASSWORD', '5/hour')
+    app.config['RATE_LIMIT_SEND'] = os.getenv('RATE_LIMIT_SEND', '300/minute')
+    app.config['RATE_LIMIT_SEND_INSTANCE'] = os.getenv('RATE_LIMIT_SEND_INSTANCE', '60/minute')
+
+    # Proxies reversos à frente da API (o Nginx conta 1); o IP do cliente vem do
+    # X-Forwarded-For. Use 0 se a porta da API estiver exposta diretamente.
+    app.config['TRUSTED_PROXIES'] = int(os.getenv('TRUSTED_PROXIES', 1))
+
+    # Configurações do cache de autenticação
+    app.config['AUTH_CACHE_SIZE'] = int(os.getenv('AUTH_CACHE_SIZE', 4096))
+    app.config['AUTH_CACHE_TTL'] = float(os.getenv('AUTH_CACHE_TTL', 30))
+    # Instantes das alterações de usuários, compartilhados pelos workers
+    app.config['AUTH_CACHE_STAMPS_PATH'] = os.getenv('AUTH_CACHE_STAMPS_PATH', os.path.join(tempfile.gettempdir(), 'sie_api_auth_stamps.bin'))
+    app.config['AUTH_CACHE_STAMPS_SLOTS'] = int(os.getenv('AUTH_CACHE_STAMPS_SLOTS', 8192))
+
+    # Usuário admin criado pelo comando init-db
+    app.config['ADMIN_EMAIL'] = os.getenv('ADMIN_EMAIL', 'admin@sieapi.com')
+    app.config['ADMIN_PASSWORD'] = os.getenv('ADMIN_PASSWORD', 'admin123')
+
+# Fábrica da aplicação
+#
+# Só monta o app: não consulta o banco nem inicia tarefas em segundo plano, o
+# que deixa a importação e o boot dos workers rápidos mesmo com o MySQL lento.
+# O esquema e o usuário admin ficam no comando `flask --app src.main init-db`;
+# as tarefas em segundo plano sobem em cada processo com
+# start_background_services() (no gunicorn, pelo gunicorn.conf.py após o fork).
+# `config` sobrescreve as variáveis de ambiente.
+def create_app(config=None):
+    app = Flask(__name__)
+    CORS(app)
+    load_config(app)
+    if config:
+        app.config.update(config)
+
+    if app.config.get('TRUSTED_PROXIES'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+
+    # Inicializar extensões
+    fast_json.init_app(app)
+    db.init_app(app)
+    replica_router.init_app(app)
+    password_hasher.init_app(app)
+    mail.init_app(app)
+    gateway.init_app(app)
+    gateway_nodes.init_app(app)
+    message_queue.init_app(app)
+    auth_cache.init_app(app)
+    status_poller.init_app(app)
+    token_sweeper.init_app(app)
+    mail_outbox.init_app(app)
+    contact_cache.init_app(app)
+    group_cache.init_app(app)
+    media_store.init_app(app)
+    metrics.init_app(app)
+    idempotency.init_app(app)
+    campaign_runner.init_app(app)
+    rate_limiter.init_app(app)
+    live_events.init_app(app)
+
+    # Registrar blueprints
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(whatsapp_bp, url_prefix='/api/whatsapp')
+    app.register_blueprint(events_bp, url_prefix='/api/events')
+    app.register_blueprint(campaigns_bp, url_prefix='/api/campaigns')
+    register_commands(app)
+
+    # Arquivos estáticos do painel (manifesto montado em memória aqui)
+    static_assets.init_app(app)
+
+    # Rota para verificar status da API
+    @app.route('/api/status')
+    def status():
+        return jsonify({
+            'status': 'online',
+            'name': 'SIE API',
+            'version': '1.0.0'
+        })
+
+    # Criar os engines não abre conexões com o banco
+    with app.app_context():
+        for engine in db.engines.values():
+            metrics.instrument_engine(engine)
+
+    return app
+
+# Inicia as tarefas em segundo plano no processo atual. Chame depois do fork:
+# threads e o pool de hash de senhas não sobrevivem a ele.
+def start_background_services(app):
+    # Juntar as métricas de processos encerrados (antes da primeira gravação deste)
+    metrics.merge_dead_processes()
+
+    # Criar o pool de hash de senhas antes das threads em segundo plano
+    password_hasher.warm_up()
+
+    # Iniciar workers da fila de envio
+    if app.config['MESSAGE_QUEUE_WORKERS'] > 0:
+        message_queue.start()
+
+    # Iniciar envio das campanhas
+    if app.config['CAMPAIGN_WORKERS'] > 0:
+        campaign_runner.start()
+
+    # Iniciar verificação periódica de status das instâncias
+    if app.config['STATUS_POLL_INTERVAL'] > 0:
+        status_poller.start()
+
+    # Iniciar envio dos e-mails da caixa de saída
+    if app.config['MAIL_OUTBOX_INTERVAL'] > 0:
+        mail_outbox.start()
+
+    # Iniciar limpeza periódica de tokens expirados
+    if app.config['TOKEN_SWEEP_INTERVAL'] > 0:
+        token_sweeper.start()
+
+    # Iniciar migração das sessões entre nós do serviço WhatsApp
+    if app.config['GATEWAY_REBALANCE_INTERVAL'] > 0:
+        gateway_nodes.start()
+
+    # Iniciar limpeza periódica das chaves de idempotência expiradas
+    if app.config['IDEMPOTENCY_SWEEP_INTERVAL'] > 0:
+        idempotency.start()
 
-app = Flask(__name__)
-CORS(app)
-
-# Configurações
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'sie_api_secret_key')
-app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql+pymysql://{os.getenv('DB_USERNAME', 'root')}:{os.getenv('DB_PASSWORD', 'password')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '3306')}/{os.getenv('DB_NAME', 'mydb')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Configurações de e-mail
-app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
-app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
-app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'True') == 'True'
-app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
-app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
-app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@sieapi.com')
-
-# Inicializar extensões
-db.init_app(app)
-mail.init_app(app)
-
-# Registrar blueprints
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(whatsapp_bp, url_prefix='/api/whatsapp')
-
-# Rota para servir arquivos estáticos
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, 'index.html')
-
-# Rota para verificar status da API
-@app.route('/api/status')
-def status():
-    return jsonify({
-        'status': 'online',
-        'name': 'SIE API',
-        'version': '1.0.0'
-    })
-
-# Criar tabelas do banco de dados
-with app.app_context():
-    db.create_all()
-    
-    # Criar usuário admin se não existir
-    admin = User.query.filter_by(email='admin@sieapi.com').first()
-    if not admin:
-        admin = User(
-            email='admin@sieapi.com',
-            password='admin123',
-            name='Administrador',
-            is_admin=True
-        )
-        admin.confirm_email()  # Confirmar e-mail automaticamente
-        db.session.add(admin)
-        db.session.commit()
-        print('Usuário admin criado com sucesso!')
+# `src.main:app` (gunicorn, flask --app src.main) cria o app só quando é pedido
+def __getattr__(name):
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
+    # Servidor de desenvolvimento: prepara o banco e sobe tudo no mesmo processo
+    app = create_app()
+    init_database(app)
+    start_background_services(app)
     app.run(host='0.0.0.0', port=5000, debug=True)
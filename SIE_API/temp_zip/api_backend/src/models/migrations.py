@@ -0,0 +1,90 @@
+import datetime
+from sqlalchemy import inspect, text
+from src.models.user import db, User, WhatsAppInstance, MessageLogKey
+
+# Migrações de esquema para bancos já existentes
+#
+# db.create_all() só cria tabelas novas; colunas e índices adicionados a
+# tabelas existentes são aplicados aqui. Cada migração roda uma única vez
+# (registrada em schema_migrations) e verifica o estado atual antes de
+# alterar, para funcionar também em bancos recém-criados pelo create_all().
+
+def _has_column(connection, table, column):
+    return column in {c['name'] for c in inspect(connection).get_columns(table)}
+
+def _create_indexes(connection, table, columns):
+    for index in table.indexes:
+        if [column.name for column in index.columns] in columns:
+            index.create(connection, checkfirst=True)
+
+def add_status_checked_at(connection):
+    if not _has_column(connection, 'whatsapp_instances', 'status_checked_at'):
+        connection.execute(text('ALTER TABLE whatsapp_instances ADD COLUMN status_checked_at DATETIME NULL'))
+
+def add_lookup_indexes(connection):
+    _create_indexes(connection, User.__table__, [
+        ['confirmation_token'],
+        ['reset_password_token'],
+        ['reset_token_expires_at']
+    ])
+    _create_indexes(connection, WhatsAppInstance.__table__, [['user_id']])
+
+def add_gateway_node_columns(connection):
+    for column in ('gateway_node_id', 'pending_gateway_node_id'):
+        if not _has_column(connection, 'whatsapp_instances', column):
+            connection.execute(text(f'ALTER TABLE whatsapp_instances ADD COLUMN {column} INTEGER NULL'))
+    _create_indexes(connection, WhatsAppInstance.__table__, [['gateway_node_id'], ['pending_gateway_node_id']])
+
+def add_gateway_node_status_checked_at(connection):
+    if not _has_column(connection, 'gateway_nodes', 'status_checked_at'):
+        connection.execute(text('ALTER TABLE gateway_nodes ADD COLUMN status_checked_at DATETIME NULL'))
+
+# Chaves das mensagens já gravadas (antes a repetição era descartada pelo id)
+def add_message_log_keys(connection):
+    MessageLogKey.__table__.create(connection, checkfirst=True)
+    connection.execute(text(
+        'INSERT INTO message_log_keys (instance_id, message_id, log_id) '
+        'SELECT instance_id, message_id, MIN(id) FROM message_logs '
+        'WHERE NOT EXISTS (SELECT 1 FROM message_log_keys k '
+        'WHERE k.instance_id = message_logs.instance_id AND k.message_id = message_logs.message_id) '
+        'GROUP BY instance_id, message_id'
+    ))
+
+# (versão, descrição, função) em ordem de aplicação
+MIGRATIONS = [
+    (1, 'Coluna whatsapp_instances.status_checked_at', add_status_checked_at),
+    (2, 'Índices de tokens de usuário e whatsapp_instances.user_id', add_lookup_indexes),
+    (3, 'Colunas whatsapp_instances.gateway_node_id e pending_gateway_node_id', add_gateway_node_columns),
+    (4, 'Coluna gateway_nodes.status_checked_at', add_gateway_node_status_checked_at),
+    (5, 'Tabela message_log_keys (mensagens já gravadas no histórico)', add_message_log_keys),
+]
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('description', db.String(255), nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False)
+)
+
+def run_migrations():
+    applied = []
+    with db.engine.begin() as connection:
+        schema_migrations.create(connection, checkfirst=True)
+
+    for version, description, migration in MIGRATIONS:
+        with db.engine.begin() as connection:
+            done = connection.execute(
+                db.select(schema_migrations.c.version).where(schema_migrations.c.version == version)
+            ).first()
+            if done:
+                continue
+
+            migration(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.datetime.utcnow()
+            ))
+            applied.append(version)
+
+    return applied
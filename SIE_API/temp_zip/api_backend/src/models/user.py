@@ -1,13 +1,20 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from src.services.password_hasher import password_hasher
+from src.services.db_routing import RoutingSession
 import datetime
+import hashlib
+import json
 import uuid
 
-db = SQLAlchemy()
+# Consultas de leitura podem ir para as réplicas (ver db_routing)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
     
+    # Campos expostos pela API (chaves de to_dict)
+    PUBLIC_FIELDS = ('id', 'email', 'name', 'is_admin', 'is_active', 'email_confirmed', 'created_at', 'updated_at')
+    
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
@@ -15,9 +22,9 @@ class User(db.Model):
     is_admin = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=False)
     email_confirmed = db.Column(db.Boolean, default=False)
-    confirmation_token = db.Column(db.String(100), nullable=True)
-    reset_password_token = db.Column(db.String(100), nullable=True)
-    reset_token_expires_at = db.Column(db.DateTime, nullable=True)
+    confirmation_token = db.Column(db.String(100), nullable=True, index=True)
+    reset_password_token = db.Column(db.String(100), nullable=True, index=True)
+    reset_token_expires_at = db.Column(db.DateTime, nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     
@@ -26,16 +33,20 @@ class User(db.Model):
     
     def __init__(self, email, password, name, is_admin=False):
         self.email = email
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
         self.name = name
         self.is_admin = is_admin
         self.confirmation_token = str(uuid.uuid4())
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
+    
+    # Verdadeiro quando o hash usa método/custo diferente do configurado
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
     
     def generate_reset_token(self):
         self.reset_password_token = str(uuid.uuid4())
@@ -62,21 +73,34 @@ class User(db.Model):
 class WhatsAppInstance(db.Model):
     __tablename__ = 'whatsapp_instances'
     
+    # Campos expostos pela API (chaves de to_dict)
+    PUBLIC_FIELDS = (
+        'id', 'name', 'session_id', 'phone_number', 'instance_type', 'is_connected', 'status_checked_at',
+        'is_active', 'webhook_url', 'ignore_groups', 'block_calls', 'prevent_message_deletion', 'user_id',
+        'gateway_node_id', 'created_at', 'updated_at'
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     session_id = db.Column(db.String(100), unique=True, nullable=False)
     phone_number = db.Column(db.String(20), nullable=True)
     instance_type = db.Column(db.String(20), default='whatsapp-web.js')  # 'whatsapp-web.js' ou 'baileys'
     is_connected = db.Column(db.Boolean, default=False)
+    status_checked_at = db.Column(db.DateTime, nullable=True)  # Última verificação do status no serviço WhatsApp
     is_active = db.Column(db.Boolean, default=True)
     webhook_url = db.Column(db.String(255), nullable=True)
     ignore_groups = db.Column(db.Boolean, default=False)
     block_calls = db.Column(db.Boolean, default=False)
     prevent_message_deletion = db.Column(db.Boolean, default=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    gateway_node_id = db.Column(db.Integer, nullable=True, index=True)  # Nó do serviço WhatsApp que mantém a sessão
+    pending_gateway_node_id = db.Column(db.Integer, nullable=True, index=True)  # Destino de uma migração pendente
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     
+    # Fila de envios assíncronos da instância
+    message_jobs = db.relationship('MessageJob', backref='instance', lazy=True, cascade='all, delete-orphan')
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -85,12 +109,288 @@ class WhatsAppInstance(db.Model):
             'phone_number': self.phone_number,
             'instance_type': self.instance_type,
             'is_connected': self.is_connected,
+            'status_checked_at': self.status_checked_at.isoformat() if self.status_checked_at else None,
             'is_active': self.is_active,
             'webhook_url': self.webhook_url,
             'ignore_groups': self.ignore_groups,
             'block_calls': self.block_calls,
             'prevent_message_deletion': self.prevent_message_deletion,
             'user_id': self.user_id,
+            'gateway_node_id': self.gateway_node_id,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+
+# Nós do serviço WhatsApp (Node.js) entre os quais as sessões são distribuídas
+#
+# 'active' recebe sessões novas; 'draining' continua atendendo as que já tem,
+# que são migradas para outros nós pelo gateway_nodes.
+class GatewayNode(db.Model):
+    __tablename__ = 'gateway_nodes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    url = db.Column(db.String(255), unique=True, nullable=False)  # Base da API, ex.: http://10.0.0.5:3000/api
+    status = db.Column(db.String(20), default='active')  # 'active' ou 'draining'
+    weight = db.Column(db.Integer, default=1)  # Peso relativo na distribuição das sessões
+    max_sessions = db.Column(db.Integer, nullable=True)  # Limite de sessões no nó (vazio = sem limite)
+    status_checked_at = db.Column(db.DateTime, nullable=True)  # Última verificação do status das instâncias do nó
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'url': self.url,
+            'status': self.status,
+            'weight': self.weight,
+            'max_sessions': self.max_sessions,
+            'status_checked_at': self.status_checked_at.isoformat() if self.status_checked_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class MessageJob(db.Model):
+    __tablename__ = 'message_jobs'
+    __table_args__ = (
+        db.Index('ix_message_jobs_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    instance_id = db.Column(db.Integer, db.ForeignKey('whatsapp_instances.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    job_type = db.Column(db.String(20), nullable=False)  # 'message' ou 'media'
+    payload = db.Column(db.Text, nullable=False)  # JSON com os dados do envio
+    status = db.Column(db.String(20), default='pending')  # 'pending', 'processing', 'sent' ou 'dead'
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=5)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'instance_id': self.instance_id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    # Campos expostos pela API (chaves de to_dict)
+    PUBLIC_FIELDS = (
+        'id', 'recipient', 'subject', 'status', 'attempts', 'max_attempts', 'next_attempt_at',
+        'last_error', 'created_at', 'updated_at', 'sent_at'
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='pending')  # 'pending', 'sending', 'sent' ou 'failed'
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=5)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'recipient': self.recipient,
+            'subject': self.subject,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+# Campanhas: a mesma mensagem (template com variáveis) para uma lista de
+# destinatários, enviada em segundo plano pelo campaign_runner
+class Campaign(db.Model):
+    __tablename__ = 'campaigns'
+    __table_args__ = (
+        db.Index('ix_campaigns_status_scheduled_at', 'status', 'scheduled_at'),
+    )
+    
+    # Campos das listagens (to_dict inclui também instance_ids e pending)
+    PUBLIC_FIELDS = (
+        'id', 'name', 'message', 'media_url', 'media_type', 'status', 'rate_per_instance', 'jitter',
+        'scheduled_at', 'started_at', 'completed_at', 'total_recipients', 'sent_count', 'failed_count',
+        'skipped_count', 'last_error', 'user_id', 'created_at', 'updated_at'
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    message = db.Column(db.Text, nullable=False)  # Template: "Olá {{nome}}"; legenda quando há mídia
+    media_url = db.Column(db.String(500), nullable=True)
+    media_type = db.Column(db.String(20), nullable=True)
+    instance_ids = db.Column(db.Text, nullable=False)  # JSON: instâncias que dividem os envios
+    status = db.Column(db.String(20), default='draft')  # 'draft', 'scheduled', 'running', 'paused', 'completed' ou 'cancelled'
+    rate_per_instance = db.Column(db.Float, nullable=False)  # Envios por segundo em cada instância
+    jitter = db.Column(db.Float, default=0.0)  # Atraso aleatório extra entre envios (segundos)
+    scheduled_at = db.Column(db.DateTime, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    total_recipients = db.Column(db.Integer, default=0)
+    sent_count = db.Column(db.Integer, default=0)
+    failed_count = db.Column(db.Integer, default=0)
+    skipped_count = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    def instance_id_list(self):
+        return json.loads(self.instance_ids) if self.instance_ids else []
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'message': self.message,
+            'media_url': self.media_url,
+            'media_type': self.media_type,
+            'instance_ids': self.instance_id_list(),
+            'status': self.status,
+            'rate_per_instance': self.rate_per_instance,
+            'jitter': self.jitter,
+            'scheduled_at': self.scheduled_at.isoformat() if self.scheduled_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'total_recipients': self.total_recipients,
+            'sent_count': self.sent_count,
+            'failed_count': self.failed_count,
+            'skipped_count': self.skipped_count,
+            'pending': (self.total_recipients or 0) - (self.sent_count or 0) - (self.failed_count or 0) - (self.skipped_count or 0),
+            'last_error': self.last_error,
+            'user_id': self.user_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class CampaignRecipient(db.Model):
+    __tablename__ = 'campaign_recipients'
+    __table_args__ = (
+        db.Index('ix_campaign_recipients_campaign_status', 'campaign_id', 'status', 'id'),
+        db.Index('ix_campaign_recipients_status_locked_at', 'status', 'locked_at'),
+    )
+    
+    # Campos expostos pela API
+    PUBLIC_FIELDS = (
+        'id', 'campaign_id', 'phone', 'status', 'instance_id', 'attempts',
+        'last_error', 'sent_at'
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.id'), nullable=False)
+    phone = db.Column(db.String(64), nullable=False)
+    variables = db.Column(db.Text, nullable=True)  # JSON com as variáveis do template
+    status = db.Column(db.String(20), default='pending')  # 'pending', 'sending', 'sent', 'failed' ou 'skipped'
+    instance_id = db.Column(db.Integer, nullable=True)  # Instância que fez o envio
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+# Respostas de envios feitos com o cabeçalho Idempotency-Key
+#
+# Sem chave estrangeira para users: as linhas expiram (expires_at) e são
+# removidas pela limpeza periódica do serviço de idempotência.
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uq_idempotency_keys_user_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    idempotency_key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)  # SHA-256 do método, rota e corpo
+    status = db.Column(db.String(20), default='processing')  # 'processing' ou 'completed'
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    response_mimetype = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# IDs do histórico de mensagens: segundos desde MESSAGE_LOG_EPOCH (horário da
+# mensagem) nos 31 bits altos e 32 bits de um hash (instância, id da mensagem no
+# WhatsApp) nos baixos. Ordenar por id é ordenar por horário, o que permite
+# paginação por cursor e particionamento do MySQL por faixa de id (tempo). O
+# hash pode colidir: quem grava confere os ids já usados e passa para o
+# seguinte (ver routes/events.py). Os ids passam de 2^53, por isso a API os
+# devolve como texto.
+MESSAGE_LOG_EPOCH = datetime.datetime(2020, 1, 1)
+
+def message_log_id_at(timestamp):
+    return max(0, int((timestamp - MESSAGE_LOG_EPOCH).total_seconds())) << 32
+
+def message_log_id(timestamp, instance_id, message_id):
+    digest = hashlib.blake2b(f"{instance_id}:{message_id}".encode('utf-8'), digest_size=4).digest()
+    return message_log_id_at(timestamp) | int.from_bytes(digest, 'big')
+
+class MessageLog(db.Model):
+    __tablename__ = 'message_logs'
+    __table_args__ = (
+        db.Index('ix_message_logs_instance_id', 'instance_id', 'id'),
+        db.Index('ix_message_logs_instance_chat', 'instance_id', 'chat_id', 'id'),
+        db.Index('ix_message_logs_instance_sender', 'instance_id', 'sender', 'id'),
+    )
+    
+    # Campos expostos pela API
+    PUBLIC_FIELDS = (
+        'id', 'instance_id', 'message_id', 'chat_id', 'sender', 'from_me', 'is_group',
+        'message_type', 'body', 'has_media', 'timestamp', 'received_at'
+    )
+    
+    # Sem chave estrangeira: tabelas particionadas do MySQL não as suportam
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    instance_id = db.Column(db.Integer, nullable=False)
+    message_id = db.Column(db.String(128), nullable=False)
+    chat_id = db.Column(db.String(128), nullable=False)
+    sender = db.Column(db.String(128), nullable=True)
+    from_me = db.Column(db.Boolean, default=False)
+    is_group = db.Column(db.Boolean, default=False)
+    message_type = db.Column(db.String(32), nullable=True)
+    body = db.Column(db.Text, nullable=True)
+    has_media = db.Column(db.Boolean, default=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+# Mensagens já gravadas no histórico, por (instância, id no WhatsApp)
+#
+# É a chave única que descarta eventos reenviados. Fica fora de message_logs
+# porque, numa tabela particionada do MySQL, toda chave única precisa incluir
+# a coluna de particionamento (id).
+class MessageLogKey(db.Model):
+    __tablename__ = 'message_log_keys'
+
+    instance_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    message_id = db.Column(db.String(128), primary_key=True)
+    log_id = db.Column(db.BigInteger, nullable=False)  # id da linha em message_logs
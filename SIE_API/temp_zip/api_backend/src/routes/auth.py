@@ -1,16 +1,22 @@
-from flask import Blueprint, request, jsonify, current_app
-from src.models.user import db, User
+from flask import Blueprint, request, jsonify, current_app, g
+from src.models.user import db, User, EmailOutbox
+from src.services.auth_cache import auth_cache
+from src.services.rate_limit import rate_limit
+from src.services.db_routing import use_primary
+from src.services.listing import ListingError, parse_bool, prefix_filter, stream_listing
 import jwt
 import datetime
+import time
 import uuid
 from functools import wraps
 import os
-from flask_mail import Mail, Message
+from src.services.mail_outbox import mail, mail_outbox
 
 auth_bp = Blueprint('auth', __name__)
-mail = Mail()
 
 # Decorator para verificar token JWT
+# O token decodificado e os dados do usuário ficam em cache (auth_cache),
+# evitando uma consulta ao banco a cada requisição autenticada.
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -25,11 +31,23 @@ def token_required(f):
             return jsonify({'message': 'Token não fornecido!'}), 401
         
         try:
-            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = User.query.filter_by(id=data['user_id']).first()
+            data = auth_cache.get_token(token)
+            if data is None:
+                data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+                auth_cache.set_token(token, data)
             
-            if not current_user:
-                return jsonify({'message': 'Usuário não encontrado!'}), 401
+            # Usado pelo db_routing para a janela de leitura após escrita
+            g.current_user_id = data['user_id']
+            
+            current_user = auth_cache.get_user(data['user_id'])
+            if current_user is None:
+                loaded_at = time.time()
+                user = User.query.filter_by(id=data['user_id']).first()
+                
+                if not user:
+                    return jsonify({'message': 'Usuário não encontrado!'}), 401
+                
+                current_user = auth_cache.set_user(user, loaded_at)
                 
             if not current_user.is_active:
                 return jsonify({'message': 'Conta desativada!'}), 401
@@ -53,18 +71,26 @@ def admin_required(f):
     
     return decorated
 
+# Decorator para rotas abertas pelo EventSource do navegador, que não envia
+# cabeçalhos: o token pode vir em ?token= (use antes de @token_required)
+def token_from_query(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if 'Authorization' not in request.headers and request.args.get('token'):
+            request.environ['HTTP_AUTHORIZATION'] = f"Bearer {request.args['token']}"
+        return f(*args, **kwargs)
+    
+    return decorated
+
 # Função para enviar e-mail
+# O e-mail entra na caixa de saída junto com a transação atual e é enviado
+# em segundo plano pelo mail_outbox
 def send_email(to, subject, template):
-    msg = Message(
-        subject,
-        recipients=[to],
-        html=template,
-        sender=current_app.config['MAIL_DEFAULT_SENDER']
-    )
-    mail.send(msg)
+    return mail_outbox.enqueue(to, subject, template)
 
 # Rota de registro
 @auth_bp.route('/register', methods=['POST'])
+@rate_limit('register', by='ip')
 def register():
     data = request.get_json()
     
@@ -83,7 +109,6 @@ def register():
     )
     
     db.session.add(new_user)
-    db.session.commit()
     
     # Enviar e-mail de confirmação
     confirmation_link = f"{request.host_url}api/auth/confirm/{new_user.confirmation_token}"
@@ -96,14 +121,14 @@ def register():
     <p>Atenciosamente,<br>Equipe SIE API</p>
     """
     
-    try:
-        send_email(new_user.email, "Confirme seu cadastro na SIE API", template)
-        return jsonify({'message': 'Usuário cadastrado com sucesso! Verifique seu e-mail para confirmar o cadastro.'}), 201
-    except Exception as e:
-        return jsonify({'message': f'Usuário cadastrado, mas houve um erro ao enviar o e-mail: {str(e)}'}), 201
+    send_email(new_user.email, "Confirme seu cadastro na SIE API", template)
+    db.session.commit()
+    
+    return jsonify({'message': 'Usuário cadastrado com sucesso! Verifique seu e-mail para confirmar o cadastro.'}), 201
 
 # Rota de confirmação de e-mail
 @auth_bp.route('/confirm/<token>', methods=['GET'])
+@use_primary
 def confirm_email(token):
     user = User.query.filter_by(confirmation_token=token).first()
     
@@ -112,12 +137,15 @@ def confirm_email(token):
     
     user.confirm_email()
     db.session.commit()
+    auth_cache.invalidate_user(user.id)
     
     # Redirecionar para a página de login
     return jsonify({'message': 'E-mail confirmado com sucesso! Você já pode fazer login.'}), 200
 
 # Rota de login
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit('login', by='ip')
+@rate_limit('login_account', by='email')
 def login():
     data = request.get_json()
     
@@ -138,6 +166,11 @@ def login():
     if not user.is_active:
         return jsonify({'message': 'Conta desativada!'}), 401
     
+    # Atualizar o hash se a configuração de hash mudou desde o cadastro
+    if user.password_needs_rehash():
+        user.set_password(data['password'])
+        db.session.commit()
+    
     # Gerar token JWT
     token = jwt.encode({
         'user_id': user.id,
@@ -153,6 +186,7 @@ def login():
 
 # Rota para solicitar recuperação de senha
 @auth_bp.route('/forgot-password', methods=['POST'])
+@rate_limit('forgot_password', by='ip')
 def forgot_password():
     data = request.get_json()
     
@@ -167,7 +201,6 @@ def forgot_password():
     
     # Gerar token de recuperação
     reset_token = user.generate_reset_token()
-    db.session.commit()
     
     # Enviar e-mail de recuperação
     reset_link = f"{request.host_url}api/auth/reset-password/{reset_token}"
@@ -181,10 +214,8 @@ def forgot_password():
     <p>Atenciosamente,<br>Equipe SIE API</p>
     """
     
-    try:
-        send_email(user.email, "Recuperação de Senha - SIE API", template)
-    except Exception as e:
-        return jsonify({'message': f'Erro ao enviar e-mail: {str(e)}'}), 500
+    send_email(user.email, "Recuperação de Senha - SIE API", template)
+    db.session.commit()
     
     return jsonify({'message': 'Se o e-mail estiver cadastrado, você receberá um link para redefinir sua senha.'}), 200
 
@@ -208,6 +239,7 @@ def reset_password(token):
     user.reset_password_token = None
     user.reset_token_expires_at = None
     db.session.commit()
+    auth_cache.invalidate_user(user.id)
     
     return jsonify({'message': 'Senha redefinida com sucesso!'}), 200
 
@@ -222,16 +254,18 @@ def get_me(current_user):
 @token_required
 def update_profile(current_user):
     data = request.get_json()
+    user = User.query.get(current_user.id)
     
     if data.get('name'):
-        current_user.name = data['name']
+        user.name = data['name']
     
     if data.get('password'):
-        current_user.set_password(data['password'])
+        user.set_password(data['password'])
     
     db.session.commit()
+    auth_cache.invalidate_user(user.id)
     
-    return jsonify({'message': 'Perfil atualizado com sucesso!', 'user': current_user.to_dict()}), 200
+    return jsonify({'message': 'Perfil atualizado com sucesso!', 'user': user.to_dict()}), 200
 
 # Rotas administrativas
 
@@ -240,8 +274,21 @@ def update_profile(current_user):
 @token_required
 @admin_required
 def get_all_users(current_user):
-    users = User.query.all()
-    return jsonify({'users': [user.to_dict() for user in users]}), 200
+    # Paginação: ?limit=100&after=<next_cursor>; filtros: ?is_active=true&name=prefixo;
+    # campos: ?fields=id,email,name
+    try:
+        conditions = []
+        
+        is_active = parse_bool(request.args.get('is_active'))
+        if is_active is not None:
+            conditions.append(User.is_active == is_active)
+        
+        if request.args.get('name'):
+            conditions.append(prefix_filter(User.name, request.args['name']))
+        
+        return stream_listing('users', User, User.PUBLIC_FIELDS, conditions)
+    except ListingError as e:
+        return jsonify({'message': str(e)}), 400
 
 # Criar usuário (apenas admin)
 @auth_bp.route('/users', methods=['POST'])
@@ -305,6 +352,7 @@ def update_user(current_user, user_id):
         user.is_active = data['is_active']
     
     db.session.commit()
+    auth_cache.invalidate_user(user.id)
     
     return jsonify({'message': 'Usuário atualizado com sucesso!', 'user': user.to_dict()}), 200
 
@@ -324,5 +372,44 @@ def delete_user(current_user, user_id):
     
     db.session.delete(user)
     db.session.commit()
+    auth_cache.invalidate_user(user_id)
     
     return jsonify({'message': 'Usuário excluído com sucesso!'}), 200
+
+# Estatísticas do cache de autenticação (apenas admin)
+@auth_bp.route('/cache-stats', methods=['GET'])
+@token_required
+@admin_required
+def get_cache_stats(current_user):
+    return jsonify({'auth_cache': auth_cache.stats()}), 200
+
+# Listar e-mails da caixa de saída (apenas admin)
+@auth_bp.route('/outbox', methods=['GET'])
+@token_required
+@admin_required
+def get_outbox(current_user):
+    # Filtros: ?status=pending|sending|sent|failed&recipient=prefixo
+    try:
+        conditions = []
+        
+        if request.args.get('status'):
+            conditions.append(EmailOutbox.status == request.args['status'])
+        
+        if request.args.get('recipient'):
+            conditions.append(prefix_filter(EmailOutbox.recipient, request.args['recipient']))
+        
+        return stream_listing('emails', EmailOutbox, EmailOutbox.PUBLIC_FIELDS, conditions)
+    except ListingError as e:
+        return jsonify({'message': str(e)}), 400
+
+# Status de entrega de um e-mail (apenas admin)
+@auth_bp.route('/outbox/<int:email_id>', methods=['GET'])
+@token_required
+@admin_required
+def get_outbox_email(current_user, email_id):
+    email = EmailOutbox.query.get(email_id)
+    
+    if not email:
+        return jsonify({'message': 'E-mail não encontrado!'}), 404
+    
+    return jsonify({'email': email.to_dict()}), 200
@@ -0,0 +1,418 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from src.models.user import db, Campaign, CampaignRecipient, WhatsAppInstance
+from src.routes.auth import token_required
+from src.services.campaigns import campaign_runner, CampaignError, template_variables
+from src.services.listing import ListingError, prefix_filter, stream_listing
+from src.services.media_store import media_store, MediaStoreError
+from sqlalchemy import delete, update
+from datetime import datetime, timezone
+import csv
+import io
+import itertools
+import json
+
+campaigns_bp = Blueprint('campaigns', __name__)
+
+# Carrega a campanha verificando a permissão; retorna (campanha, resposta de erro)
+def load_campaign(current_user, campaign_id):
+    campaign = db.session.get(Campaign, campaign_id)
+
+    if not campaign:
+        return None, (jsonify({'message': 'Campanha não encontrada!'}), 404)
+
+    if campaign.user_id != current_user.id and not current_user.is_admin:
+        return None, (jsonify({'message': 'Permissão negada!'}), 403)
+
+    return campaign, None
+
+def parse_datetime(value):
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+# Valida instance_ids (ou instance_id) do corpo: instâncias do dono da campanha
+def parse_instance_ids(data, user_id):
+    ids = data.get('instance_ids')
+    if ids is None and data.get('instance_id') is not None:
+        ids = [data['instance_id']]
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+        raise CampaignError('Informe instance_ids com as instâncias da campanha')
+
+    ids = list(dict.fromkeys(ids))
+    owned = set(db.session.execute(
+        db.select(WhatsAppInstance.id)
+        .where(WhatsAppInstance.id.in_(ids), WhatsAppInstance.user_id == user_id)
+    ).scalars())
+    if owned != set(ids):
+        raise CampaignError('Instâncias inválidas: ' + ', '.join(str(i) for i in ids if i not in owned))
+    return ids
+
+def apply_sending_options(campaign, data):
+    if 'rate_per_instance' in data:
+        rate = data['rate_per_instance']
+        if not isinstance(rate, (int, float)) or not 0 < rate <= campaign_runner.max_rate:
+            raise CampaignError(f"rate_per_instance deve estar entre 0 e {campaign_runner.max_rate}")
+        campaign.rate_per_instance = float(rate)
+
+    if 'jitter' in data:
+        if not isinstance(data['jitter'], (int, float)) or data['jitter'] < 0:
+            raise CampaignError('jitter inválido')
+        campaign.jitter = float(data['jitter'])
+
+# Destinatários em JSON: ["5511...", {"to": "5511...", "variables": {"nome": "Ana"}}, ...]
+def json_recipients(items):
+    for item in items:
+        if isinstance(item, dict):
+            variables = item.get('variables') or {}
+            if not isinstance(variables, dict):
+                raise CampaignError('variables deve ser um objeto')
+            yield item.get('to'), variables
+        else:
+            yield item, {}
+
+# Destinatários em CSV (corpo text/csv): cabeçalho com a coluna "to" e uma
+# coluna por variável do template. Aceita vírgula ou ponto e vírgula.
+def csv_recipients(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    header_line = text.readline()
+    delimiter = ';' if header_line.count(';') > header_line.count(',') else ','
+    reader = csv.reader(itertools.chain([header_line], text), delimiter=delimiter)
+
+    header = [column.strip() for column in next(reader, [])]
+    if 'to' not in header:
+        raise CampaignError('O CSV precisa de um cabeçalho com a coluna "to"')
+    to_index = header.index('to')
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        values = dict(zip(header, row))
+        yield (row[to_index] if to_index < len(row) else ''), {
+            column: value for column, value in values.items() if column != 'to'
+        }
+
+# Criar campanha (status 'draft')
+#
+# Corpo: {"name", "message", "instance_ids": [1, 2], "media_url"/"mediaHash",
+# "media_type", "rate_per_instance", "jitter", "recipients": [...]}
+@campaigns_bp.route('', methods=['POST'])
+@token_required
+def create_campaign(current_user):
+    data = request.get_json()
+
+    if not data or not data.get('name') or not data.get('message'):
+        return jsonify({'message': 'Nome ou mensagem não fornecidos!'}), 400
+
+    # O envio repete a mídia para cada destinatário: só URLs http(s) ou o
+    # hash de um arquivo do media_store, nunca um caminho local
+    media_url = None
+    if data.get('media_url') or data.get('mediaHash'):
+        try:
+            media_url = media_store.resolve(data.get('media_url'), data.get('mediaHash'))
+        except MediaStoreError as e:
+            return jsonify({'message': str(e)}), 400
+        if not media_url:
+            return jsonify({'message': 'Mídia não encontrada!'}), 404
+    if media_url and not data.get('media_type'):
+        return jsonify({'message': 'media_type não fornecido!'}), 400
+
+    try:
+        campaign = Campaign(
+            user_id=current_user.id,
+            name=data['name'],
+            message=data['message'],
+            media_url=media_url,
+            media_type=data.get('media_type') if media_url else None,
+            instance_ids=json.dumps(parse_instance_ids(data, current_user.id)),
+            status='draft',
+            rate_per_instance=campaign_runner.default_rate,
+            jitter=campaign_runner.default_jitter,
+            total_recipients=0,
+            sent_count=0,
+            failed_count=0,
+            skipped_count=0
+        )
+        apply_sending_options(campaign, data)
+        db.session.add(campaign)
+        db.session.flush()
+
+        if data.get('recipients'):
+            if not isinstance(data['recipients'], list):
+                raise CampaignError('recipients deve ser uma lista')
+            campaign_runner.add_recipients(campaign, json_recipients(data['recipients']))
+    except CampaignError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+
+    db.session.commit()
+
+    return jsonify({
+        'message': 'Campanha criada com sucesso!',
+        'campaign': campaign.to_dict()
+    }), 201
+
+# Listar campanhas do usuário (?status=, ?name=prefixo, ?all=true para admin)
+@campaigns_bp.route('', methods=['GET'])
+@token_required
+def get_campaigns(current_user):
+    try:
+        conditions = []
+        if not (current_user.is_admin and request.args.get('all') == 'true'):
+            conditions.append(Campaign.user_id == current_user.id)
+
+        if request.args.get('status'):
+            conditions.append(Campaign.status == request.args['status'])
+
+        if request.args.get('name'):
+            conditions.append(prefix_filter(Campaign.name, request.args['name']))
+
+        return stream_listing('campaigns', Campaign, Campaign.PUBLIC_FIELDS, conditions)
+    except ListingError as e:
+        return jsonify({'message': str(e)}), 400
+
+# Detalhes e progresso da campanha
+@campaigns_bp.route('/<int:campaign_id>', methods=['GET'])
+@token_required
+def get_campaign(current_user, campaign_id):
+    campaign, error = load_campaign(current_user, campaign_id)
+    if error:
+        return error
+
+    return jsonify({'campaign': campaign.to_dict()}), 200
+
+# Atualizar campanha (nome, instâncias, ritmo; a mensagem só em rascunho)
+@campaigns_bp.route('/<int:campaign_id>', methods=['PUT'])
+@token_required
+def update_campaign(current_user, campaign_id):
+    campaign, error = load_campaign(current_user, campaign_id)
+    if error:
+        return error
+
+    if campaign.status in ('completed', 'cancelled'):
+        return jsonify({'message': 'Campanha encerrada não pode ser alterada!'}), 409
+
+    data = request.get_json() or {}
+
+    try:
+        if data.get('name'):
+            campaign.name = data['name']
+
+        if 'message' in data:
+            if campaign.status != 'draft':
+                raise CampaignError('A mensagem só pode ser alterada em rascunho')
+            if campaign.total_recipients and template_variables(data['message']) - template_variables(campaign.message):
+                raise CampaignError('A nova mensagem usa variáveis que os destinatários não têm')
+            campaign.message = data['message']
+
+        if 'instance_ids' in data or 'instance_id' in data:
+            campaign.instance_ids = json.dumps(parse_instance_ids(data, campaign.user_id))
+
+        apply_sending_options(campaign, data)
+    except CampaignError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+
+    db.session.commit()
+
+    return jsonify({
+        'message': 'Campanha atualizada com sucesso!',
+        'campaign': campaign.to_dict()
+    }), 200
+
+# Excluir campanha (não pode estar em andamento)
+@campaigns_bp.route('/<int:campaign_id>', methods=['DELETE'])
+@token_required
+def delete_campaign(current_user, campaign_id):
+    campaign, error = load_campaign(current_user, campaign_id)
+    if error:
+        return error
+
+    if campaign.status == 'running':
+        return jsonify({'message': 'Pause ou cancele a campanha antes de excluí-la!'}), 409
+
+    db.session.execute(delete(CampaignRecipient).where(CampaignRecipient.campaign_id == campaign.id))
+    db.session.delete(campaign)
+    db.session.commit()
+
+    return jsonify({'message': 'Campanha excluída com sucesso!'}), 200
+
+# Adicionar destinatários: JSON {"recipients": [...]} ou CSV (text/csv)
+@campaigns_bp.route('/<int:campaign_id>/recipients', methods=['POST'])
+@token_required
+def add_recipients(current_user, campaign_id):
+    campaign, error = load_campaign(current_user, campaign_id)
+    if error:
+        return error
+
+    if campaign.status not in ('draft', 'scheduled', 'paused'):
+        return jsonify({'message': 'Pause a campanha antes de adicionar destinatários!'}), 409
+
+    try:
+        if request.mimetype == 'text/csv':
+            rows = csv_recipients(request.stream)
+        else:
+            data = request.get_json(silent=True)
+            if not data or not isinstance(data.get('recipients'), list):
+                return jsonify({'message': 'Lista de destinatários não fornecida!'}), 400
+            rows = json_recipients(data['recipients'])
+
+        added = campaign_runner.add_recipients(campaign, rows)
+    except (CampaignError, UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+
+    db.session.commit()
+
+    return jsonify({
+        'message': 'Destinatários adicionados com sucesso!',
+        'added': added,
+        'campaign': campaign.to_dict()
+    }), 200
+
+# Iniciar campanha em rascunho, agora ou em {"scheduled_at": "2025-01-01T12:00:00Z"}
+@campaigns_bp.route('/<int:campaign_id>/start', methods=['POST'])
+@token_required
+def start_campaign(current_user, campaign_id):
+    campaign, error = load_campaign(current_user, campaign_id)
+    if error:
+        return error
+
+    if campaign.status != 'draft':
+        return jsonify({'message': 'Apenas campanhas em rascunho podem ser iniciadas!'}), 409
+
+    if not campaign.total_recipients:
+        return jsonify({'message': 'A campanha não tem destinatários!'}), 400
+
+    data = request.get_json(silent=True) or {}
+    now = datetime.utcnow()
+    scheduled_at = now
+    if data.get('scheduled_at'):
+        try:
+            scheduled_at = parse_datetime(data['scheduled_at'])
+        except (TypeError, ValueError):
+            return jsonify({'message': 'Data inválida em scheduled_at'}), 400
+
+    campaign.scheduled_at = scheduled_at
+    if scheduled_at > now:
+        campaign.status = 'scheduled'
+    else:
+        campaign.status = 'running'
+        campaign.started_at = now
+    db.session.commit()
+    campaign_runner.refresh()
+
+    return jsonify({
+        'message': 'Campanha agendada com sucesso!' if campaign.status == 'scheduled' else 'Campanha iniciada com sucesso!',
+        'campaign': campaign.to_dict()
+    }), 200
+
+# Muda o status com UPDATE condicional (o runner também altera o status)
+def change_status(current_user, campaign_id, allowed, status, message, **values):
+    campaign, error = load_campaign(current_user, campaign_id)
+    if error:
+        return error
+
+    result = db.session.execute(
+        update(Campaign)
+        .where(Campaign.id == campaign.id, Campaign.status.in_(allowed))
+        .values(status=status, **values)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        return jsonify({'message': f"Operação não permitida com a campanha em '{campaign.status}'!"}), 409
+
+    if status == 'cancelled':
+        # Os envios em andamento terminam; os pendentes não serão enviados
+        skipped = db.session.execute(
+            update(CampaignRecipient)
+            .where(CampaignRecipient.campaign_id == campaign.id, CampaignRecipient.status == 'pending')
+            .values(status='skipped')
+        ).rowcount
+        db.session.execute(
+            update(Campaign)
+            .where(Campaign.id == campaign.id)
+            .values(skipped_count=Campaign.skipped_count + skipped)
+        )
+
+    db.session.commit()
+    db.session.refresh(campaign)
+    campaign_runner.refresh()
+
+    return jsonify({'message': message, 'campaign': campaign.to_dict()}), 200
+
+# Pausar campanha (os envios já iniciados terminam)
+@campaigns_bp.route('/<int:campaign_id>/pause', methods=['POST'])
+@token_required
+def pause_campaign(current_user, campaign_id):
+    return change_status(current_user, campaign_id, ('running', 'scheduled'), 'paused', 'Campanha pausada com sucesso!')
+
+# Retomar campanha pausada
+@campaigns_bp.route('/<int:campaign_id>/resume', methods=['POST'])
+@token_required
+def resume_campaign(current_user, campaign_id):
+    return change_status(
+        current_user, campaign_id, ('paused',), 'running', 'Campanha retomada com sucesso!',
+        last_error=None, started_at=db.func.coalesce(Campaign.started_at, datetime.utcnow())
+    )
+
+# Cancelar campanha: destinatários pendentes ficam 'skipped'
+@campaigns_bp.route('/<int:campaign_id>/cancel', methods=['POST'])
+@token_required
+def cancel_campaign(current_user, campaign_id):
+    return change_status(
+        current_user, campaign_id, ('draft', 'scheduled', 'running', 'paused'), 'cancelled',
+        'Campanha cancelada com sucesso!', completed_at=datetime.utcnow()
+    )
+
+# Listar destinatários (?status=sent|failed|...; paginação por cursor)
+@campaigns_bp.route('/<int:campaign_id>/recipients', methods=['GET'])
+@token_required
+def get_recipients(current_user, campaign_id):
+    campaign, error = load_campaign(current_user, campaign_id)
+    if error:
+        return error
+
+    try:
+        conditions = [CampaignRecipient.campaign_id == campaign.id]
+        if request.args.get('status'):
+            conditions.append(CampaignRecipient.status == request.args['status'])
+
+        return stream_listing('recipients', CampaignRecipient, CampaignRecipient.PUBLIC_FIELDS, conditions)
+    except ListingError as e:
+        return jsonify({'message': str(e)}), 400
+
+# Exportar o resultado por destinatário em CSV (gerado em streaming)
+@campaigns_bp.route('/<int:campaign_id>/export', methods=['GET'])
+@token_required
+def export_recipients(current_user, campaign_id):
+    campaign, error = load_campaign(current_user, campaign_id)
+    if error:
+        return error
+
+    columns = ('phone', 'status', 'instance_id', 'attempts', 'last_error', 'sent_at')
+    statement = (
+        db.select(*[getattr(CampaignRecipient, column) for column in columns])
+        .where(CampaignRecipient.campaign_id == campaign.id)
+        .order_by(CampaignRecipient.id)
+        .execution_options(yield_per=1000)
+    )
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('to',) + columns[1:])
+
+        rows = db.session.execute(statement)
+        for row in rows:
+            writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in row])
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        rows.close()
+        yield buffer.getvalue()
+
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="campanha_{campaign.id}.csv"'
+    return response
@@ -0,0 +1,168 @@
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db, WhatsAppInstance, MessageLog, MessageLogKey, MESSAGE_LOG_EPOCH, message_log_id
+from src.services.group_cache import group_cache
+import datetime
+import hmac
+import uuid
+
+events_bp = Blueprint('events', __name__)
+
+# Horário da mensagem, ou None se o valor não cabe numa data (evento descartado)
+def parse_timestamp(value):
+    # O WhatsApp envia segundos; valores muito grandes são milissegundos.
+    # Horários anteriores a MESSAGE_LOG_EPOCH não são de mensagens reais.
+    if isinstance(value, (int, float)) and value > 0:
+        seconds = value / 1000 if value > 1e11 else value
+        try:
+            timestamp = datetime.datetime.utcfromtimestamp(seconds)
+        except (OverflowError, OSError, ValueError):
+            return None
+        if timestamp >= MESSAGE_LOG_EPOCH:
+            return timestamp
+    return datetime.datetime.utcnow()
+
+def text(value, size):
+    return None if value is None else str(value)[:size]
+
+# Grava as mensagens do lote que ainda não estão no histórico e retorna
+# quantas foram gravadas. `rows` é indexado por (instância, id da mensagem).
+def store_messages(rows):
+    for attempt in range(3):
+        try:
+            return _store_messages(rows)
+        except IntegrityError:
+            # Outro lote gravou a mesma mensagem ou ocupou o mesmo id ao mesmo
+            # tempo: refaz a conferência
+            db.session.rollback()
+            if attempt == 2:
+                raise
+
+def _store_messages(rows):
+    # Mensagens já gravadas (eventos reenviados pelo serviço WhatsApp)
+    known = set()
+    by_instance = {}
+    for instance_id, message_id in rows:
+        by_instance.setdefault(instance_id, []).append(message_id)
+    for instance_id, message_ids in by_instance.items():
+        known.update(
+            (instance_id, message_id) for message_id in db.session.execute(
+                db.select(MessageLogKey.message_id)
+                .where(MessageLogKey.instance_id == instance_id, MessageLogKey.message_id.in_(message_ids))
+            ).scalars()
+        )
+    new = [dict(row) for key, row in rows.items() if key not in known]
+    if not new:
+        return 0
+
+    # Colisão do hash com um id já gravado ou com outra mensagem do lote: usa
+    # o próximo id livre
+    taken = set()
+    pending = new
+    while pending:
+        used = set(db.session.execute(
+            db.select(MessageLog.id).where(MessageLog.id.in_({row['id'] for row in pending}))
+        ).scalars())
+        collided = []
+        for row in pending:
+            if row['id'] in used or row['id'] in taken:
+                row['id'] += 1
+                collided.append(row)
+            else:
+                taken.add(row['id'])
+        pending = collided
+
+    db.session.execute(insert(MessageLogKey.__table__), [
+        {'instance_id': row['instance_id'], 'message_id': row['message_id'], 'log_id': row['id']} for row in new
+    ])
+    result = db.session.execute(insert(MessageLog.__table__), new)
+    db.session.commit()
+    return result.rowcount
+
+# Receber lote de eventos do serviço WhatsApp
+#
+# Corpo: {"events": [{"sessionId", "type", "id", "chatId", "sender", "fromMe",
+# "isGroup", "messageType", "body", "hasMedia", "timestamp"}, ...]}
+# Eventos {"type": "group_participants", "sessionId", "groupId", "action",
+# "participants"} atualizam o cache de membros dos grupos.
+# Autenticação: cabeçalho X-Events-Secret igual a EVENTS_SECRET.
+@events_bp.route('', methods=['POST'])
+def ingest_events():
+    secret = current_app.config.get('EVENTS_SECRET')
+    if not secret:
+        return jsonify({'message': 'Recebimento de eventos desativado!'}), 403
+
+    if not hmac.compare_digest(request.headers.get('X-Events-Secret', ''), secret):
+        return jsonify({'message': 'Segredo inválido!'}), 401
+
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('events'), list):
+        return jsonify({'message': 'Lista de eventos não fornecida!'}), 400
+
+    events = data['events']
+    if len(events) > current_app.config.get('EVENTS_MAX_BATCH', 1000):
+        return jsonify({'message': 'Lote de eventos muito grande!'}), 413
+
+    # Uma única consulta para mapear as sessões do lote para instâncias
+    session_ids = {
+        event['sessionId'] for event in events
+        if isinstance(event, dict) and isinstance(event.get('sessionId'), str)
+    }
+    instances = dict(db.session.execute(
+        db.select(WhatsAppInstance.session_id, WhatsAppInstance.id)
+        .where(WhatsAppInstance.session_id.in_(session_ids))
+    ).all()) if session_ids else {}
+
+    now = datetime.datetime.utcnow()
+    rows = {}
+    skipped = 0
+    groups = 0
+    for event in events:
+        if isinstance(event, dict) and event.get('type') == 'group_participants':
+            instance_id = instances.get(event['sessionId']) if isinstance(event.get('sessionId'), str) else None
+            group_id = event.get('groupId')
+            if instance_id is not None and group_id and isinstance(group_id, str) and isinstance(event.get('participants'), list):
+                group_cache.apply_event(instance_id, group_id, event.get('action'), event['participants'])
+                groups += 1
+            else:
+                skipped += 1
+            continue
+
+        if not isinstance(event, dict) or event.get('type', 'message') != 'message':
+            skipped += 1
+            continue
+
+        instance_id = instances.get(event['sessionId']) if isinstance(event.get('sessionId'), str) else None
+        chat_id = event.get('chatId')
+        timestamp = parse_timestamp(event.get('timestamp'))
+        if instance_id is None or not chat_id or timestamp is None:
+            skipped += 1
+            continue
+
+        message_id = text(event.get('id'), 128) or uuid.uuid4().hex
+        if (instance_id, message_id) in rows:
+            continue
+        rows[(instance_id, message_id)] = {
+            'id': message_log_id(timestamp, instance_id, message_id),
+            'instance_id': instance_id,
+            'message_id': message_id,
+            'chat_id': text(chat_id, 128),
+            'sender': text(event.get('sender'), 128),
+            'from_me': bool(event.get('fromMe')),
+            'is_group': bool(event.get('isGroup', str(chat_id).endswith('@g.us'))),
+            'message_type': text(event.get('messageType'), 32),
+            'body': event.get('body'),
+            'has_media': bool(event.get('hasMedia')),
+            'timestamp': timestamp,
+            'received_at': now
+        }
+
+    accepted = store_messages(rows) if rows else 0
+
+    return jsonify({
+        'message': 'Eventos recebidos com sucesso!',
+        'accepted': accepted,
+        'groups': groups,
+        'skipped': skipped
+    }), 200
@@ -1,56 +1,133 @@
-from flask import Blueprint, request, jsonify, current_app
-from src.models.user import db, WhatsAppInstance, User
-import requests
+from flask import Blueprint, request, jsonify, current_app, make_response, Response
+from src.models.user import db, WhatsAppInstance, User, MessageJob, MessageLog, MessageLogKey, GatewayNode, message_log_id_at
+from src.routes.auth import token_required, token_from_query, admin_required
+from src.services.whatsapp_gateway import gateway
+from src.services.circuit_breaker import CircuitOpen
+from src.services.message_queue import message_queue
+from src.services.status_poller import status_poller
+from src.services.listing import ListingError, parse_bool, prefix_filter, stream_listing
+from src.services.contact_cache import contact_cache, GatewayListError, search_items, sort_items
+from src.services.media_store import media_store, MediaStoreError
+from src.services.idempotency import idempotent
+from src.services.rate_limit import rate_limit
+from src.services.group_cache import group_cache
+from src.services.gateway_nodes import gateway_nodes
+from src.services.live_events import live_events, format_event, streaming_supported
+from sqlalchemy import delete
+import hashlib
 import json
-from functools import wraps
-import jwt
-from datetime import datetime
+import os
+import time
+from datetime import datetime, timezone
 
 whatsapp_bp = Blueprint('whatsapp', __name__)
 
-# Decorator para verificar token JWT
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
-        
-        if not token:
-            return jsonify({'message': 'Token não fornecido!'}), 401
+# Encerra a transação de leitura antes de esperar o serviço WhatsApp, para não
+# prender uma conexão do pool do banco durante a chamada (no modo gevent há
+# milhares de requisições esperando ao mesmo tempo). Os objetos carregados
+# continuam válidos; se a rota voltar a usar o banco, uma nova transação é aberta.
+def release_db_connection():
+    session = db.session()
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        session.commit()
+    finally:
+        session.expire_on_commit = expire_on_commit
+
+# Executa uma chamada ao serviço WhatsApp e monta a resposta padrão
+def gateway_response(call, success_message, error_message, extra=None):
+    release_db_connection()
+    try:
+        response = call()
         
-        try:
-            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = User.query.filter_by(id=data['user_id']).first()
-            
-            if not current_user:
-                return jsonify({'message': 'Usuário não encontrado!'}), 401
-                
-            if not current_user.is_active:
-                return jsonify({'message': 'Conta desativada!'}), 401
-                
-        except:
-            return jsonify({'message': 'Token inválido!'}), 401
-            
-        return f(current_user, *args, **kwargs)
-    
-    return decorated
+        if response.status_code == 200:
+            return jsonify({
+                'message': success_message,
+                **(extra or {})
+            }), 200
+        else:
+            return jsonify({
+                'message': error_message,
+                'error': response.json().get('error')
+            }), 500
+    except CircuitOpen:
+        # Respondido com 503 + Retry-After pelo handler do gateway
+        raise
+    except Exception as e:
+        return jsonify({
+            'message': error_message,
+            'error': str(e)
+        }), 500
 
-# Decorator para verificar se é admin
-def admin_required(f):
-    @wraps(f)
-    def decorated(current_user, *args, **kwargs):
-        if not current_user.is_admin:
-            return jsonify({'message': 'Permissão negada!'}), 403
-        return f(current_user, *args, **kwargs)
-    
-    return decorated
+# Envio assíncrono: ?async=true na URL ou "async": true no corpo
+def is_async_request(data):
+    return request.args.get('async') == 'true' or data.get('async') in (True, 'true')
 
-# Configuração do serviço WhatsApp
-WHATSAPP_SERVICE_URL = "http://localhost:3000/api"
+# Enfileira um envio e responde imediatamente com o ID do job
+def enqueue_response(instance, current_user, job_type, payload, extra=None):
+    job = message_queue.enqueue(instance, current_user.id, job_type, payload)
+    return jsonify({
+        'message': 'Envio enfileirado com sucesso!',
+        'job_id': job.id,
+        'job': job.to_dict(),
+        **(extra or {})
+    }), 202
+
+# Lista de contatos/conversas a partir do cache, com busca, ordenação,
+# paginação (?search=, ?sort=name&order=desc, ?limit=100&offset=0) e ETag.
+# ?refresh=true descarta o cache e consulta o serviço WhatsApp.
+def cached_list_response(instance, kind, error_message):
+    release_db_connection()
+    try:
+        cached = contact_cache.get(instance, kind, refresh=request.args.get('refresh') == 'true')
+    except GatewayListError as e:
+        return jsonify({
+            'message': error_message,
+            'error': e.error
+        }), 500
+    except CircuitOpen:
+        raise
+    except Exception as e:
+        return jsonify({
+            'message': error_message,
+            'error': str(e)
+        }), 500
+    
+    # O ETag depende da versão da lista e dos parâmetros da consulta. É fraco
+    # (W/): a mesma lista, lida de novo do serviço WhatsApp, volta com outro
+    # fetched_at no corpo
+    query = '&'.join(f"{key}={request.args.get(key, '')}" for key in ('search', 'sort', 'order', 'limit', 'offset'))
+    etag = hashlib.sha256(f"{cached.etag}?{query}".encode('utf-8')).hexdigest()
+    
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag, weak=True)
+        return response
+    
+    try:
+        limit = max(1, min(int(request.args.get('limit', current_app.config.get('LIST_DEFAULT_LIMIT', 100))),
+                           current_app.config.get('LIST_MAX_LIMIT', 1000)))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({'message': 'Parâmetros de paginação inválidos'}), 400
+    
+    items = cached.items
+    if request.args.get('search'):
+        items = search_items(items, request.args['search'])
+    if request.args.get('sort'):
+        items = sort_items(items, request.args['sort'], request.args.get('order') == 'desc')
+    
+    response = jsonify({
+        'success': True,
+        kind: items[offset:offset + limit],
+        'total': len(items),
+        'limit': limit,
+        'offset': offset,
+        'fetched_at': cached.fetched_at.isoformat()
+    })
+    response.set_etag(etag, weak=True)
+    return response
 
 # Criar nova instância
 @whatsapp_bp.route('/instances', methods=['POST'])
@@ -73,7 +150,9 @@ def create_instance(current_user):
         webhook_url=data.get('webhook_url'),
         ignore_groups=data.get('ignore_groups', False),
         block_calls=data.get('block_calls', False),
-        prevent_message_deletion=data.get('prevent_message_deletion', False)
+        prevent_message_deletion=data.get('prevent_message_deletion', False),
+        # Sem nó disponível agora, o nó é escolhido na primeira chamada ao serviço
+        gateway_node_id=gateway_nodes.choose(session_id)
     )
     
     db.session.add(new_instance)
@@ -88,15 +167,32 @@ def create_instance(current_user):
 @whatsapp_bp.route('/instances', methods=['GET'])
 @token_required
 def get_instances(current_user):
-    # Administradores podem ver todas as instâncias
-    if current_user.is_admin and request.args.get('all') == 'true':
-        instances = WhatsAppInstance.query.all()
-    else:
-        instances = WhatsAppInstance.query.filter_by(user_id=current_user.id).all()
-    
-    return jsonify({
-        'instances': [instance.to_dict() for instance in instances]
-    }), 200
+    # Paginação: ?limit=100&after=<next_cursor>; filtros: ?is_active, ?is_connected,
+    # ?instance_type, ?user_id (admin) e ?name=prefixo; campos: ?fields=id,name
+    try:
+        conditions = []
+        
+        # Administradores podem ver todas as instâncias
+        if current_user.is_admin and request.args.get('all') == 'true':
+            if request.args.get('user_id'):
+                conditions.append(WhatsAppInstance.user_id == request.args.get('user_id', type=int))
+        else:
+            conditions.append(WhatsAppInstance.user_id == current_user.id)
+        
+        for field in ('is_active', 'is_connected'):
+            value = parse_bool(request.args.get(field))
+            if value is not None:
+                conditions.append(getattr(WhatsAppInstance, field) == value)
+        
+        if request.args.get('instance_type'):
+            conditions.append(WhatsAppInstance.instance_type == request.args['instance_type'])
+        
+        if request.args.get('name'):
+            conditions.append(prefix_filter(WhatsAppInstance.name, request.args['name']))
+        
+        return stream_listing('instances', WhatsAppInstance, WhatsAppInstance.PUBLIC_FIELDS, conditions)
+    except ListingError as e:
+        return jsonify({'message': str(e)}), 400
 
 # Obter detalhes de uma instância
 @whatsapp_bp.route('/instances/<int:instance_id>', methods=['GET'])
@@ -111,21 +207,15 @@ def get_instance(current_user, instance_id):
     if instance.user_id != current_user.id and not current_user.is_admin:
         return jsonify({'message': 'Permissão negada!'}), 403
     
-    # Verificar status da instância no serviço WhatsApp
-    try:
-        response = requests.get(
-            f"{WHATSAPP_SERVICE_URL}/status/{instance.session_id}",
-            params={'type': instance.instance_type}
-        )
-        status_data = response.json()
-        
-        # Atualizar status de conexão
-        if status_data.get('success'):
-            instance.is_connected = status_data.get('status', {}).get('connected', False)
-            db.session.commit()
-    except:
-        # Em caso de erro, não atualiza o status
-        pass
+    # O status é mantido pelo status_poller; ?fresh=true força a consulta
+    # direta ao serviço WhatsApp
+    if request.args.get('fresh') == 'true':
+        release_db_connection()
+        try:
+            status_poller.refresh(instance)
+        except:
+            # Em caso de erro, não atualiza o status
+            pass
     
     return jsonify({
         'instance': instance.to_dict()
@@ -154,14 +244,7 @@ def update_instance(current_user, instance_id):
         
         # Atualizar webhook no serviço WhatsApp
         try:
-            requests.post(
-                f"{WHATSAPP_SERVICE_URL}/set-webhook",
-                json={
-                    'sessionId': instance.session_id,
-                    'url': data['webhook_url'],
-                    'ignoreGroups': instance.ignore_groups
-                }
-            )
+            gateway.set_webhook(instance.session_id, data['webhook_url'], instance.ignore_groups)
         except:
             pass
     
@@ -199,15 +282,18 @@ def delete_instance(current_user, instance_id):
     
     # Tentar fazer logout no serviço WhatsApp
     try:
-        requests.post(
-            f"{WHATSAPP_SERVICE_URL}/logout",
-            json={'sessionId': instance.session_id}
-        )
+        gateway.logout(instance.session_id)
     except:
         pass
     
+    # O histórico não tem chave estrangeira (tabela particionável)
+    db.session.execute(delete(MessageLog).where(MessageLog.instance_id == instance.id))
+    db.session.execute(delete(MessageLogKey).where(MessageLogKey.instance_id == instance.id))
     db.session.delete(instance)
     db.session.commit()
+    contact_cache.invalidate(instance_id)
+    group_cache.invalidate(instance_id)
+    gateway_nodes.invalidate(instance.session_id)
     
     return jsonify({
         'message': 'Instância excluída com sucesso!'
@@ -227,33 +313,37 @@ def init_instance(current_user, instance_id):
         return jsonify({'message': 'Permissão negada!'}), 403
     
     # Iniciar instância no serviço WhatsApp
-    try:
-        response = requests.post(
-            f"{WHATSAPP_SERVICE_URL}/init",
-            json={
-                'sessionId': instance.session_id,
-                'type': instance.instance_type
-            }
-        )
-        
-        if response.status_code == 200:
-            return jsonify({
-                'message': 'Instância iniciada com sucesso! Aguarde o QR code.'
-            }), 200
-        else:
-            return jsonify({
-                'message': 'Erro ao iniciar instância!',
-                'error': response.json().get('error')
-            }), 500
-    except Exception as e:
-        return jsonify({
-            'message': 'Erro ao iniciar instância!',
-            'error': str(e)
-        }), 500
+    return gateway_response(
+        lambda: gateway.init(instance.session_id, instance.instance_type),
+        'Instância iniciada com sucesso! Aguarde o QR code.',
+        'Erro ao iniciar instância!'
+    )
+
+# Desconectar instância (logout no WhatsApp; um novo QR code será necessário)
+@whatsapp_bp.route('/instances/<int:instance_id>/logout', methods=['POST'])
+@token_required
+def logout_instance(current_user, instance_id):
+    instance = WhatsAppInstance.query.get(instance_id)
+    
+    if not instance:
+        return jsonify({'message': 'Instância não encontrada!'}), 404
+    
+    # Verificar permissão
+    if instance.user_id != current_user.id and not current_user.is_admin:
+        return jsonify({'message': 'Permissão negada!'}), 403
+    
+    return gateway_response(
+        lambda: gateway.logout(instance.session_id),
+        'Instância desconectada com sucesso!',
+        'Erro ao desconectar instância!'
+    )
 
-# Enviar mensagem
+# Enviar mensagem (aceita o cabeçalho Idempotency-Key)
 @whatsapp_bp.route('/instances/<int:instance_id>/send-message', methods=['POST'])
 @token_required
+@idempotent
+@rate_limit('send', by='user')
+@rate_limit('send_instance', by='instance')
 def send_message(current_user, instance_id):
     instance = WhatsAppInstance.query.get(instance_id)
     
@@ -269,36 +359,25 @@ def send_message(current_user, instance_id):
     if not data or not data.get('to') or not data.get('message'):
         return jsonify({'message': 'Destinatário ou mensagem não fornecidos!'}), 400
     
+    if is_async_request(data):
+        return enqueue_response(instance, current_user, 'message', {
+            'to': data['to'],
+            'message': data['message']
+        })
+    
     # Enviar mensagem através do serviço WhatsApp
-    try:
-        response = requests.post(
-            f"{WHATSAPP_SERVICE_URL}/send-message",
-            json={
-                'sessionId': instance.session_id,
-                'to': data['to'],
-                'message': data['message'],
-                'type': instance.instance_type
-            }
-        )
-        
-        if response.status_code == 200:
-            return jsonify({
-                'message': 'Mensagem enviada com sucesso!'
-            }), 200
-        else:
-            return jsonify({
-                'message': 'Erro ao enviar mensagem!',
-                'error': response.json().get('error')
-            }), 500
-    except Exception as e:
-        return jsonify({
-            'message': 'Erro ao enviar mensagem!',
-            'error': str(e)
-        }), 500
+    return gateway_response(
+        lambda: gateway.send_message(instance.session_id, data['to'], data['message'], instance.instance_type),
+        'Mensagem enviada com sucesso!',
+        'Erro ao enviar mensagem!'
+    )
 
-# Enviar mídia
+# Enviar mídia (aceita o cabeçalho Idempotency-Key)
 @whatsapp_bp.route('/instances/<int:instance_id>/send-media', methods=['POST'])
 @token_required
+@idempotent
+@rate_limit('send', by='user')
+@rate_limit('send_instance', by='instance')
 def send_media(current_user, instance_id):
     instance = WhatsAppInstance.query.get(instance_id)
     
@@ -309,43 +388,77 @@ def send_media(current_user, instance_id):
     if instance.user_id != current_user.id and not current_user.is_admin:
         return jsonify({'message': 'Permissão negada!'}), 403
     
-    data = request.get_json()
+    # A mídia pode vir por URL (JSON), por upload (multipart, campo "file")
+    # ou pelo hash de um arquivo já enviado ("mediaHash")
+    extra = None
+    if request.mimetype == 'multipart/form-data':
+        try:
+            form, media_path, media_hash = media_store.receive(request)
+        except MediaStoreError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        data = form.to_dict()
+        data['mediaUrl'] = media_path
+        extra = {'mediaHash': media_hash}
+    else:
+        data = request.get_json()
+        
+        if data and (data.get('mediaUrl') or data.get('mediaHash')):
+            try:
+                data['mediaUrl'] = media_store.resolve(data.get('mediaUrl'), data.get('mediaHash'))
+            except MediaStoreError as e:
+                return jsonify({'message': str(e)}), 400
+            if not data['mediaUrl']:
+                return jsonify({'message': 'Mídia não encontrada!'}), 404
     
     if not data or not data.get('to') or not data.get('mediaUrl') or not data.get('mediaType'):
         return jsonify({'message': 'Dados incompletos!'}), 400
     
+    if is_async_request(data):
+        return enqueue_response(instance, current_user, 'media', {
+            'to': data['to'],
+            'mediaUrl': data['mediaUrl'],
+            'mediaType': data['mediaType'],
+            'caption': data.get('caption', '')
+        }, extra)
+    
     # Enviar mídia através do serviço WhatsApp
-    try:
-        response = requests.post(
-            f"{WHATSAPP_SERVICE_URL}/send-media",
-            json={
-                'sessionId': instance.session_id,
-                'to': data['to'],
-                'mediaUrl': data['mediaUrl'],
-                'caption': data.get('caption', ''),
-                'mediaType': data['mediaType'],
-                'type': instance.instance_type
-            }
-        )
-        
-        if response.status_code == 200:
-            return jsonify({
-                'message': 'Mídia enviada com sucesso!'
-            }), 200
-        else:
-            return jsonify({
-                'message': 'Erro ao enviar mídia!',
-                'error': response.json().get('error')
-            }), 500
-    except Exception as e:
-        return jsonify({
-            'message': 'Erro ao enviar mídia!',
-            'error': str(e)
-        }), 500
+    return gateway_response(
+        lambda: gateway.send_media(
+            instance.session_id,
+            data['to'],
+            data['mediaUrl'],
+            data['mediaType'],
+            data.get('caption', ''),
+            instance.instance_type
+        ),
+        'Mídia enviada com sucesso!',
+        'Erro ao enviar mídia!',
+        extra
+    )
+
+# Consultar status de um envio assíncrono
+@whatsapp_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@token_required
+def get_job(current_user, job_id):
+    job = MessageJob.query.get(job_id)
+    
+    if not job:
+        return jsonify({'message': 'Job não encontrado!'}), 404
+    
+    # Verificar permissão
+    if job.user_id != current_user.id and not current_user.is_admin:
+        return jsonify({'message': 'Permissão negada!'}), 403
+    
+    return jsonify({
+        'job': job.to_dict()
+    }), 200
 
 # Mencionar todos em um grupo
 @whatsapp_bp.route('/instances/<int:instance_id>/mention-all', methods=['POST'])
 @token_required
+@rate_limit('send', by='user')
+@rate_limit('send_instance', by='instance')
 def mention_all(current_user, instance_id):
     instance = WhatsAppInstance.query.get(instance_id)
     
@@ -361,33 +474,101 @@ def mention_all(current_user, instance_id):
     if not data or not data.get('groupId') or not data.get('message'):
         return jsonify({'message': 'ID do grupo ou mensagem não fornecidos!'}), 400
     
+    # Membros do grupo pelo cache; se a consulta falhar, o serviço WhatsApp
+    # busca os membros por conta própria (e responde o erro, se houver)
+    release_db_connection()
+    try:
+        participants = group_cache.get(instance, data['groupId']).participants
+    except CircuitOpen:
+        raise
+    except Exception:
+        participants = None
+    
     # Mencionar todos através do serviço WhatsApp
+    return gateway_response(
+        lambda: gateway.mention_all(
+            instance.session_id,
+            data['groupId'],
+            data['message'],
+            data.get('anonymous', False),
+            instance.instance_type,
+            participants
+        ),
+        'Menção enviada com sucesso!',
+        'Erro ao mencionar todos!'
+    )
+
+# Membros de um grupo (do cache; ?refresh=true consulta o serviço WhatsApp)
+@whatsapp_bp.route('/instances/<int:instance_id>/groups/<group_id>/participants', methods=['GET'])
+@token_required
+def get_group_participants(current_user, instance_id, group_id):
+    instance = WhatsAppInstance.query.get(instance_id)
+    
+    if not instance:
+        return jsonify({'message': 'Instância não encontrada!'}), 404
+    
+    # Verificar permissão
+    if instance.user_id != current_user.id and not current_user.is_admin:
+        return jsonify({'message': 'Permissão negada!'}), 403
+    
+    release_db_connection()
     try:
-        response = requests.post(
-            f"{WHATSAPP_SERVICE_URL}/mention-all",
-            json={
-                'sessionId': instance.session_id,
-                'groupId': data['groupId'],
-                'message': data['message'],
-                'anonymous': data.get('anonymous', False),
-                'type': instance.instance_type
-            }
-        )
-        
-        if response.status_code == 200:
-            return jsonify({
-                'message': 'Menção enviada com sucesso!'
-            }), 200
-        else:
-            return jsonify({
-                'message': 'Erro ao mencionar todos!',
-                'error': response.json().get('error')
-            }), 500
+        cached = group_cache.get(instance, group_id, refresh=request.args.get('refresh') == 'true')
+    except GatewayListError as e:
+        return jsonify({
+            'message': 'Erro ao obter membros do grupo!',
+            'error': e.error
+        }), 500
+    except CircuitOpen:
+        raise
     except Exception as e:
         return jsonify({
-            'message': 'Erro ao mencionar todos!',
+            'message': 'Erro ao obter membros do grupo!',
             'error': str(e)
         }), 500
+    
+    return jsonify({'success': True, 'group': cached.to_dict(include_participants=True)}), 200
+
+# Grupos em cache da instância
+@whatsapp_bp.route('/instances/<int:instance_id>/groups/cache', methods=['GET'])
+@token_required
+def get_group_cache(current_user, instance_id):
+    instance = WhatsAppInstance.query.get(instance_id)
+    
+    if not instance:
+        return jsonify({'message': 'Instância não encontrada!'}), 404
+    
+    # Verificar permissão
+    if instance.user_id != current_user.id and not current_user.is_admin:
+        return jsonify({'message': 'Permissão negada!'}), 403
+    
+    return jsonify({
+        'groups': [
+            {**cached.to_dict(), 'expires_in': round(expires_in, 1)}
+            for cached, expires_in in group_cache.groups(instance.id)
+        ],
+        'stats': group_cache.stats()
+    }), 200
+
+# Descartar o cache de grupos da instância (?groupId= para um único grupo)
+@whatsapp_bp.route('/instances/<int:instance_id>/groups/cache', methods=['DELETE'])
+@token_required
+def delete_group_cache(current_user, instance_id):
+    instance = WhatsAppInstance.query.get(instance_id)
+    
+    if not instance:
+        return jsonify({'message': 'Instância não encontrada!'}), 404
+    
+    # Verificar permissão
+    if instance.user_id != current_user.id and not current_user.is_admin:
+        return jsonify({'message': 'Permissão negada!'}), 403
+    
+    removed = group_cache.invalidate(instance.id, request.args.get('groupId'))
+    
+    return jsonify({
+        'message': 'Cache de grupos descartado com sucesso!',
+        'removed': removed
+    }), 200
 
 # Obter contatos
 @whatsapp_bp.route('/instances/<int:instance_id>/contacts', methods=['GET'])
@@ -402,25 +583,8 @@ def get_contacts(current_user, instance_id):
     if instance.user_id != current_user.id and not current_user.is_admin:
         return jsonify({'message': 'Permissão negada!'}), 403
     
-    # Obter contatos através do serviço WhatsApp
-    try:
-        response = requests.get(
-            f"{WHATSAPP_SERVICE_URL}/contacts/{instance.session_id}",
-            params={'type': instance.instance_type}
-        )
-        
-        if response.status_code == 200:
-            return jsonify(response.json()), 200
-        else:
-            return jsonify({
-                'message': 'Erro ao obter contatos!',
-                'error': response.json().get('error')
-            }), 500
-    except Exception as e:
-        return jsonify({
-            'message': 'Erro ao obter contatos!',
-            'error': str(e)
-        }), 500
+    # Obter contatos através do cache do serviço WhatsApp
+    return cached_list_response(instance, 'contacts', 'Erro ao obter contatos!')
 
 # Obter conversas
 @whatsapp_bp.route('/instances/<int:instance_id>/chats', methods=['GET'])
@@ -435,25 +599,8 @@ def get_chats(current_user, instance_id):
     if instance.user_id != current_user.id and not current_user.is_admin:
         return jsonify({'message': 'Permissão negada!'}), 403
     
-    # Obter conversas através do serviço WhatsApp
-    try:
-        response = requests.get(
-            f"{WHATSAPP_SERVICE_URL}/chats/{instance.session_id}",
-            params={'type': instance.instance_type}
-        )
-        
-        if response.status_code == 200:
-            return jsonify(response.json()), 200
-        else:
-            return jsonify({
-                'message': 'Erro ao obter conversas!',
-                'error': response.json().get('error')
-            }), 500
-    except Exception as e:
-        return jsonify({
-            'message': 'Erro ao obter conversas!',
-            'error': str(e)
-        }), 500
+    # Obter conversas através do cache do serviço WhatsApp
+    return cached_list_response(instance, 'chats', 'Erro ao obter conversas!')
 
 # Bloquear contato
 @whatsapp_bp.route('/instances/<int:instance_id>/block-contact', methods=['POST'])
@@ -473,31 +620,15 @@ def block_contact(current_user, instance_id):
     if not data or not data.get('contactId'):
         return jsonify({'message': 'ID do contato não fornecido!'}), 400
     
+    # O status de bloqueio faz parte da lista de contatos em cache
+    contact_cache.invalidate(instance.id)
+    
     # Bloquear contato através do serviço WhatsApp
-    try:
-        response = requests.post(
-            f"{WHATSAPP_SERVICE_URL}/block-contact",
-            json={
-                'sessionId': instance.session_id,
-                'contactId': data['contactId'],
-                'type': instance.instance_type
-            }
-        )
-        
-        if response.status_code == 200:
-            return jsonify({
-                'message': 'Contato bloqueado com sucesso!'
-            }), 200
-        else:
-            return jsonify({
-                'message': 'Erro ao bloquear contato!',
-                'error': response.json().get('error')
-            }), 500
-    except Exception as e:
-        return jsonify({
-            'message': 'Erro ao bloquear contato!',
-            'error': str(e)
-        }), 500
+    return gateway_response(
+        lambda: gateway.block_contact(instance.session_id, data['contactId'], instance.instance_type),
+        'Contato bloqueado com sucesso!',
+        'Erro ao bloquear contato!'
+    )
 
 # Desbloquear contato
 @whatsapp_bp.route('/instances/<int:instance_id>/unblock-contact', methods=['POST'])
@@ -517,31 +648,15 @@ def unblock_contact(current_user, instance_id):
     if not data or not data.get('contactId'):
         return jsonify({'message': 'ID do contato não fornecido!'}), 400
     
+    # O status de bloqueio faz parte da lista de contatos em cache
+    contact_cache.invalidate(instance.id)
+    
     # Desbloquear contato através do serviço WhatsApp
-    try:
-        response = requests.post(
-            f"{WHATSAPP_SERVICE_URL}/unblock-contact",
-            json={
-                'sessionId': instance.session_id,
-                'contactId': data['contactId'],
-                'type': instance.instance_type
-            }
-        )
-        
-        if response.status_code == 200:
-            return jsonify({
-                'message': 'Contato desbloqueado com sucesso!'
-            }), 200
-        else:
-            return jsonify({
-                'message': 'Erro ao desbloquear contato!',
-                'error': response.json().get('error')
-            }), 500
-    except Exception as e:
-        return jsonify({
-            'message': 'Erro ao desbloquear contato!',
-            'error': str(e)
-        }), 500
+    return gateway_response(
+        lambda: gateway.unblock_contact(instance.session_id, data['contactId'], instance.instance_type),
+        'Contato desbloqueado com sucesso!',
+        'Erro ao desbloquear contato!'
+    )
 
 # Configurar webhook para n8n
 @whatsapp_bp.route('/instances/<int:instance_id>/set-webhook', methods=['POST'])
@@ -567,27 +682,325 @@ def set_webhook(current_user, instance_id):
     db.session.commit()
     
     # Configurar webhook através do serviço WhatsApp
+    return gateway_response(
+        lambda: gateway.set_webhook(instance.session_id, data['url'], instance.ignore_groups),
+        'Webhook configurado com sucesso!',
+        'Erro ao configurar webhook!'
+    )
+
+# Histórico de mensagens da instância, do mais recente para o mais antigo
+@whatsapp_bp.route('/instances/<int:instance_id>/messages', methods=['GET'])
+@token_required
+def get_messages(current_user, instance_id):
+    instance = WhatsAppInstance.query.get(instance_id)
+    
+    if not instance:
+        return jsonify({'message': 'Instância não encontrada!'}), 404
+    
+    # Verificar permissão
+    if instance.user_id != current_user.id and not current_user.is_admin:
+        return jsonify({'message': 'Permissão negada!'}), 403
+    
+    # Paginação: ?limit=100&after=<next_cursor>; filtros: ?chat=, ?sender=,
+    # ?type=group|direct, ?from_me=, ?since= e ?until= (ISO 8601, UTC)
     try:
-        response = requests.post(
-            f"{WHATSAPP_SERVICE_URL}/set-webhook",
-            json={
-                'sessionId': instance.session_id,
-                'url': data['url'],
-                'ignoreGroups': instance.ignore_groups
-            }
-        )
+        conditions = [MessageLog.instance_id == instance.id]
         
-        if response.status_code == 200:
-            return jsonify({
-                'message': 'Webhook configurado com sucesso!'
-            }), 200
-        else:
-            return jsonify({
-                'message': 'Erro ao configurar webhook!',
-                'error': response.json().get('error')
-            }), 500
-    except Exception as e:
-        return jsonify({
-            'message': 'Erro ao configurar webhook!',
-            'error': str(e)
-        }), 500
+        if request.args.get('chat'):
+            conditions.append(MessageLog.chat_id == request.args['chat'])
+        if request.args.get('sender'):
+            conditions.append(MessageLog.sender == request.args['sender'])
+        
+        message_type = request.args.get('type')
+        if message_type not in (None, 'group', 'direct'):
+            raise ListingError('Tipo inválido: use group ou direct')
+        if message_type:
+            conditions.append(MessageLog.is_group == (message_type == 'group'))
+        
+        from_me = parse_bool(request.args.get('from_me'))
+        if from_me is not None:
+            conditions.append(MessageLog.from_me == from_me)
+        
+        # O id começa pelo horário da mensagem: os limites de tempo viram
+        # faixas de id e usam os mesmos índices da paginação
+        for param, operator in (('since', '__ge__'), ('until', '__lt__')):
+            if request.args.get(param):
+                try:
+                    moment = datetime.fromisoformat(request.args[param].replace('Z', '+00:00'))
+                except ValueError:
+                    raise ListingError(f"Data inválida em {param}")
+                if moment.tzinfo:
+                    moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+                conditions.append(getattr(MessageLog.id, operator)(message_log_id_at(moment)))
+        
+        return stream_listing('messages', MessageLog, MessageLog.PUBLIC_FIELDS, conditions, descending=True, string_ids=True)
+    except ListingError as e:
+        return jsonify({'message': str(e)}), 400
+
+# Eventos em tempo real das instâncias do usuário (Server-Sent Events)
+#
+# Começa com o estado atual de cada instância (e o QR code pendente) e segue
+# com os eventos `state`, `qr` e `messages` (mensagens recebidas e enviadas
+# desde o último evento). Para o EventSource do navegador, o token vai em
+# ?token=; admins podem usar ?all=true. O fluxo é encerrado depois de
+# LIVE_EVENTS_MAX_DURATION segundos e o navegador reconecta sozinho.
+@whatsapp_bp.route('/events/stream', methods=['GET'])
+@token_from_query
+@token_required
+def event_stream(current_user):
+    if not live_events.enabled:
+        return jsonify({'message': 'Eventos em tempo real desativados!'}), 404
+    
+    # Num worker síncrono cada painel aberto ocuparia um processo inteiro
+    if not streaming_supported(request.environ):
+        return jsonify({'message': 'Eventos em tempo real exigem o modo assíncrono (gevent)!'}), 501
+    
+    all_users = current_user.is_admin and request.args.get('all') == 'true'
+    query = db.select(WhatsAppInstance.id, WhatsAppInstance.session_id, WhatsAppInstance.is_connected)
+    if not all_users:
+        query = query.where(WhatsAppInstance.user_id == current_user.id)
+    rows = db.session.execute(query).all()
+    release_db_connection()
+    
+    # A inscrição vem antes do retrato: nenhum evento se perde entre os dois
+    subscriber = live_events.subscribe(None if all_users else current_user.id)
+    if subscriber is None:
+        response = jsonify({'message': 'Limite de conexões de eventos atingido. Tente novamente.'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+    
+    snapshot = []
+    for instance_id, session_id, is_connected in rows:
+        state, qr = live_events.state_of(session_id)
+        state = state or ('connected' if is_connected else 'disconnected')
+        snapshot.append(format_event('state', {'instanceId': instance_id, 'state': state, 'isConnected': state == 'connected'}))
+        if qr:
+            snapshot.append(format_event('qr', {'instanceId': instance_id, 'qr': qr}))
+    
+    def stream():
+        yield b'retry: 2000\n\n' + b''.join(snapshot)
+        deadline = time.monotonic() + live_events.max_duration
+        while not subscriber.overflowed and time.monotonic() < deadline:
+            message = subscriber.get(live_events.heartbeat)
+            # Comentário de heartbeat: mantém a conexão aberta em proxies
+            yield message if message is not None else b': ping\n\n'
+    
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Chamado pelo servidor também quando o navegador fecha a conexão
+    response.call_on_close(lambda: live_events.unsubscribe(subscriber))
+    return response
+
+# Estado dos disjuntores do serviço WhatsApp, um por nó (apenas admin). O
+# estado é mantido por processo; com vários workers, cada um responde pelo seu.
+@whatsapp_bp.route('/gateway/circuit', methods=['GET'])
+@token_required
+@admin_required
+def get_gateway_circuit(current_user):
+    return jsonify({
+        'pid': os.getpid(),
+        'circuit': gateway.breaker.to_dict() if gateway.breaker else None,
+        'nodes': {
+            url: breaker.to_dict()
+            for url, breaker in gateway.breakers.items()
+        }
+    }), 200
+
+# Fecha os disjuntores manualmente (apenas admin); ?url= fecha só o de um nó
+@whatsapp_bp.route('/gateway/circuit/reset', methods=['POST'])
+@token_required
+@admin_required
+def reset_gateway_circuit(current_user):
+    if not gateway.breaker:
+        return jsonify({'message': 'Disjuntor desativado!'}), 400
+    
+    url = request.args.get('url')
+    breakers = [gateway.breaker_for(url.rstrip('/'))] if url else list(gateway.breakers.values())
+    for breaker in breakers:
+        breaker.reset()
+    
+    return jsonify({
+        'message': 'Disjuntor fechado com sucesso!',
+        'circuit': gateway.breaker.to_dict()
+    }), 200
+
+# Dados de um nó recebidos pela API de administração
+def gateway_node_fields(data, node=None):
+    fields = {}
+    for field in ('name', 'url'):
+        if field in data or node is None:
+            value = str(data.get(field) or '').strip()
+            if not value:
+                raise ValueError(f"Campo {field} não fornecido!")
+            fields[field] = value.rstrip('/') if field == 'url' else value
+    
+    if 'url' in fields and not fields['url'].startswith(('http://', 'https://')):
+        raise ValueError('URL do nó inválida!')
+    
+    try:
+        if 'weight' in data:
+            fields['weight'] = int(data['weight'])
+            if fields['weight'] < 1:
+                raise ValueError
+        if 'max_sessions' in data:
+            fields['max_sessions'] = int(data['max_sessions']) if data['max_sessions'] is not None else None
+            if fields['max_sessions'] is not None and fields['max_sessions'] < 1:
+                raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError('weight e max_sessions devem ser inteiros positivos!')
+    
+    return fields
+
+# Nós do serviço WhatsApp, com sessões e migrações pendentes (apenas admin)
+@whatsapp_bp.route('/gateway/nodes', methods=['GET'])
+@token_required
+@admin_required
+def get_gateway_nodes(current_user):
+    sessions, pending = gateway_nodes.sessions_per_node()
+    nodes = []
+    for node in GatewayNode.query.order_by(GatewayNode.id).all():
+        breaker = gateway.breaker_for(node.url)
+        nodes.append({
+            **node.to_dict(),
+            'sessions': sessions.get(node.id, 0),
+            'pending_migrations': pending.get(node.id, 0),
+            'circuit': breaker.state if breaker else None
+        })
+    
+    return jsonify({
+        'assignment': gateway_nodes.strategy,
+        'nodes': nodes,
+        'unassigned': sessions.get(None, 0)
+    }), 200
+
+# Cadastrar nó (apenas admin)
+@whatsapp_bp.route('/gateway/nodes', methods=['POST'])
+@token_required
+@admin_required
+def create_gateway_node(current_user):
+    try:
+        fields = gateway_node_fields(request.get_json() or {})
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    if GatewayNode.query.filter((GatewayNode.name == fields['name']) | (GatewayNode.url == fields['url'])).first():
+        return jsonify({'message': 'Já existe um nó com esse nome ou URL!'}), 409
+    
+    node = GatewayNode(**fields)
+    db.session.add(node)
+    db.session.commit()
+    gateway_nodes.refresh()
+    
+    return jsonify({
+        'message': 'Nó cadastrado com sucesso!',
+        'node': node.to_dict()
+    }), 201
+
+# Alterar nome, URL, peso ou limite de sessões de um nó (apenas admin)
+@whatsapp_bp.route('/gateway/nodes/<int:node_id>', methods=['PUT'])
+@token_required
+@admin_required
+def update_gateway_node(current_user, node_id):
+    node = db.session.get(GatewayNode, node_id)
+    
+    if not node:
+        return jsonify({'message': 'Nó não encontrado!'}), 404
+    
+    try:
+        fields = gateway_node_fields(request.get_json() or {}, node)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    for field, value in fields.items():
+        setattr(node, field, value)
+    db.session.commit()
+    gateway_nodes.refresh()
+    
+    return jsonify({
+        'message': 'Nó atualizado com sucesso!',
+        'node': node.to_dict()
+    }), 200
+
+# Remover nó sem sessões (apenas admin); drene o nó antes
+@whatsapp_bp.route('/gateway/nodes/<int:node_id>', methods=['DELETE'])
+@token_required
+@admin_required
+def delete_gateway_node(current_user, node_id):
+    node = db.session.get(GatewayNode, node_id)
+    
+    if not node:
+        return jsonify({'message': 'Nó não encontrado!'}), 404
+    
+    in_use = WhatsAppInstance.query.filter(
+        (WhatsAppInstance.gateway_node_id == node_id) | (WhatsAppInstance.pending_gateway_node_id == node_id)
+    ).count()
+    if in_use:
+        return jsonify({'message': f"O nó ainda tem {in_use} sessões, drene-o antes de remover!"}), 409
+    
+    db.session.delete(node)
+    db.session.commit()
+    gateway_nodes.refresh()
+    
+    return jsonify({
+        'message': 'Nó removido com sucesso!'
+    }), 200
+
+# Drenar nó: deixa de receber sessões novas e as suas são migradas para os
+# outros nós em segundo plano (apenas admin)
+@whatsapp_bp.route('/gateway/nodes/<int:node_id>/drain', methods=['POST'])
+@token_required
+@admin_required
+def drain_gateway_node(current_user, node_id):
+    node = db.session.get(GatewayNode, node_id)
+    
+    if not node:
+        return jsonify({'message': 'Nó não encontrado!'}), 404
+    
+    scheduled, unplaced = gateway_nodes.drain(node)
+    
+    return jsonify({
+        'message': 'Drenagem do nó iniciada!',
+        'node': node.to_dict(),
+        'scheduled': scheduled,
+        'unplaced': unplaced
+    }), 200
+
+# Voltar a enviar sessões novas ao nó (apenas admin)
+@whatsapp_bp.route('/gateway/nodes/<int:node_id>/activate', methods=['POST'])
+@token_required
+@admin_required
+def activate_gateway_node(current_user, node_id):
+    node = db.session.get(GatewayNode, node_id)
+    
+    if not node:
+        return jsonify({'message': 'Nó não encontrado!'}), 404
+    
+    node.status = 'active'
+    db.session.commit()
+    gateway_nodes.refresh()
+    
+    return jsonify({
+        'message': 'Nó ativado com sucesso!',
+        'node': node.to_dict()
+    }), 200
+
+# Redistribuir as sessões entre os nós ativos (apenas admin); ?dry_run=true
+# retorna as migrações sem agendá-las
+@whatsapp_bp.route('/gateway/rebalance', methods=['POST'])
+@token_required
+@admin_required
+def rebalance_gateway_nodes(current_user):
+    dry_run = request.args.get('dry_run') == 'true'
+    moves = gateway_nodes.rebalance(dry_run=dry_run)
+    
+    return jsonify({
+        'message': 'Plano de migração calculado!' if dry_run else 'Migração das sessões agendada!',
+        'dry_run': dry_run,
+        'scheduled': len(moves),
+        'moves': [
+            {'instance_id': instance_id, 'from': source, 'to': target}
+            for instance_id, source, target in moves
+        ]
+    }), 200
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import time
+from src.services.cache import TTLCache
+from src.services.shared_table import SharedTable
+
+# Cópia somente leitura dos dados do usuário autenticado
+#
+# É o objeto entregue como current_user pelo token_required. Rotas que
+# alteram o usuário devem carregar o registro do banco pelo id.
+class CachedUser:
+    def __init__(self, user, loaded_at):
+        self.loaded_at = loaded_at
+        self.id = user.id
+        self.email = user.email
+        self.name = user.name
+        self.is_admin = user.is_admin
+        self.is_active = user.is_active
+        self.email_confirmed = user.email_confirmed
+        self._data = user.to_dict()
+
+    def to_dict(self):
+        return dict(self._data)
+
+# Cache por processo dos tokens JWT já decodificados e dos usuários ativos
+#
+# Alterar um usuário grava o instante da alteração numa SharedTable em
+# AUTH_CACHE_STAMPS_PATH, compartilhada pelos workers; cada processo descarta
+# a sua cópia do usuário lida do banco antes desse instante. Quando falta
+# espaço, a posição reaproveitada é a de alteração mais antiga; alterações
+# com mais de AUTH_CACHE_TTL segundos não importam mais, pois nenhuma cópia
+# em cache é tão antiga.
+class AuthCache:
+    def __init__(self, app=None):
+        self.tokens = TTLCache()
+        self.users = TTLCache()
+        self.stamps = SharedTable()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AUTH_CACHE_SIZE', 4096)
+        app.config.setdefault('AUTH_CACHE_TTL', 30)
+        app.config.setdefault('AUTH_CACHE_STAMPS_PATH', os.path.join(tempfile.gettempdir(), 'sie_api_auth_stamps.bin'))
+        app.config.setdefault('AUTH_CACHE_STAMPS_SLOTS', 8192)
+
+        size = int(app.config['AUTH_CACHE_SIZE'])
+        ttl = float(app.config['AUTH_CACHE_TTL'])
+        self.tokens = TTLCache(size, ttl)
+        self.users = TTLCache(size, ttl)
+        self.stamps.open(app.config['AUTH_CACHE_STAMPS_PATH'], app.config['AUTH_CACHE_STAMPS_SLOTS'])
+        app.extensions['auth_cache'] = self
+
+    def get_token(self, token):
+        return self.tokens.get(token)
+
+    def set_token(self, token, payload):
+        # Nunca manter o token em cache além da sua expiração
+        ttl = self.tokens.ttl
+        if 'exp' in payload:
+            ttl = min(ttl, payload['exp'] - time.time())
+        if ttl > 0:
+            self.tokens.set(token, payload, ttl)
+
+    def get_user(self, user_id):
+        cached_user = self.users.get(user_id)
+        if cached_user is None:
+            return None
+
+        # Alterado (em qualquer processo) depois da leitura do banco
+        changed_at = self.stamps.get(f"user:{user_id}") if self.stamps.is_open else None
+        if changed_at is not None and changed_at >= cached_user.loaded_at:
+            self.users.delete(user_id)
+            return None
+        return cached_user
+
+    # `loaded_at` é o time.time() de antes da consulta ao banco, para que uma
+    # alteração gravada durante a consulta também invalide a cópia
+    def set_user(self, user, loaded_at=None):
+        cached_user = CachedUser(user, time.time() if loaded_at is None else loaded_at)
+        self.users.set(user.id, cached_user)
+        return cached_user
+
+    # Chamado depois do commit que alterou o usuário
+    def invalidate_user(self, user_id):
+        self.users.delete(user_id)
+        if self.stamps.is_open:
+            self.stamps.update(f"user:{user_id}", lambda current, now: (None, now))
+
+    def stats(self):
+        return {
+            'tokens': self.tokens.stats(),
+            'users': self.users.stats()
+        }
+
+auth_cache = AuthCache()
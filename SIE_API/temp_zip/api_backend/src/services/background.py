@@ -0,0 +1,118 @@
+import fcntl
+import os
+import threading
+import time
+
+# Trava de arquivo que elege um único processo (entre os workers do gunicorn
+# de um servidor) para uma tarefa. Quem consegue a trava fica com ela até
+# encerrar; se o processo morrer, o sistema a libera e outro worker assume na
+# próxima tentativa.
+class LeaderLock:
+    def __init__(self, path=None):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self):
+        if self._fd is not None:
+            return True
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+# Liberações de reservas presas (fila de envio, campanhas) por tempo limite
+# da reserva: com 300 s de limite, uma verificação a cada 30 s
+STALE_CHECKS_PER_TIMEOUT = 10
+
+# Tarefa de manutenção que roda no máximo a cada `interval` segundos por
+# processo, qualquer que seja o número de threads que chamam due()
+class Periodic:
+    def __init__(self, interval=0.0):
+        self.interval = interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def due(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next:
+                return False
+            self._next = now + self.interval
+            return True
+
+# Base para tarefas em segundo plano executadas dentro do processo da API
+#
+# Subclasses implementam run_once(), que roda dentro de um app context e
+# retorna True quando processou algo (a próxima iteração começa logo em
+# seguida) ou False quando não havia trabalho (a thread espera `interval`).
+class BackgroundWorker:
+    name = 'background_worker'
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 1.0
+        self.threads = 1
+        self._stop_event = threading.Event()
+        self._threads = []
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions[self.name] = self
+
+    def start(self):
+        if self.running:
+            return
+
+        self._stop_event.clear()
+        self._threads = []
+        for index in range(self.threads):
+            thread = threading.Thread(
+                target=self._run,
+                name=f"{self.name}-{index}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            did_work = False
+            try:
+                with self.app.app_context():
+                    did_work = self.run_once()
+            except Exception:
+                self.app.logger.exception(f"Erro na tarefa em segundo plano {self.name}")
+
+            if not did_work:
+                self._stop_event.wait(self.interval)
+
+    def run_once(self):
+        raise NotImplementedError
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Cache em memória com limite de tamanho (LRU) e expiração por entrada (TTL)
+#
+# É local a cada processo e seguro para uso entre threads. Os contadores de
+# acertos/erros ficam disponíveis em stats().
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    # Entradas válidas como (chave, valor, segundos restantes); cópia que não
+    # conta como acesso para o LRU nem para as estatísticas
+    def items(self):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, value, expires_at - now)
+                for key, (value, expires_at) in self._data.items()
+                if expires_at > now
+            ]
+
+    # Segundos até a expiração da chave (None se ausente ou expirada)
+    def expires_in(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[1] - time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+# Locks por chave em número fixo (hash da chave % stripes)
+#
+# Chaves diferentes podem dividir o mesmo lock, o que só faz uma esperar a
+# outra; em troca, a memória não cresce com o número de chaves (que vêm de
+# clientes e de eventos). Não segure dois locks ao mesmo tempo.
+class KeyLocks:
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __call__(self, key):
+        return self._locks[hash(key) % len(self._locks)]
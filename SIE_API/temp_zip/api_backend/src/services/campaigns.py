@@ -0,0 +1,410 @@
+import datetime
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from sqlalchemy import insert, update
+from src.models.user import db, Campaign, CampaignRecipient, WhatsAppInstance
+from src.services.background import BackgroundWorker, Periodic, STALE_CHECKS_PER_TIMEOUT
+from src.services.whatsapp_gateway import gateway
+from src.services.circuit_breaker import CircuitOpen
+from src.services.media_store import media_store, is_remote_url
+from src.services.shared_table import SharedTable
+
+# Variáveis do template: {{nome}}, {{ pedido }}
+TEMPLATE_VARIABLE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+class CampaignError(ValueError):
+    pass
+
+def template_variables(template):
+    return set(TEMPLATE_VARIABLE.findall(template or ''))
+
+def render_template(template, variables):
+    def replace(match):
+        name = match.group(1)
+        if name not in variables:
+            raise CampaignError(f"Variável ausente no destinatário: {name}")
+        return str(variables[name])
+    return TEMPLATE_VARIABLE.sub(replace, template)
+
+# Intervalo mínimo entre envios de cada instância, compartilhado entre os
+# workers do gunicorn
+#
+# Cada envio reserva o próximo horário livre da instância: 1 / rate segundos
+# depois, mais um atraso aleatório de até `jitter` segundos, para que os envios
+# não saiam em intervalos exatos. O horário fica numa SharedTable em
+# CAMPAIGN_PACING_PATH, então o limite vale para o servidor, não por processo.
+class InstancePacer:
+    def __init__(self):
+        self.table = SharedTable()
+        self._previous = {}
+        self._lock = threading.Lock()
+
+    def open(self, path, slots):
+        self.table.open(path, slots)
+
+    def reserve(self, instance_id, rate, jitter=0.0):
+        if rate <= 0:
+            return True
+
+        def claim(next_at, now):
+            if next_at is not None and next_at > now:
+                return None, None
+            reserved = now + 1.0 / rate + random.uniform(0.0, max(jitter, 0.0))
+            return (next_at or 0.0, reserved), reserved
+
+        reservation = self.table.update(f"pacer:{instance_id}", claim)
+        if reservation is None:
+            return False
+        with self._lock:
+            self._previous[instance_id] = reservation
+        return True
+
+    # Devolve uma reserva que acabou não sendo usada (se nenhum outro envio
+    # reservou a instância depois dela)
+    def release(self, instance_id):
+        with self._lock:
+            reservation = self._previous.pop(instance_id, None)
+        if reservation is None:
+            return
+        previous, reserved = reservation
+        self.table.update(f"pacer:{instance_id}", lambda next_at, now: (None, previous if next_at == reserved else None))
+
+# Envio das campanhas em segundo plano
+#
+# Os destinatários ficam na tabela campaign_recipients e são reservados um a
+# um com UPDATE condicional (como na fila de envio), então vários processos
+# podem trabalhar na mesma campanha. Cada campanha divide os envios entre as
+# instâncias em instance_ids, respeitando rate_per_instance e jitter em cada
+# uma; as campanhas e instâncias ficam em memória por CAMPAIGN_REFRESH_INTERVAL
+# segundos, não são consultadas por destinatário. Campanhas agendadas passam a
+# 'running' em scheduled_at.
+class CampaignRunner(BackgroundWorker):
+    name = 'campaign_runner'
+
+    def init_app(self, app):
+        app.config.setdefault('CAMPAIGN_WORKERS', 2)
+        app.config.setdefault('CAMPAIGN_POLL_INTERVAL', 0.5)
+        app.config.setdefault('CAMPAIGN_REFRESH_INTERVAL', 1.0)
+        app.config.setdefault('CAMPAIGN_RATE_PER_INSTANCE', 1.0)
+        app.config.setdefault('CAMPAIGN_MAX_RATE_PER_INSTANCE', 10.0)
+        app.config.setdefault('CAMPAIGN_JITTER', 1.0)
+        app.config.setdefault('CAMPAIGN_MAX_RECIPIENTS', 100000)
+        app.config.setdefault('CAMPAIGN_INSERT_BATCH_SIZE', 1000)
+        app.config.setdefault('CAMPAIGN_MAX_ATTEMPTS', 3)
+        app.config.setdefault('CAMPAIGN_RETRY_BACKOFF', 30.0)
+        app.config.setdefault('CAMPAIGN_LOCK_TIMEOUT', 300)
+        app.config.setdefault('CAMPAIGN_PACING_PATH', os.path.join(tempfile.gettempdir(), 'sie_api_campaign_pacing.bin'))
+        app.config.setdefault('CAMPAIGN_PACING_SLOTS', 8192)
+
+        super().init_app(app)
+        self.threads = int(app.config['CAMPAIGN_WORKERS'])
+        self.interval = float(app.config['CAMPAIGN_POLL_INTERVAL'])
+        self.refresh_interval = float(app.config['CAMPAIGN_REFRESH_INTERVAL'])
+        self.default_rate = float(app.config['CAMPAIGN_RATE_PER_INSTANCE'])
+        self.max_rate = float(app.config['CAMPAIGN_MAX_RATE_PER_INSTANCE'])
+        self.default_jitter = float(app.config['CAMPAIGN_JITTER'])
+        self.max_recipients = int(app.config['CAMPAIGN_MAX_RECIPIENTS'])
+        self.insert_batch_size = int(app.config['CAMPAIGN_INSERT_BATCH_SIZE'])
+        self.max_attempts = int(app.config['CAMPAIGN_MAX_ATTEMPTS'])
+        self.retry_backoff = float(app.config['CAMPAIGN_RETRY_BACKOFF'])
+        self.lock_timeout = int(app.config['CAMPAIGN_LOCK_TIMEOUT'])
+        self.stale_check = Periodic(self.lock_timeout / STALE_CHECKS_PER_TIMEOUT)
+        self.pacer = InstancePacer()
+        self.pacer.open(app.config['CAMPAIGN_PACING_PATH'], app.config['CAMPAIGN_PACING_SLOTS'])
+        self._turn = 0
+        self._campaigns = []
+        self._instances = {}
+        self._loaded_at = 0.0
+        self._snapshot_lock = threading.Lock()
+
+    # Grava os destinatários em lotes (uma transação; quem chama faz o commit).
+    # `rows` é um iterável de (telefone, dict de variáveis).
+    def add_recipients(self, campaign, rows):
+        required = template_variables(campaign.message)
+        now = datetime.datetime.utcnow()
+        added = 0
+        batch = []
+
+        for number, (phone, variables) in enumerate(rows, start=1):
+            phone = str(phone or '').strip()
+            if not phone:
+                raise CampaignError(f"Destinatário {number}: número não fornecido")
+            missing = required - set(variables) - {'to'}
+            if missing:
+                raise CampaignError(f"Destinatário {number}: variáveis ausentes: {', '.join(sorted(missing))}")
+            if campaign.total_recipients + added >= self.max_recipients:
+                raise CampaignError(f"Limite de {self.max_recipients} destinatários por campanha")
+
+            batch.append({
+                'campaign_id': campaign.id,
+                'phone': phone[:64],
+                'variables': json.dumps(variables, ensure_ascii=False) if variables else None,
+                'status': 'pending',
+                'attempts': 0,
+                'next_attempt_at': now
+            })
+            added += 1
+            if len(batch) == self.insert_batch_size:
+                db.session.execute(insert(CampaignRecipient), batch)
+                batch = []
+
+        if batch:
+            db.session.execute(insert(CampaignRecipient), batch)
+        campaign.total_recipients = (campaign.total_recipients or 0) + added
+        return added
+
+    def run_once(self):
+        campaigns, instances = self._snapshot()
+
+        # Serviço WhatsApp fora do ar: espera o disjuntor
+        if not campaigns or gateway.unavailable_for() > 0:
+            return False
+
+        now = datetime.datetime.utcnow()
+        # Revezamento entre campanhas para que uma não segure as demais
+        self._turn = (self._turn + 1) % len(campaigns)
+        for campaign in campaigns[self._turn:] + campaigns[:self._turn]:
+            available = [
+                instances[instance_id] for instance_id in json.loads(campaign.instance_ids)
+                if instance_id in instances and instances[instance_id].user_id == campaign.user_id
+            ]
+            if not available:
+                self._set_status(campaign.id, 'running', 'paused', last_error='Nenhuma instância disponível')
+                continue
+
+            exhausted = False
+            for instance in available:
+                if not self.pacer.reserve(instance.id, campaign.rate_per_instance, campaign.jitter or 0.0):
+                    continue
+
+                recipient = self._claim_next(campaign.id, instance.id, now)
+                if recipient is None:
+                    self.pacer.release(instance.id)
+                    exhausted = True
+                    break
+
+                self._process(campaign, instance, recipient)
+                return True
+
+            if exhausted:
+                self._complete_if_done(campaign.id)
+
+        return False
+
+    # Campanhas em andamento e suas instâncias, recarregadas a cada
+    # CAMPAIGN_REFRESH_INTERVAL segundos (e não a cada envio), junto com a
+    # ativação das agendadas. Envios presos são liberados a cada
+    # CAMPAIGN_LOCK_TIMEOUT / STALE_CHECKS_PER_TIMEOUT segundos.
+    def _snapshot(self):
+        with self._snapshot_lock:
+            if time.monotonic() - self._loaded_at < self.refresh_interval:
+                return self._campaigns, self._instances
+
+            now = datetime.datetime.utcnow()
+            self._start_scheduled(now)
+            if self.stale_check.due():
+                self._release_stale(now)
+
+            campaigns = db.session.execute(
+                db.select(
+                    Campaign.id, Campaign.user_id, Campaign.instance_ids, Campaign.message,
+                    Campaign.media_url, Campaign.media_type, Campaign.rate_per_instance, Campaign.jitter
+                )
+                .where(Campaign.status == 'running')
+                .order_by(Campaign.id)
+            ).all()
+
+            instance_ids = {instance_id for campaign in campaigns for instance_id in json.loads(campaign.instance_ids)}
+            instances = {
+                row.id: row for row in db.session.execute(
+                    db.select(WhatsAppInstance.id, WhatsAppInstance.user_id, WhatsAppInstance.session_id, WhatsAppInstance.instance_type)
+                    .where(WhatsAppInstance.id.in_(instance_ids))
+                )
+            } if instance_ids else {}
+            db.session.commit()
+
+            self._campaigns, self._instances = campaigns, instances
+            self._loaded_at = time.monotonic()
+            return campaigns, instances
+
+    # Força a releitura das campanhas na próxima passada
+    def refresh(self):
+        with self._snapshot_lock:
+            self._loaded_at = 0.0
+
+    def _start_scheduled(self, now):
+        db.session.execute(
+            update(Campaign)
+            .where(Campaign.status == 'scheduled', Campaign.scheduled_at <= now)
+            .values(status='running', started_at=now)
+        )
+        db.session.commit()
+
+    def _release_stale(self, now):
+        db.session.execute(
+            update(CampaignRecipient)
+            .where(
+                CampaignRecipient.status == 'sending',
+                CampaignRecipient.locked_at < now - datetime.timedelta(seconds=self.lock_timeout)
+            )
+            .values(status='pending', locked_at=None)
+        )
+        db.session.commit()
+
+    # Reserva o próximo destinatário pendente da campanha para a instância.
+    # A consulta confere o status da campanha, então uma pausa vale na hora.
+    def _claim_next(self, campaign_id, instance_id, now):
+        for _ in range(5):
+            recipient = db.session.execute(
+                db.select(
+                    CampaignRecipient.id, CampaignRecipient.phone,
+                    CampaignRecipient.variables, CampaignRecipient.attempts
+                )
+                .join(Campaign, Campaign.id == CampaignRecipient.campaign_id)
+                .where(
+                    CampaignRecipient.campaign_id == campaign_id,
+                    CampaignRecipient.status == 'pending',
+                    CampaignRecipient.next_attempt_at <= now,
+                    Campaign.status == 'running'
+                )
+                .order_by(CampaignRecipient.id)
+                .limit(1)
+            ).first()
+            if recipient is None:
+                db.session.commit()
+                return None
+
+            result = db.session.execute(
+                update(CampaignRecipient)
+                .where(CampaignRecipient.id == recipient.id, CampaignRecipient.status == 'pending')
+                .values(
+                    status='sending',
+                    locked_at=now,
+                    instance_id=instance_id,
+                    attempts=CampaignRecipient.attempts + 1
+                )
+            )
+            db.session.commit()
+            if result.rowcount == 1:
+                return recipient
+
+        # Disputa com outros workers pelos mesmos destinatários: tenta na próxima passada
+        return None
+
+    def _process(self, campaign, instance, recipient):
+        attempts = recipient.attempts + 1
+        variables = json.loads(recipient.variables) if recipient.variables else {}
+        variables.setdefault('to', recipient.phone)
+
+        try:
+            text = render_template(campaign.message, variables)
+        except CampaignError as e:
+            self._finish(campaign.id, recipient.id, 'failed', str(e))
+            return
+
+        # Campanhas gravadas antes da validação de media_url podem ter caminhos locais
+        if campaign.media_url and not (is_remote_url(campaign.media_url) or media_store.owns(campaign.media_url)):
+            self._finish(campaign.id, recipient.id, 'failed', 'Mídia não permitida')
+            return
+
+        try:
+            if campaign.media_url:
+                response = gateway.send_media(
+                    instance.session_id,
+                    recipient.phone,
+                    campaign.media_url,
+                    campaign.media_type,
+                    text,
+                    instance.instance_type
+                )
+            else:
+                response = gateway.send_message(instance.session_id, recipient.phone, text, instance.instance_type)
+        except CircuitOpen as e:
+            # Não conta a tentativa: o serviço está fora do ar, não o destinatário
+            self._reschedule(recipient.id, max(e.retry_after, 1), attempts - 1)
+            return
+        except Exception as e:
+            self._retry(campaign.id, recipient.id, attempts, str(e))
+            return
+
+        if response.status_code == 200:
+            self._finish(campaign.id, recipient.id, 'sent')
+        elif 400 <= response.status_code < 500:
+            self._finish(campaign.id, recipient.id, 'failed', self._response_error(response))
+        else:
+            self._retry(campaign.id, recipient.id, attempts, self._response_error(response))
+
+    def _retry(self, campaign_id, recipient_id, attempts, error):
+        if attempts >= self.max_attempts:
+            self._finish(campaign_id, recipient_id, 'failed', error)
+            return
+
+        self._reschedule(recipient_id, self.retry_backoff * (2 ** (attempts - 1)), attempts, error)
+
+    def _reschedule(self, recipient_id, delay, attempts, error=None):
+        values = {
+            'status': 'pending',
+            'locked_at': None,
+            'attempts': attempts,
+            'next_attempt_at': datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+        }
+        if error is not None:
+            values['last_error'] = error
+        db.session.execute(update(CampaignRecipient).where(CampaignRecipient.id == recipient_id).values(**values))
+        db.session.commit()
+
+    # Resultado final do destinatário e contador da campanha, na mesma transação
+    def _finish(self, campaign_id, recipient_id, status, error=None):
+        db.session.execute(
+            update(CampaignRecipient)
+            .where(CampaignRecipient.id == recipient_id)
+            .values(
+                status=status,
+                locked_at=None,
+                last_error=error,
+                sent_at=datetime.datetime.utcnow() if status == 'sent' else None
+            )
+        )
+
+        counter = Campaign.sent_count if status == 'sent' else Campaign.failed_count
+        db.session.execute(
+            update(Campaign)
+            .where(Campaign.id == campaign_id)
+            .values({counter: counter + 1, Campaign.updated_at: Campaign.updated_at})
+        )
+        db.session.commit()
+
+    def _complete_if_done(self, campaign_id):
+        remaining = db.session.execute(
+            db.select(CampaignRecipient.id)
+            .where(
+                CampaignRecipient.campaign_id == campaign_id,
+                CampaignRecipient.status.in_(('pending', 'sending'))
+            )
+            .limit(1)
+        ).first()
+        db.session.commit()
+        if remaining is None:
+            self._set_status(campaign_id, 'running', 'completed', completed_at=datetime.datetime.utcnow())
+
+    def _set_status(self, campaign_id, current, status, **values):
+        db.session.execute(
+            update(Campaign)
+            .where(Campaign.id == campaign_id, Campaign.status == current)
+            .values(status=status, **values)
+        )
+        db.session.commit()
+        self.refresh()
+
+    def _response_error(self, response):
+        try:
+            return response.json().get('error') or f"HTTP {response.status_code}"
+        except ValueError:
+            return f"HTTP {response.status_code}"
+
+campaign_runner = CampaignRunner()
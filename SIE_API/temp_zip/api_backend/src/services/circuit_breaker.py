@@ -0,0 +1,133 @@
+import collections
+import threading
+import time
+
+class CircuitOpen(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuito '{name}' aberto")
+        self.name = name
+        self.retry_after = retry_after
+
+# Disjuntor (circuit breaker) por processo
+#
+# Fechado: as chamadas passam e os resultados dos últimos `window` segundos são
+# contados. Com pelo menos `min_calls` chamadas e taxa de falha >= `failure_rate`,
+# abre. Aberto: as chamadas falham na hora com CircuitOpen até passar
+# `open_timeout`. Meio-aberto: uma única verificação (`probe`) decide se
+# fecha de novo ou volta a abrir, dobrando o tempo aberto até `max_open_timeout`.
+class CircuitBreaker:
+    def __init__(self, name, failure_rate=0.5, min_calls=5, window=30,
+                 open_timeout=5, max_open_timeout=60, probe=None, on_change=None):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_timeout = open_timeout
+        self.max_open_timeout = max_open_timeout
+        self.probe = probe
+        self.on_change = on_change
+
+        self.state = 'closed'
+        self.opened_at = None
+        self.current_timeout = open_timeout
+        self.last_failure = None
+        self.rejected = 0
+        self._results = collections.deque()
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._results and self._results[0][0] < now - self.window:
+            self._results.popleft()
+
+    def _set_state(self, state, now):
+        previous, self.state = self.state, state
+        if state == 'open':
+            self.opened_at = now
+        elif state == 'closed':
+            self.opened_at = None
+            self.current_timeout = self.open_timeout
+            self._results.clear()
+        if self.on_change and previous != state:
+            self.on_change(self, previous, state)
+
+    def retry_after(self):
+        if self.state != 'open':
+            return 0
+        return max(0.0, self.opened_at + self.current_timeout - time.monotonic())
+
+    # Chamado antes de cada chamada protegida; levanta CircuitOpen se aberto
+    def before_call(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == 'closed':
+                return
+
+            if self.state == 'open' and now < self.opened_at + self.current_timeout:
+                self.rejected += 1
+                raise CircuitOpen(self.name, self.retry_after())
+
+            # Tempo esgotado: apenas uma chamada faz a verificação
+            if self._probing:
+                self.rejected += 1
+                raise CircuitOpen(self.name, 1)
+            self._set_state('half_open', now)
+            self._probing = True
+
+        try:
+            healthy = self.probe() if self.probe else True
+        except Exception as e:
+            self.last_failure = str(e)
+            healthy = False
+
+        with self._lock:
+            self._probing = False
+            now = time.monotonic()
+            if healthy:
+                self._set_state('closed', now)
+                return
+            self.current_timeout = min(self.current_timeout * 2, self.max_open_timeout)
+            self._set_state('open', now)
+            self.rejected += 1
+            raise CircuitOpen(self.name, self.retry_after())
+
+    def record_success(self):
+        with self._lock:
+            now = time.monotonic()
+            self._results.append((now, True))
+            self._prune(now)
+
+    def record_failure(self, error=None):
+        with self._lock:
+            now = time.monotonic()
+            self.last_failure = error
+            self._results.append((now, False))
+            self._prune(now)
+
+            if self.state != 'closed':
+                return
+            failures = sum(1 for _, ok in self._results if not ok)
+            if len(self._results) >= self.min_calls and failures / len(self._results) >= self.failure_rate:
+                self._set_state('open', now)
+
+    def reset(self):
+        with self._lock:
+            self._set_state('closed', time.monotonic())
+
+    def to_dict(self):
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            failures = sum(1 for _, ok in self._results if not ok)
+            return {
+                'name': self.name,
+                'state': self.state,
+                'retry_after': round(self.retry_after(), 3),
+                'open_timeout': self.current_timeout,
+                'window_seconds': self.window,
+                'calls_in_window': len(self._results),
+                'failures_in_window': failures,
+                'failure_rate': round(failures / len(self._results), 3) if self._results else 0.0,
+                'rejected': self.rejected,
+                'last_failure': self.last_failure
+            }
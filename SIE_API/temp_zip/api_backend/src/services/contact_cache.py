@@ -0,0 +1,100 @@
+import datetime
+import hashlib
+import json
+from src.services.cache import KeyLocks, TTLCache
+from src.services.whatsapp_gateway import gateway
+
+class GatewayListError(Exception):
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+# Lista de contatos/conversas obtida do serviço WhatsApp
+class CachedList:
+    def __init__(self, items):
+        self.items = items
+        self.fetched_at = datetime.datetime.utcnow()
+        self.etag = hashlib.sha256(
+            json.dumps(items, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        ).hexdigest()
+
+# Cache por instância das listas de contatos e conversas
+#
+# A lista completa fica em memória por CONTACTS_CACHE_TTL segundos; busca,
+# ordenação e paginação são feitas sobre ela. Requisições simultâneas com o
+# cache vazio esperam uma única chamada ao serviço WhatsApp.
+class ContactCache:
+    fetchers = {
+        'contacts': gateway.contacts,
+        'chats': gateway.chats
+    }
+
+    def __init__(self, app=None):
+        self.cache = TTLCache()
+        self._lock_for = KeyLocks()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CONTACTS_CACHE_TTL', 300)
+        app.config.setdefault('CONTACTS_CACHE_SIZE', 256)
+
+        self.cache = TTLCache(int(app.config['CONTACTS_CACHE_SIZE']), float(app.config['CONTACTS_CACHE_TTL']))
+        app.extensions['contact_cache'] = self
+
+    def get(self, instance, kind, refresh=False):
+        key = (instance.id, kind)
+        if not refresh:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        with self._lock_for(key):
+            # Outra requisição pode ter preenchido o cache enquanto esperávamos
+            if not refresh:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+
+            response = self.fetchers[kind](instance.session_id, instance.instance_type)
+            if response.status_code != 200:
+                raise GatewayListError(response.json().get('error'))
+
+            cached = CachedList(response.json().get(kind, []))
+            self.cache.set(key, cached)
+            return cached
+
+    def invalidate(self, instance_id):
+        for kind in self.fetchers:
+            self.cache.delete((instance_id, kind))
+
+contact_cache = ContactCache()
+
+def _text(value):
+    if isinstance(value, dict):
+        return value.get('_serialized') or value.get('user') or ''
+    return '' if value is None else str(value)
+
+# Campos pesquisados em ?search= (contatos e conversas do whatsapp-web.js)
+SEARCH_FIELDS = ('name', 'pushname', 'shortName', 'number', 'id')
+
+def search_items(items, search):
+    term = search.lower()
+    return [
+        item for item in items
+        if any(term in _text(item.get(field)).lower() for field in SEARCH_FIELDS)
+    ]
+
+def sort_items(items, sort, descending=False):
+    # Itens sem o campo ficam sempre no final
+    present = [item for item in items if item.get(sort) is not None]
+    missing = [item for item in items if item.get(sort) is None]
+
+    def sort_key(item):
+        value = item[sort]
+        if isinstance(value, (int, float, bool)):
+            return (0, value, '')
+        return (1, 0, _text(value).lower())
+
+    return sorted(present, key=sort_key, reverse=descending) + missing
@@ -0,0 +1,176 @@
+import os
+import random
+import tempfile
+import time
+from functools import wraps
+import sqlalchemy as sa
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from src.services.circuit_breaker import CircuitBreaker, CircuitOpen
+from src.services.shared_table import SharedTable
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Sessão que manda SELECTs de requisições de leitura para as réplicas
+#
+# Vai para a réplica o SELECT (sem FOR UPDATE) executado durante uma
+# requisição GET/HEAD, quando a transação atual ainda não escreveu nada e o
+# usuário autenticado não escreveu nos últimos DATABASE_READ_YOUR_WRITES_WINDOW
+# segundos. Todo o resto (flush, INSERT/UPDATE/DELETE, SQL em texto, tarefas
+# em segundo plano, comandos da CLI) usa o banco principal.
+#
+# Se a consulta falhar na réplica (conexão recusada, réplica fora do ar), a
+# sessão é desfeita e a mesma consulta é repetida no banco principal; a
+# réplica fica fora de uso pelo tempo do seu disjuntor.
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            is_select = isinstance(clause, (sa.Select, sa.CompoundSelect))
+            if self._flushing or isinstance(clause, sa.UpdateBase) or (is_select and clause._for_update_arg is not None):
+                self.info['wrote'] = True
+            elif is_select and not self.info.get('wrote'):
+                engine = replica_router.engine_for_request(self._db)
+                if engine is not None:
+                    self.info['replica'] = engine
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    # Ponto único por onde passam execute(), scalar(), scalars() e as
+    # consultas do ORM (Query, get, carregamento tardio)
+    def _execute_internal(self, *args, **kwargs):
+        self.info.pop('replica', None)
+        try:
+            return super()._execute_internal(*args, **kwargs)
+        except sa.exc.DBAPIError as e:
+            engine = self.info.pop('replica', None)
+            if engine is None or self.info.get('wrote'):
+                raise
+            replica_router.replica_failed(self._db, engine, e)
+            self.rollback()
+            return super()._execute_internal(*args, **kwargs)
+
+@sa.event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(session):
+    if session.info.pop('wrote', False):
+        replica_router.record_write()
+
+@sa.event.listens_for(RoutingSession, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('wrote', None)
+
+# Réplicas de leitura (DATABASE_REPLICA_URL)
+#
+# Cada URL vira um bind replica_<n> do Flask-SQLAlchemy; uma requisição usa
+# sempre a mesma réplica, sorteada na primeira consulta. Depois de uma escrita,
+# o resto da requisição e, pelo tempo da janela, as próximas requisições do
+# mesmo usuário leem do banco principal, em qualquer worker: o instante da
+# última escrita de cada usuário fica numa SharedTable em
+# DATABASE_ROUTING_PATH.
+#
+# Cada réplica tem um disjuntor: uma falha a tira de uso por
+# DATABASE_REPLICA_RETRY_AFTER segundos (o tempo dobra a cada nova falha, até
+# 60 s); depois, um SELECT 1 decide se ela volta. Sem réplica disponível, as
+# leituras vão para o banco principal.
+class ReplicaRouter:
+    def __init__(self, app=None):
+        self.replicas = []
+        self.window = 0.0
+        self.table = SharedTable()
+        self.breakers = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_BINDS', {})
+        app.config.setdefault('DATABASE_READ_YOUR_WRITES_WINDOW', 5.0)
+        app.config.setdefault('DATABASE_ROUTING_PATH', os.path.join(tempfile.gettempdir(), 'sie_api_db_routing.bin'))
+        app.config.setdefault('DATABASE_ROUTING_SLOTS', 65536)
+        app.config.setdefault('DATABASE_REPLICA_RETRY_AFTER', 5.0)
+
+        self.replicas = sorted(key for key in app.config['SQLALCHEMY_BINDS'] if key and key.startswith('replica_'))
+        self.window = float(app.config['DATABASE_READ_YOUR_WRITES_WINDOW'])
+        retry_after = float(app.config['DATABASE_REPLICA_RETRY_AFTER'])
+        self.breakers = {
+            key: CircuitBreaker(
+                f"db:{key}", failure_rate=1.0, min_calls=1, window=retry_after,
+                open_timeout=retry_after, max_open_timeout=max(retry_after, 60), probe=self._probe(app, key)
+            )
+            for key in self.replicas
+        }
+        if self.replicas and self.window > 0:
+            self.table.open(app.config['DATABASE_ROUTING_PATH'], app.config['DATABASE_ROUTING_SLOTS'])
+        app.extensions['replica_router'] = self
+
+    @staticmethod
+    def _probe(app, key):
+        def probe():
+            with app.app_context():
+                engine = app.extensions['sqlalchemy'].engines[key]
+            with engine.connect() as connection:
+                connection.execute(sa.text('SELECT 1'))
+            return True
+
+        return probe
+
+    # Réplica sorteada entre as que têm o disjuntor fechado, ou None
+    def choose(self):
+        available = []
+        for key in self.replicas:
+            try:
+                self.breakers[key].before_call()
+            except CircuitOpen:
+                continue
+            available.append(key)
+        return random.choice(available) if available else None
+
+    # Chamado pela sessão quando uma consulta falha na réplica: o resto da
+    # requisição lê do banco principal
+    def replica_failed(self, db, engine, error):
+        for key in self.replicas:
+            if db.engines[key] is engine:
+                self.breakers[key].record_failure(str(error.orig))
+        if has_request_context():
+            g.db_replica = (g.get('current_user_id'), None)
+
+    def wrote_recently(self, user_id):
+        if not self.table.is_open:
+            return False
+        last_write = self.table.get(f"user:{user_id}")
+        return last_write is not None and time.time() - last_write < self.window
+
+    # Engine da réplica para a consulta atual, ou None para o banco principal.
+    # A decisão fica em g e só é refeita quando o usuário da requisição é
+    # identificado (token_required grava g.current_user_id).
+    def engine_for_request(self, db):
+        if not self.replicas or not has_request_context() or request.method not in READ_METHODS:
+            return None
+
+        user_id = g.get('current_user_id')
+        decision = g.get('db_replica')
+        if decision is None or decision[0] != user_id:
+            use_replica = not g.get('db_primary') and (user_id is None or not self.wrote_recently(user_id))
+            replica = (decision and decision[1]) or (self.choose() if use_replica else None)
+            decision = g.db_replica = (user_id, replica if use_replica else None)
+        return db.engines[decision[1]] if decision[1] is not None else None
+
+    def record_write(self):
+        if not has_request_context():
+            return
+        g.db_primary = True
+        g.pop('db_replica', None)
+        user_id = g.get('current_user_id')
+        if user_id is not None and self.table.is_open:
+            self.table.set(f"user:{user_id}", time.time())
+
+replica_router = ReplicaRouter()
+
+# Decorator para rotas GET que precisam do banco principal (ex.: logo após
+# uma escrita feita por quem não está autenticado, como o cadastro)
+def use_primary(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g.db_primary = True
+        return f(*args, **kwargs)
+
+    return decorated
@@ -0,0 +1,80 @@
+import datetime
+import decimal
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Serialização JSON rápida
+#
+# Com o orjson instalado (e JSON_FAST ligado), jsonify e request.get_json usam
+# o OrjsonProvider: datetimes saem em ISO 8601 diretamente, sem isoformat() em
+# Python, e a resposta é gerada em bytes. encode_rows() transforma linhas de
+# consultas por colunas (sem objetos do ORM) em JSON num único passo por lote;
+# as listagens paginadas usam esse caminho. Sem o orjson, tudo continua
+# funcionando com o módulo json da biblioteca padrão.
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class OrjsonProvider(DefaultJSONProvider):
+    def _options(self, kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self._options(kwargs)).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=_default, option=self._options({'indent': indent}) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+class FastJSON:
+    def __init__(self, app=None):
+        self.enabled = orjson is not None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JSON_FAST', True)
+
+        self.enabled = orjson is not None and bool(app.config['JSON_FAST'])
+        if self.enabled:
+            app.json = OrjsonProvider(app)
+        app.extensions['fast_json'] = self
+
+    def encode(self, value):
+        if self.enabled:
+            return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(value, default=_default, ensure_ascii=False).encode('utf-8')
+
+    # Linhas de uma consulta por colunas como objetos JSON separados por
+    # vírgula (sem os colchetes). As primeiras colunas de cada linha são
+    # `fields`; colunas extras (como o id do cursor) são ignoradas.
+    def encode_rows(self, fields, rows, string_ids=False):
+        items = [dict(zip(fields, row)) for row in rows]
+        if string_ids and 'id' in fields:
+            for item in items:
+                item['id'] = str(item['id'])
+        return self.encode(items)[1:-1]
+
+fast_json = FastJSON()
@@ -0,0 +1,402 @@
+import bisect
+import hashlib
+import math
+import threading
+import time
+from sqlalchemy import func, update
+from src.models.user import db, GatewayNode, WhatsAppInstance
+from src.services.background import BackgroundWorker
+from src.services.cache import TTLCache
+from src.services.metrics import metrics
+from src.services.whatsapp_gateway import gateway
+
+ASSIGNMENT_STRATEGIES = ('hash', 'least_load')
+
+class NoGatewayNode(Exception):
+    def __init__(self):
+        super().__init__('Nenhum nó do serviço WhatsApp disponível para novas sessões')
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+# Anel de hash consistente: cada nó ocupa `peso * vnodes` pontos e a sessão
+# fica com o primeiro nó depois do hash do seu ID. Incluir ou retirar um nó só
+# muda o destino das sessões vizinhas aos seus pontos (cerca de 1/N do total).
+class HashRing:
+    def __init__(self, nodes, vnodes=160):
+        points = sorted(
+            (_hash(f"{node_id}#{index}"), node_id)
+            for node_id, weight in nodes
+            for index in range(max(1, weight or 1) * vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node_id for _, node_id in points]
+
+    def lookup(self, key, skip=()):
+        if not self._nodes:
+            return None
+
+        start = bisect.bisect(self._hashes, _hash(key))
+        for offset in range(len(self._nodes)):
+            node_id = self._nodes[(start + offset) % len(self._nodes)]
+            if node_id not in skip:
+                return node_id
+        return None
+
+# Nós cadastrados e anel das sessões, lidos do banco a cada
+# GATEWAY_NODES_REFRESH_INTERVAL segundos
+class NodeSnapshot:
+    def __init__(self, rows, vnodes):
+        self.nodes = {row.id: row for row in rows}
+        self.active = [row for row in rows if row.status == 'active']
+        self.ring = HashRing([(row.id, row.weight) for row in self.active], vnodes)
+
+# Registro dos nós do serviço WhatsApp (Node.js)
+#
+# Cada sessão pertence a um nó (whatsapp_instances.gateway_node_id), escolhido
+# na criação da instância por hash consistente do session_id ou pelo nó com
+# menos sessões por peso (GATEWAY_ASSIGNMENT), respeitando max_sessions. O
+# gateway consulta url_for() a cada chamada; a rota fica em cache por
+# GATEWAY_ROUTE_CACHE_TTL segundos em cada processo.
+#
+# Drenar um nó ou rebalancear marca as sessões com o nó de destino
+# (pending_gateway_node_id); a migração roda em segundo plano: libera a sessão
+# no nó antigo (sem logout), grava o novo nó e reinicia a sessão nele. Os
+# dados de login precisam estar num diretório compartilhado entre os nós
+# (SESSIONS_DIR do serviço WhatsApp); sem isso, a sessão pede um novo QR code.
+class GatewayNodes(BackgroundWorker):
+    name = 'gateway_nodes'
+
+    def __init__(self, app=None):
+        self.strategy = 'hash'
+        self.vnodes = 160
+        self.refresh_interval = 10.0
+        self.batch_size = 5
+        self.routes = TTLCache()
+        self._snapshot = None
+        self._loaded_at = 0.0
+        self._snapshot_lock = threading.Lock()
+        super().__init__(app)
+
+    def init_app(self, app):
+        app.config.setdefault('GATEWAY_ASSIGNMENT', 'hash')
+        app.config.setdefault('GATEWAY_RING_VNODES', 160)
+        app.config.setdefault('GATEWAY_NODES_REFRESH_INTERVAL', 10.0)
+        app.config.setdefault('GATEWAY_ROUTE_CACHE_TTL', 10.0)
+        app.config.setdefault('GATEWAY_ROUTE_CACHE_SIZE', 10000)
+        app.config.setdefault('GATEWAY_REBALANCE_INTERVAL', 5.0)
+        app.config.setdefault('GATEWAY_REBALANCE_BATCH_SIZE', 5)
+
+        if app.config['GATEWAY_ASSIGNMENT'] not in ASSIGNMENT_STRATEGIES:
+            raise ValueError(f"GATEWAY_ASSIGNMENT deve ser um de: {', '.join(ASSIGNMENT_STRATEGIES)}")
+
+        super().init_app(app)
+        self.strategy = app.config['GATEWAY_ASSIGNMENT']
+        self.vnodes = int(app.config['GATEWAY_RING_VNODES'])
+        self.refresh_interval = float(app.config['GATEWAY_NODES_REFRESH_INTERVAL'])
+        self.routes = TTLCache(int(app.config['GATEWAY_ROUTE_CACHE_SIZE']), float(app.config['GATEWAY_ROUTE_CACHE_TTL']))
+        self.interval = float(app.config['GATEWAY_REBALANCE_INTERVAL'])
+        self.batch_size = int(app.config['GATEWAY_REBALANCE_BATCH_SIZE'])
+        self.refresh()
+        gateway.router = self
+
+    # Cadastra WHATSAPP_SERVICE_URL como nó 'default' quando não há nenhum,
+    # com as instâncias existentes (que já estão nele)
+    def ensure_default(self):
+        if db.session.query(GatewayNode.id).first():
+            return None
+
+        node = GatewayNode(name='default', url=gateway.base_url)
+        db.session.add(node)
+        db.session.flush()
+        table = WhatsAppInstance.__table__
+        db.session.execute(
+            update(table)
+            .where(table.c.gateway_node_id.is_(None))
+            .values(gateway_node_id=node.id, updated_at=table.c.updated_at)
+        )
+        db.session.commit()
+        self.refresh()
+        return node
+
+    def refresh(self):
+        self._snapshot = None
+        self.routes.clear()
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+            return snapshot
+
+        with self._snapshot_lock:
+            if self._snapshot is None or time.monotonic() - self._loaded_at >= self.refresh_interval:
+                # Conexão própria: não interfere na transação da requisição
+                with db.engine.connect() as connection:
+                    rows = connection.execute(
+                        db.select(
+                            GatewayNode.id, GatewayNode.name, GatewayNode.url, GatewayNode.status,
+                            GatewayNode.weight, GatewayNode.max_sessions
+                        ).order_by(GatewayNode.id)
+                    ).all()
+                self._snapshot = NodeSnapshot(rows, self.vnodes)
+                self._loaded_at = time.monotonic()
+            return self._snapshot
+
+    def urls(self):
+        return [node.url.rstrip('/') for node in self.snapshot().nodes.values()]
+
+    # URL base do nó da sessão; sessões sem nó recebem um agora
+    def url_for(self, session_id):
+        snapshot = self.snapshot()
+        if not snapshot.nodes:
+            return gateway.base_url
+
+        node_id = self.routes.get(session_id)
+        if node_id not in snapshot.nodes:
+            node_id = self._route(session_id, snapshot)
+            if node_id not in snapshot.nodes:
+                # Nó cadastrado depois da última leitura (ou já removido): relê
+                # os nós uma vez e, se ainda faltar, usa o nó do anel
+                self.refresh()
+                snapshot = self.snapshot()
+                if node_id not in snapshot.nodes:
+                    node_id = self.choose(session_id)
+                    if node_id is None:
+                        raise NoGatewayNode()
+            self.routes.set(session_id, node_id)
+        return snapshot.nodes[node_id].url.rstrip('/')
+
+    def _route(self, session_id, snapshot):
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                db.select(WhatsAppInstance.gateway_node_id).where(WhatsAppInstance.session_id == session_id)
+            ).first()
+
+        if row is not None and row[0] in snapshot.nodes:
+            return row[0]
+        if row is not None:
+            return self.assign(session_id)
+
+        # Sessão sem instância no banco: só calcula o nó
+        node_id = self.choose(session_id)
+        if node_id is None:
+            raise NoGatewayNode()
+        return node_id
+
+    def invalidate(self, session_id):
+        self.routes.delete(session_id)
+
+    # Sessões por nó, contando também as migrações a caminho de cada nó
+    def loads(self):
+        table = WhatsAppInstance.__table__
+        loads = {}
+        with db.engine.connect() as connection:
+            for column in (table.c.gateway_node_id, table.c.pending_gateway_node_id):
+                rows = connection.execute(
+                    db.select(column, func.count()).where(column.isnot(None)).group_by(column)
+                ).all()
+                for node_id, count in rows:
+                    loads[node_id] = loads.get(node_id, 0) + count
+        return loads
+
+    # Nó ativo para a sessão, fora de `exclude` e abaixo de max_sessions
+    def choose(self, session_id, exclude=(), loads=None):
+        snapshot = self.snapshot()
+        candidates = [node for node in snapshot.active if node.id not in exclude]
+        if not candidates:
+            return None
+
+        if loads is None and (self.strategy == 'least_load' or any(node.max_sessions for node in candidates)):
+            loads = self.loads()
+        loads = loads or {}
+        full = {node.id for node in candidates if node.max_sessions and loads.get(node.id, 0) >= node.max_sessions}
+
+        if self.strategy == 'least_load':
+            available = [node for node in candidates if node.id not in full]
+            if not available:
+                return None
+            return min(available, key=lambda node: (loads.get(node.id, 0) / max(1, node.weight or 1), node.id)).id
+
+        return snapshot.ring.lookup(session_id, set(exclude) | full)
+
+    # Grava o nó de uma sessão ainda sem nó e retorna o nó efetivo (outro
+    # processo pode ter atribuído primeiro)
+    def assign(self, session_id):
+        node_id = self.choose(session_id)
+        if node_id is None:
+            raise NoGatewayNode()
+
+        table = WhatsAppInstance.__table__
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(table)
+                .where(table.c.session_id == session_id, table.c.gateway_node_id.is_(None))
+                .values(gateway_node_id=node_id, updated_at=table.c.updated_at)
+            )
+            return connection.execute(
+                db.select(table.c.gateway_node_id).where(table.c.session_id == session_id)
+            ).scalar()
+
+    # Sessões e migrações pendentes de cada nó
+    def sessions_per_node(self):
+        table = WhatsAppInstance.__table__
+        sessions = dict(db.session.execute(
+            db.select(table.c.gateway_node_id, func.count()).group_by(table.c.gateway_node_id)
+        ).all())
+        pending = dict(db.session.execute(
+            db.select(table.c.gateway_node_id, func.count())
+            .where(table.c.pending_gateway_node_id.isnot(None))
+            .group_by(table.c.gateway_node_id)
+        ).all())
+        return sessions, pending
+
+    # Para de enviar sessões novas ao nó e agenda a migração das que ele tem.
+    # Retorna (sessões agendadas, sessões sem destino por falta de capacidade).
+    def drain(self, node):
+        node.status = 'draining'
+        db.session.commit()
+        self.refresh()
+
+        rows = db.session.execute(
+            db.select(WhatsAppInstance.id, WhatsAppInstance.session_id)
+            .where(WhatsAppInstance.gateway_node_id == node.id)
+            .order_by(WhatsAppInstance.id)
+        ).all()
+        moves = []
+        loads = self.loads()
+        for instance_id, session_id in rows:
+            target = self.choose(session_id, exclude={node.id}, loads=loads)
+            if target is None:
+                break
+            loads[target] = loads.get(target, 0) + 1
+            moves.append((instance_id, node.id, target))
+
+        self._schedule(moves)
+        return len(moves), len(rows) - len(moves)
+
+    # Migrações que levam cada sessão ao nó que a estratégia escolheria hoje
+    # (por exemplo, depois de incluir um nó). Com dry_run, só retorna o plano.
+    def rebalance(self, dry_run=False):
+        self.refresh()
+        snapshot = self.snapshot()
+        rows = db.session.execute(
+            db.select(WhatsAppInstance.id, WhatsAppInstance.session_id, WhatsAppInstance.gateway_node_id)
+            .where(WhatsAppInstance.gateway_node_id.isnot(None))
+            .order_by(WhatsAppInstance.id)
+        ).all()
+
+        if self.strategy == 'least_load':
+            moves = self._least_load_moves(rows, snapshot)
+        else:
+            moves = []
+            for instance_id, session_id, node_id in rows:
+                target = snapshot.ring.lookup(session_id)
+                if target is not None and target != node_id:
+                    moves.append((instance_id, node_id, target))
+
+        if not dry_run:
+            self._schedule(moves)
+        return moves
+
+    # Cada nó ativo fica com uma parte das sessões proporcional ao peso (e
+    # até max_sessions); os nós em drenagem ficam sem nenhuma
+    def _least_load_moves(self, rows, snapshot):
+        total_weight = sum(max(1, node.weight or 1) for node in snapshot.active)
+        if not total_weight:
+            return []
+
+        targets = {}
+        for node in snapshot.active:
+            share = math.ceil(len(rows) * max(1, node.weight or 1) / total_weight)
+            targets[node.id] = min(share, node.max_sessions) if node.max_sessions else share
+
+        counts = {}
+        surplus = []
+        for instance_id, session_id, node_id in rows:
+            counts[node_id] = counts.get(node_id, 0) + 1
+            if counts[node_id] > targets.get(node_id, 0):
+                surplus.append((instance_id, node_id))
+
+        moves = []
+        for instance_id, node_id in surplus:
+            available = [candidate for candidate in targets if counts.get(candidate, 0) < targets[candidate]]
+            if not available:
+                break
+            target = min(available, key=lambda candidate: counts.get(candidate, 0) / targets[candidate])
+            counts[node_id] -= 1
+            counts[target] = counts.get(target, 0) + 1
+            moves.append((instance_id, node_id, target))
+        return moves
+
+    def _schedule(self, moves):
+        table = WhatsAppInstance.__table__
+        by_target = {}
+        for instance_id, _, target in moves:
+            by_target.setdefault(target, []).append(instance_id)
+
+        for target, instance_ids in by_target.items():
+            for start in range(0, len(instance_ids), 500):
+                db.session.execute(
+                    update(table)
+                    .where(table.c.id.in_(instance_ids[start:start + 500]))
+                    .values(pending_gateway_node_id=target, updated_at=table.c.updated_at)
+                )
+        db.session.commit()
+
+    # Migra um lote de sessões com destino pendente
+    def run_once(self):
+        rows = db.session.execute(
+            db.select(
+                WhatsAppInstance.id, WhatsAppInstance.session_id, WhatsAppInstance.instance_type,
+                WhatsAppInstance.is_active, WhatsAppInstance.is_connected,
+                WhatsAppInstance.gateway_node_id, WhatsAppInstance.pending_gateway_node_id
+            )
+            .where(WhatsAppInstance.pending_gateway_node_id.isnot(None))
+            .order_by(WhatsAppInstance.id)
+            .limit(self.batch_size)
+        ).all()
+        db.session.commit()
+
+        for row in rows:
+            self.migrate(row)
+        return bool(rows)
+
+    def migrate(self, row):
+        # Atualização condicional: só um processo executa cada migração
+        table = WhatsAppInstance.__table__
+        claimed = db.session.execute(
+            update(table)
+            .where(table.c.id == row.id, table.c.pending_gateway_node_id == row.pending_gateway_node_id)
+            .values(gateway_node_id=row.pending_gateway_node_id, pending_gateway_node_id=None, updated_at=table.c.updated_at)
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return False
+
+        self.invalidate(row.session_id)
+        if row.gateway_node_id == row.pending_gateway_node_id:
+            return True
+
+        result = 'ok'
+        old_node = self.snapshot().nodes.get(row.gateway_node_id)
+        if old_node is not None:
+            try:
+                gateway.release(row.session_id, old_node.url.rstrip('/'))
+            except Exception as e:
+                # O nó antigo pode estar fora do ar (motivo comum para drenar)
+                self.app.logger.warning('Falha ao liberar a sessão %s no nó %s: %s', row.session_id, old_node.name, e)
+
+        if row.is_active and row.is_connected:
+            try:
+                response = gateway.init(row.session_id, row.instance_type)
+                if response.status_code != 200:
+                    result = 'error'
+                    self.app.logger.warning('Falha ao iniciar a sessão %s no novo nó: HTTP %s', row.session_id, response.status_code)
+            except Exception as e:
+                result = 'error'
+                self.app.logger.warning('Falha ao iniciar a sessão %s no novo nó: %s', row.session_id, e)
+
+        metrics.inc('sie_gateway_session_migrations_total', (('result', result),))
+        return True
+
+gateway_nodes = GatewayNodes()
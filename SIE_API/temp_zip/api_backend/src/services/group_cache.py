@@ -0,0 +1,121 @@
+import datetime
+from src.services.cache import KeyLocks, TTLCache
+from src.services.contact_cache import GatewayListError
+from src.services.whatsapp_gateway import gateway
+
+# Membros de um grupo obtidos do serviço WhatsApp
+class GroupParticipants:
+    def __init__(self, group_id, participants, subject=None):
+        self.group_id = group_id
+        self.participants = list(dict.fromkeys(participants))
+        self.subject = subject
+        self.fetched_at = datetime.datetime.utcnow()
+        self.updated_at = self.fetched_at
+
+    def to_dict(self, include_participants=False):
+        data = {
+            'groupId': self.group_id,
+            'subject': self.subject,
+            'participants_count': len(self.participants),
+            'fetched_at': self.fetched_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+        if include_participants:
+            data['participants'] = self.participants
+        return data
+
+# Ações dos eventos de grupo (Baileys: add/remove; whatsapp-web.js: join/leave)
+ADDED_ACTIONS = ('add', 'invite', 'join')
+REMOVED_ACTIONS = ('remove', 'leave', 'kick')
+
+# Cache por instância dos membros dos grupos, usado pelo mention-all
+#
+# A lista fica em memória por GROUP_CACHE_TTL segundos e é atualizada pelos
+# eventos de entrada/saída de membros recebidos em POST /api/events, sem nova
+# consulta ao serviço WhatsApp. Como os outros caches, é local a cada processo:
+# com vários workers, só o que recebeu o evento se atualiza e os demais
+# dependem do TTL.
+class GroupCache:
+    def __init__(self, app=None):
+        self.cache = TTLCache()
+        self._lock_for = KeyLocks()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('GROUP_CACHE_TTL', 600)
+        app.config.setdefault('GROUP_CACHE_SIZE', 1024)
+
+        self.cache = TTLCache(int(app.config['GROUP_CACHE_SIZE']), float(app.config['GROUP_CACHE_TTL']))
+        app.extensions['group_cache'] = self
+
+    def get(self, instance, group_id, refresh=False):
+        key = (instance.id, group_id)
+        if not refresh:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        with self._lock_for(key):
+            # Outra requisição pode ter preenchido o cache enquanto esperávamos
+            if not refresh:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+
+            response = gateway.group_participants(instance.session_id, group_id, instance.instance_type)
+            if response.status_code != 200:
+                raise GatewayListError(response.json().get('error'))
+
+            data = response.json()
+            cached = GroupParticipants(group_id, data.get('participants', []), data.get('subject'))
+            self.cache.set(key, cached)
+            return cached
+
+    # Aplica um evento de membros; grupos fora do cache são ignorados (serão
+    # consultados no próximo uso). Retorna True se o cache mudou.
+    def apply_event(self, instance_id, group_id, action, participants):
+        key = (instance_id, group_id)
+        with self._lock_for(key):
+            cached = self.cache.get(key)
+            expires_in = self.cache.expires_in(key)
+            if cached is None or not expires_in:
+                return False
+
+            if action in ADDED_ACTIONS:
+                members = list(dict.fromkeys(cached.participants + list(participants)))
+            elif action in REMOVED_ACTIONS:
+                removed = set(participants)
+                members = [member for member in cached.participants if member not in removed]
+            else:
+                return False
+
+            # Nova instância em vez de alterar a lista que outra requisição pode estar usando
+            updated = GroupParticipants(group_id, members, cached.subject)
+            updated.fetched_at = cached.fetched_at
+            self.cache.set(key, updated, expires_in)
+            return True
+
+    # Grupos em cache da instância, como (GroupParticipants, segundos restantes)
+    def groups(self, instance_id):
+        return [
+            (cached, expires_in)
+            for key, cached, expires_in in self.cache.items()
+            if key[0] == instance_id
+        ]
+
+    def invalidate(self, instance_id, group_id=None):
+        if group_id is not None:
+            return int(self.cache.delete((instance_id, group_id)))
+
+        return sum(
+            int(self.cache.delete(key))
+            for key, _, _ in self.cache.items()
+            if key[0] == instance_id
+        )
+
+    def stats(self):
+        return self.cache.stats()
+
+group_cache = GroupCache()
@@ -0,0 +1,251 @@
+import datetime
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+from flask import request, jsonify, make_response, current_app
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db, IdempotencyKey
+from src.services.background import BackgroundWorker
+from src.services.cache import TTLCache
+
+# Resposta guardada para uma chave (corpo como texto, como na tabela)
+StoredResponse = namedtuple('StoredResponse', 'request_hash status body mimetype')
+
+# Resultado de _claim() quando esta requisição passou a ser a dona da chave
+CLAIMED = object()
+
+# Chaves de idempotência para envios (cabeçalho Idempotency-Key)
+#
+# A primeira resposta de cada (usuário, chave) fica num LRU em memória e na
+# tabela idempotency_keys por IDEMPOTENCY_TTL segundos; repetições recebem a
+# mesma resposta sem nova chamada ao serviço WhatsApp. Uma repetição que chega
+# enquanto a original ainda está em andamento espera o resultado: no mesmo
+# processo por um Event, em outro processo consultando a tabela, por até
+# IDEMPOTENCY_WAIT_TIMEOUT segundos (depois responde 409). Respostas 5xx, 429
+# (limitador) e exceções liberam a chave para que a repetição envie de novo.
+class Idempotency(BackgroundWorker):
+    name = 'idempotency'
+
+    def __init__(self, app=None):
+        self.cache = TTLCache()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        super().__init__(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IDEMPOTENCY_TTL', 86400)
+        app.config.setdefault('IDEMPOTENCY_CACHE_SIZE', 10000)
+        app.config.setdefault('IDEMPOTENCY_WAIT_TIMEOUT', 30.0)
+        app.config.setdefault('IDEMPOTENCY_POLL_INTERVAL', 0.2)
+        app.config.setdefault('IDEMPOTENCY_LOCK_TIMEOUT', 120)
+        app.config.setdefault('IDEMPOTENCY_SWEEP_INTERVAL', 3600.0)
+        app.config.setdefault('IDEMPOTENCY_SWEEP_BATCH_SIZE', 1000)
+
+        super().init_app(app)
+        self.ttl = int(app.config['IDEMPOTENCY_TTL'])
+        self.wait_timeout = float(app.config['IDEMPOTENCY_WAIT_TIMEOUT'])
+        self.poll_interval = float(app.config['IDEMPOTENCY_POLL_INTERVAL'])
+        self.lock_timeout = int(app.config['IDEMPOTENCY_LOCK_TIMEOUT'])
+        self.interval = float(app.config['IDEMPOTENCY_SWEEP_INTERVAL'])
+        self.batch_size = int(app.config['IDEMPOTENCY_SWEEP_BATCH_SIZE'])
+        self.cache = TTLCache(int(app.config['IDEMPOTENCY_CACHE_SIZE']), self.ttl)
+
+    # Limpeza das chaves expiradas, em lotes
+    def run_once(self):
+        return self.sweep_batch() == self.batch_size
+
+    def sweep_batch(self):
+        ids = db.session.execute(
+            db.select(IdempotencyKey.id)
+            .where(IdempotencyKey.expires_at < datetime.datetime.utcnow())
+            .limit(self.batch_size)
+        ).scalars().all()
+
+        if ids:
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(ids)))
+        db.session.commit()
+        return len(ids)
+
+    # Executa view() uma única vez por (usuário, chave) e devolve a resposta
+    def execute(self, user_id, key, request_hash, view):
+        cache_key = (user_id, key)
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            stored = self.cache.get(cache_key)
+            if stored is not None:
+                return self._replay(stored, request_hash)
+
+            with self._inflight_lock:
+                flight = self._inflight.get(cache_key)
+                owner = flight is None
+                if owner:
+                    flight = self._inflight[cache_key] = threading.Event()
+
+            if not owner:
+                # Mesma chave em andamento neste processo: espera o resultado
+                if not flight.wait(max(0.0, deadline - time.monotonic())):
+                    return self._in_progress()
+                continue
+
+            try:
+                while True:
+                    outcome = self._claim(user_id, key, request_hash)
+                    if outcome is CLAIMED:
+                        return self._execute_view(cache_key, request_hash, view)
+                    if isinstance(outcome, StoredResponse):
+                        if outcome.request_hash == request_hash:
+                            self.cache.set(cache_key, outcome)
+                        return self._replay(outcome, request_hash)
+
+                    # Em andamento em outro processo: consulta a tabela até terminar
+                    if time.monotonic() >= deadline:
+                        return self._in_progress()
+                    time.sleep(self.poll_interval)
+            finally:
+                with self._inflight_lock:
+                    self._inflight.pop(cache_key, None)
+                flight.set()
+
+    # Reserva a chave no banco. Retorna CLAIMED, a resposta já guardada
+    # (StoredResponse) ou None se outra requisição ainda está com a chave.
+    def _claim(self, user_id, key, request_hash):
+        now = datetime.datetime.utcnow()
+        existing = db.session.execute(
+            db.select(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.idempotency_key == key)
+        ).scalar_one_or_none()
+
+        if existing is not None:
+            if existing.expires_at > now:
+                if existing.status == 'completed':
+                    stored = StoredResponse(
+                        existing.request_hash,
+                        existing.response_status,
+                        existing.response_body,
+                        existing.response_mimetype
+                    )
+                    db.session.commit()
+                    return stored
+                if existing.request_hash != request_hash:
+                    # Corpo diferente: não adianta esperar, a resposta será 422
+                    stored = StoredResponse(existing.request_hash, None, None, None)
+                    db.session.commit()
+                    return stored
+                if existing.locked_at > now - datetime.timedelta(seconds=self.lock_timeout):
+                    db.session.commit()
+                    return None
+
+            # Expirada ou abandonada (processo encerrado no meio do envio)
+            db.session.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.id == existing.id, IdempotencyKey.locked_at == existing.locked_at)
+            )
+
+        db.session.add(IdempotencyKey(
+            user_id=user_id,
+            idempotency_key=key,
+            request_hash=request_hash,
+            status='processing',
+            locked_at=now,
+            expires_at=now + datetime.timedelta(seconds=self.ttl)
+        ))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Outra requisição reservou a chave ao mesmo tempo
+            db.session.rollback()
+            return None
+        return CLAIMED
+
+    def _execute_view(self, cache_key, request_hash, view):
+        user_id, key = cache_key
+        try:
+            response = make_response(view())
+        except Exception:
+            self._release(user_id, key)
+            raise
+
+        if response.status_code >= 500 or response.status_code == 429 or response.is_streamed:
+            self._release(user_id, key)
+            return response
+
+        stored = StoredResponse(request_hash, response.status_code, response.get_data(as_text=True), response.mimetype)
+        db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.idempotency_key == key)
+            .values(
+                status='completed',
+                response_status=stored.status,
+                response_body=stored.body,
+                response_mimetype=stored.mimetype,
+                locked_at=None
+            )
+        )
+        db.session.commit()
+        self.cache.set(cache_key, stored)
+        return response
+
+    def _release(self, user_id, key):
+        db.session.rollback()
+        db.session.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.idempotency_key == key)
+        )
+        db.session.commit()
+
+    def _replay(self, stored, request_hash):
+        if stored.request_hash != request_hash:
+            return jsonify({'message': 'Idempotency-Key já utilizada com outra requisição!'}), 422
+
+        response = current_app.response_class(stored.body, status=stored.status, mimetype=stored.mimetype)
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+
+    def _in_progress(self):
+        response = jsonify({'message': 'Requisição com a mesma Idempotency-Key ainda em andamento!'})
+        response.status_code = 409
+        response.headers['Retry-After'] = '1'
+        return response
+
+    def stats(self):
+        with self._inflight_lock:
+            inflight = len(self._inflight)
+        return {'cache': self.cache.stats(), 'in_flight': inflight}
+
+idempotency = Idempotency()
+
+# Identifica a requisição: método, rota com query string e corpo. Uploads
+# multipart não entram (o boundary muda a cada tentativa e ler o corpo aqui
+# impediria a gravação em streaming do media_store).
+def request_fingerprint():
+    digest = hashlib.sha256(f"{request.method} {request.full_path}".encode('utf-8'))
+    if request.mimetype != 'multipart/form-data':
+        digest.update(b'\n')
+        digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+# Decorator para rotas de envio (depois de token_required e antes de
+# rate_limit, para que repetições sejam respondidas sem passar pelo limitador)
+def idempotent(f):
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return f(current_user, *args, **kwargs)
+
+        key = key.strip()
+        if not key or len(key) > 255:
+            return jsonify({'message': 'Idempotency-Key inválida!'}), 400
+
+        return idempotency.execute(
+            current_user.id,
+            key,
+            request_fingerprint(),
+            lambda: f(current_user, *args, **kwargs)
+        )
+
+    return decorated
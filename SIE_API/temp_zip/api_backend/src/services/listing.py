@@ -0,0 +1,95 @@
+import json
+from flask import Response, current_app, request, stream_with_context
+from src.models.user import db
+from src.services.fast_json import fast_json
+
+# Listagens paginadas por cursor (keyset em id), com filtros e projeção de
+# campos (?fields=id,name). Apenas as colunas pedidas são selecionadas e a
+# resposta JSON é gerada em streaming, um lote de linhas por vez, direto das
+# tuplas do banco (sem objetos do ORM nem to_dict()).
+
+class ListingError(ValueError):
+    pass
+
+def parse_bool(value):
+    if value is None:
+        return None
+    if value.lower() in ('true', '1'):
+        return True
+    if value.lower() in ('false', '0'):
+        return False
+    raise ListingError(f"Valor booleano inválido: {value}")
+
+def prefix_filter(column, prefix):
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return column.like(f"{escaped}%", escape='\\')
+
+def parse_fields(allowed_fields):
+    fields = request.args.get('fields')
+    if not fields:
+        return list(allowed_fields)
+
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    invalid = [field for field in requested if field not in allowed_fields]
+    if invalid:
+        raise ListingError(f"Campos inválidos: {', '.join(invalid)}")
+    return requested
+
+def parse_page():
+    default_limit = current_app.config.get('LIST_DEFAULT_LIMIT', 100)
+    max_limit = current_app.config.get('LIST_MAX_LIMIT', 1000)
+
+    try:
+        limit = int(request.args.get('limit', default_limit))
+        after = request.args.get('after')
+        after = int(after) if after else None
+    except ValueError:
+        raise ListingError('Parâmetros de paginação inválidos')
+
+    return max(1, min(limit, max_limit)), after
+
+# Monta a resposta {"<key>": [...], "next_cursor": <id ou null>}
+# Com descending=True a listagem começa pelo maior id e ?after= continua a
+# partir do cursor em ordem decrescente. string_ids=True devolve id e cursor
+# como texto (ids maiores que 2^53 perdem precisão em JavaScript).
+def stream_listing(key, model, allowed_fields, conditions, descending=False, string_ids=False):
+    fields = parse_fields(allowed_fields)
+    limit, after = parse_page()
+
+    # O id é sempre selecionado (por último, se não foi pedido) para calcular o cursor
+    selected = fields if 'id' in fields else fields + ['id']
+    id_index = selected.index('id')
+    statement = (
+        db.select(*[getattr(model, field) for field in selected])
+        .where(*conditions)
+        .order_by(model.id.desc() if descending else model.id)
+        .limit(limit + 1)
+    )
+    if after is not None:
+        statement = statement.where(model.id < after if descending else model.id > after)
+
+    def generate():
+        result = db.session.execute(statement.execution_options(yield_per=500))
+
+        yield f'{{"{key}":['.encode('utf-8')
+        count = 0
+        last_id = None
+        has_more = False
+        for rows in result.partitions():
+            # A linha extra (limit + 1) só indica que existe próxima página
+            if count + len(rows) > limit:
+                rows = rows[:limit - count]
+                has_more = True
+            if rows:
+                yield (b',' if count else b'') + fast_json.encode_rows(fields, rows, string_ids)
+                last_id = rows[-1][id_index]
+                count += len(rows)
+            if has_more:
+                break
+        result.close()
+        cursor = last_id if has_more else None
+        if string_ids and cursor is not None:
+            cursor = str(cursor)
+        yield f'],"next_cursor":{json.dumps(cursor)}}}'.encode('utf-8')
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
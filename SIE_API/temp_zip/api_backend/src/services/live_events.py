@@ -0,0 +1,282 @@
+import json
+import queue
+import sys
+import threading
+import time
+import requests
+from src.models.user import db, WhatsAppInstance
+from src.services.background import BackgroundWorker
+from src.services.cache import TTLCache
+from src.services.fast_json import fast_json
+from src.services.gateway_nodes import gateway_nodes
+from src.services.metrics import metrics
+from src.services.whatsapp_gateway import gateway
+
+# Estados de sessão repassados aos painéis ('released' é a troca de nó de uma
+# sessão e não muda nada para o usuário)
+STATES = ('qr', 'authenticated', 'connected', 'disconnected')
+
+# Mensagem de um fluxo SSE já formatada (bytes)
+def format_event(event, data):
+    return b'event: ' + event.encode('ascii') + b'\ndata: ' + fast_json.encode(data) + b'\n\n'
+
+# Um fluxo aberto prende quem atende a requisição: só é aceito com greenlets
+# (gevent, com monkey patching) ou threads, nunca num worker síncrono
+def streaming_supported(environ):
+    monkey = sys.modules.get('gevent.monkey')
+    return bool(environ.get('wsgi.multithread')) or (monkey is not None and monkey.is_module_patched('socket'))
+
+# Painel conectado a GET /api/whatsapp/events/stream
+#
+# `user_id` None recebe as instâncias de todos os usuários (admin com
+# ?all=true). A fila tem tamanho fixo: um painel que não acompanha os eventos
+# fica com `overflowed` e o fluxo é encerrado; o navegador reconecta e recebe
+# um novo retrato do estado.
+class Subscriber:
+    def __init__(self, user_id, maxsize):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, item):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.overflowed = True
+            metrics.inc('sie_live_events_overflows_total')
+
+    # Próxima mensagem, ou None se nada chegou em `timeout` segundos
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+# Eventos em tempo real das instâncias (status, QR code e mensagens)
+#
+# Cada processo mantém uma única conexão com GET /events/stream de cada nó
+# do serviço WhatsApp, aberta quando o primeiro painel se inscreve, e
+# distribui os eventos aos painéis dos donos das instâncias. A sessão do
+# evento é traduzida para (instância, usuário) com cache; as mensagens são
+# somadas por instância e enviadas a cada LIVE_EVENTS_COUNT_INTERVAL segundos,
+# para que um pico de mensagens não vire um evento por mensagem em cada painel.
+class LiveEvents(BackgroundWorker):
+    name = 'live_events'
+
+    def __init__(self, app=None):
+        self.heartbeat = 15.0
+        self.queue_size = 256
+        self.max_subscribers = 1000
+        self.max_duration = 3600.0
+        self.upstream_timeout = 45.0
+        self.secret = ''
+        self.states = {}
+        self.qr_codes = {}
+        self.sessions = TTLCache(10000, 60)
+        self._subscribers = {}
+        self._counts = {}
+        self._readers = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        super().__init__(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LIVE_EVENTS_ENABLED', True)
+        app.config.setdefault('LIVE_EVENTS_HEARTBEAT', 15.0)
+        app.config.setdefault('LIVE_EVENTS_QUEUE_SIZE', 256)
+        app.config.setdefault('LIVE_EVENTS_MAX_SUBSCRIBERS', 1000)
+        app.config.setdefault('LIVE_EVENTS_MAX_DURATION', 3600.0)
+        app.config.setdefault('LIVE_EVENTS_COUNT_INTERVAL', 1.0)
+        app.config.setdefault('LIVE_EVENTS_UPSTREAM_TIMEOUT', 45.0)
+
+        super().init_app(app)
+        self.heartbeat = float(app.config['LIVE_EVENTS_HEARTBEAT'])
+        self.queue_size = int(app.config['LIVE_EVENTS_QUEUE_SIZE'])
+        self.max_subscribers = int(app.config['LIVE_EVENTS_MAX_SUBSCRIBERS'])
+        self.max_duration = float(app.config['LIVE_EVENTS_MAX_DURATION'])
+        self.interval = float(app.config['LIVE_EVENTS_COUNT_INTERVAL'])
+        self.upstream_timeout = float(app.config['LIVE_EVENTS_UPSTREAM_TIMEOUT'])
+        self.secret = app.config.get('EVENTS_SECRET', '')
+
+    @property
+    def enabled(self):
+        return bool(self.app and self.app.config['LIVE_EVENTS_ENABLED'])
+
+    # Inscrições
+
+    # Retorna None quando o processo já atingiu LIVE_EVENTS_MAX_SUBSCRIBERS
+    def subscribe(self, user_id):
+        with self._lock:
+            if sum(len(items) for items in self._subscribers.values()) >= self.max_subscribers:
+                return None
+            subscriber = Subscriber(user_id, self.queue_size)
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        metrics.gauge_add('sie_live_events_subscribers')
+
+        # A conexão com o serviço WhatsApp só é aberta quando há quem a use
+        if not self.running:
+            with self._start_lock:
+                self.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            items = self._subscribers.get(subscriber.user_id)
+            if items is None or subscriber not in items:
+                return
+            items.discard(subscriber)
+            if not items:
+                del self._subscribers[subscriber.user_id]
+        metrics.gauge_add('sie_live_events_subscribers', amount=-1)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(items) for items in self._subscribers.values())
+
+    def publish(self, user_id, event, data):
+        message = format_event(event, data)
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, ())) + list(self._subscribers.get(None, ()))
+        for subscriber in targets:
+            subscriber.put(message)
+
+    # Estado atual conhecido da sessão, para o retrato enviado a um painel novo
+    def state_of(self, session_id):
+        return self.states.get(session_id), self.qr_codes.get(session_id)
+
+    # Sessão do serviço WhatsApp → (id da instância, id do usuário), ou None
+    def resolve(self, session_id):
+        cached = self.sessions.get(session_id)
+        if cached is not None:
+            return cached or None
+
+        # Conexão própria: a thread de leitura não tem sessão do ORM
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                db.select(WhatsAppInstance.id, WhatsAppInstance.user_id)
+                .where(WhatsAppInstance.session_id == session_id)
+            ).first()
+        # Sessão desconhecida fica em cache por pouco tempo (instância recém-criada)
+        self.sessions.set(session_id, tuple(row) if row else (), None if row else 5)
+        return tuple(row) if row else None
+
+    # Eventos do serviço WhatsApp
+
+    def dispatch(self, event, data):
+        session_id = data.get('sessionId')
+        if not session_id:
+            return
+
+        if event == 'state':
+            state = data.get('state')
+            if state not in STATES:
+                self.states.pop(session_id, None)
+                self.qr_codes.pop(session_id, None)
+                return
+            self.states[session_id] = state
+            if state != 'qr':
+                self.qr_codes.pop(session_id, None)
+        elif event == 'qr':
+            self.qr_codes[session_id] = data.get('qr')
+        elif event != 'message':
+            return
+
+        target = self.resolve(session_id)
+        if target is None:
+            return
+        instance_id, user_id = target
+
+        if event == 'message':
+            with self._lock:
+                counts = self._counts.setdefault(instance_id, [user_id, 0, 0])
+                counts[2 if data.get('fromMe') else 1] += 1
+        elif event == 'state':
+            payload = {'instanceId': instance_id, 'state': state, 'isConnected': state == 'connected'}
+            if data.get('reason'):
+                payload['reason'] = data['reason']
+            self.publish(user_id, 'state', payload)
+        else:
+            self.publish(user_id, 'qr', {'instanceId': instance_id, 'qr': data.get('qr')})
+
+    # Lê o fluxo de um nó até ele fechar, cair ou ficar sem dados (nem o
+    # comentário de heartbeat) por LIVE_EVENTS_UPSTREAM_TIMEOUT segundos
+    def consume(self, url, stop_event):
+        headers = {'Accept': 'text/event-stream'}
+        if self.secret:
+            headers['X-Events-Secret'] = self.secret
+
+        with requests.get(f"{url}/events/stream", headers=headers, stream=True,
+                          timeout=(gateway.connect_timeout, self.upstream_timeout)) as response:
+            response.raise_for_status()
+            event, data = 'message', []
+            for line in response.iter_lines(decode_unicode=True):
+                if stop_event.is_set():
+                    return
+                if line:
+                    field, _, value = line.partition(':')
+                    value = value[1:] if value.startswith(' ') else value
+                    if field == 'event':
+                        event = value
+                    elif field == 'data':
+                        data.append(value)
+                    continue
+
+                if data:
+                    try:
+                        self.dispatch(event, json.loads('\n'.join(data)))
+                    except Exception:
+                        self.app.logger.exception('Erro ao processar evento do serviço WhatsApp em %s', url)
+                event, data = 'message', []
+
+    def _read(self, url, stop_event):
+        backoff = 1.0
+        while not stop_event.is_set() and not self._stop_event.is_set():
+            started = time.monotonic()
+            try:
+                with self.app.app_context():
+                    self.consume(url, stop_event)
+            except requests.RequestException as e:
+                self.app.logger.warning('Fluxo de eventos de %s interrompido: %s', url, e)
+            except Exception:
+                self.app.logger.exception('Erro no fluxo de eventos de %s', url)
+            metrics.inc('sie_live_events_upstream_reconnects_total')
+
+            # Reconexão com espera crescente enquanto o nó continuar caindo logo
+            backoff = 1.0 if time.monotonic() - started > 30 else min(backoff * 2, 30.0)
+            stop_event.wait(backoff)
+
+    def run_once(self):
+        self.supervise()
+        self.flush_counts()
+        return False
+
+    # Uma thread de leitura por nó cadastrado; nós removidos têm a sua encerrada
+    def supervise(self):
+        urls = set(gateway_nodes.urls()) or {gateway.base_url}
+        for url in list(self._readers):
+            if url not in urls:
+                self._readers.pop(url)[1].set()
+        for url in urls:
+            reader = self._readers.get(url)
+            if reader is None or not reader[0].is_alive():
+                stop_event = threading.Event()
+                thread = threading.Thread(target=self._read, args=(url, stop_event), name=f"{self.name}-reader", daemon=True)
+                thread.start()
+                self._readers[url] = (thread, stop_event)
+
+    def flush_counts(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        for instance_id, (user_id, received, sent) in counts.items():
+            self.publish(user_id, 'messages', {'instanceId': instance_id, 'received': received, 'sent': sent})
+
+    def stop(self, timeout=None):
+        for thread, stop_event in self._readers.values():
+            stop_event.set()
+        self._readers = {}
+        super().stop(timeout)
+
+live_events = LiveEvents()
@@ -0,0 +1,124 @@
+import datetime
+from flask import current_app
+from flask_mail import Mail, Message
+from sqlalchemy import update
+from src.models.user import db, EmailOutbox
+from src.services.background import BackgroundWorker, Periodic, STALE_CHECKS_PER_TIMEOUT
+
+mail = Mail()
+
+# Caixa de saída de e-mails transacionais (tabela email_outbox)
+#
+# As rotas apenas gravam o e-mail na mesma transação da alteração que o
+# originou; o envio acontece aqui, em segundo plano, reaproveitando uma única
+# conexão SMTP para cada lote de mensagens. Falhas são repetidas com backoff
+# exponencial até MAIL_OUTBOX_MAX_ATTEMPTS, quando o e-mail fica 'failed'.
+class MailOutbox(BackgroundWorker):
+    name = 'mail_outbox'
+
+    def init_app(self, app):
+        app.config.setdefault('MAIL_OUTBOX_INTERVAL', 2.0)
+        app.config.setdefault('MAIL_OUTBOX_BATCH_SIZE', 50)
+        app.config.setdefault('MAIL_OUTBOX_MAX_ATTEMPTS', 5)
+        app.config.setdefault('MAIL_OUTBOX_RETRY_BACKOFF', 30.0)
+        app.config.setdefault('MAIL_OUTBOX_RETRY_BACKOFF_MAX', 3600.0)
+        app.config.setdefault('MAIL_OUTBOX_LOCK_TIMEOUT', 600)
+
+        super().init_app(app)
+        self.interval = float(app.config['MAIL_OUTBOX_INTERVAL'])
+        self.batch_size = int(app.config['MAIL_OUTBOX_BATCH_SIZE'])
+        self.max_attempts = int(app.config['MAIL_OUTBOX_MAX_ATTEMPTS'])
+        self.retry_backoff = float(app.config['MAIL_OUTBOX_RETRY_BACKOFF'])
+        self.retry_backoff_max = float(app.config['MAIL_OUTBOX_RETRY_BACKOFF_MAX'])
+        self.lock_timeout = int(app.config['MAIL_OUTBOX_LOCK_TIMEOUT'])
+        self.stale_check = Periodic(self.lock_timeout / STALE_CHECKS_PER_TIMEOUT)
+
+    # Adiciona o e-mail à sessão atual; quem chama faz o commit
+    def enqueue(self, to, subject, html):
+        email = EmailOutbox(
+            recipient=to,
+            subject=subject,
+            html=html,
+            max_attempts=self.max_attempts
+        )
+        db.session.add(email)
+        return email
+
+    def run_once(self):
+        now = datetime.datetime.utcnow()
+        if self.stale_check.due():
+            self._release_stale(now)
+
+        candidates = db.session.execute(
+            db.select(EmailOutbox.id)
+            .where(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.id)
+            .limit(self.batch_size)
+        ).scalars().all()
+
+        claimed = [email_id for email_id in candidates if self._claim(email_id, now)]
+        if not claimed:
+            return False
+
+        emails = EmailOutbox.query.filter(EmailOutbox.id.in_(claimed)).order_by(EmailOutbox.id).all()
+        self.deliver(emails)
+        return len(candidates) == self.batch_size
+
+    def deliver(self, emails):
+        try:
+            with mail.connect() as connection:
+                for email in emails:
+                    try:
+                        connection.send(Message(
+                            email.subject,
+                            recipients=[email.recipient],
+                            html=email.html,
+                            sender=current_app.config['MAIL_DEFAULT_SENDER']
+                        ))
+                    except Exception as e:
+                        self._retry(email, str(e))
+                    else:
+                        email.status = 'sent'
+                        email.locked_at = None
+                        email.last_error = None
+                        email.sent_at = datetime.datetime.utcnow()
+                    db.session.commit()
+        except Exception as e:
+            # Falha ao abrir/fechar a conexão SMTP: o que não foi enviado volta para a fila
+            for email in emails:
+                if email.status == 'sending':
+                    self._retry(email, str(e))
+            db.session.commit()
+
+    def _release_stale(self, now):
+        db.session.execute(
+            update(EmailOutbox)
+            .where(
+                EmailOutbox.status == 'sending',
+                EmailOutbox.locked_at < now - datetime.timedelta(seconds=self.lock_timeout)
+            )
+            .values(status='pending', locked_at=None)
+        )
+        db.session.commit()
+
+    def _claim(self, email_id, now):
+        result = db.session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id == email_id, EmailOutbox.status == 'pending')
+            .values(status='sending', locked_at=now, attempts=EmailOutbox.attempts + 1)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _retry(self, email, error):
+        email.locked_at = None
+        email.last_error = error
+        if email.attempts >= email.max_attempts:
+            email.status = 'failed'
+            return
+
+        delay = min(self.retry_backoff * (2 ** (email.attempts - 1)), self.retry_backoff_max)
+        email.status = 'pending'
+        email.next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+
+mail_outbox = MailOutbox()
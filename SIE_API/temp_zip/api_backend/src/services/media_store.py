@@ -0,0 +1,133 @@
+import hashlib
+import os
+import re
+import tempfile
+from urllib.parse import urlsplit
+from werkzeug.formparser import parse_form_data
+
+class MediaStoreError(Exception):
+    pass
+
+def is_remote_url(value):
+    parts = urlsplit(value or '')
+    return parts.scheme in ('http', 'https') and bool(parts.netloc)
+
+# Arquivo temporário que calcula o SHA-256 enquanto o upload é gravado
+class HashingFile:
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+# Armazenamento de mídia endereçado por conteúdo
+#
+# Uploads multipart são gravados direto em disco (sem passar pela memória do
+# Flask) e salvos como <MEDIA_STORE_PATH>/<hash[:2]>/<hash><ext>. O mesmo
+# arquivo enviado várias vezes ocupa um único arquivo no disco. O serviço
+# WhatsApp recebe o caminho local, então o diretório precisa estar acessível
+# a ele.
+class MediaStore:
+    def __init__(self, app=None):
+        self.root = None
+        self.max_size = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MEDIA_STORE_PATH', os.path.join(os.path.dirname(app.root_path), 'media'))
+        app.config.setdefault('MEDIA_MAX_SIZE', 64 * 1024 * 1024)
+
+        self.root = os.path.abspath(app.config['MEDIA_STORE_PATH'])
+        self.max_size = int(app.config['MEDIA_MAX_SIZE'])
+        app.extensions['media_store'] = self
+
+    def _stream_factory(self, total_content_length, content_type, filename, content_length=None):
+        os.makedirs(self.root, exist_ok=True)
+        return HashingFile(self.root)
+
+    # Lê o corpo multipart da requisição e guarda o arquivo do campo `field`.
+    # Retorna (campos do formulário, caminho do arquivo, hash).
+    def receive(self, request, field='file'):
+        _, form, files = parse_form_data(
+            request.environ,
+            stream_factory=self._stream_factory,
+            max_content_length=self.max_size
+        )
+
+        try:
+            upload = files.get(field)
+            if upload is None or not upload.filename:
+                raise MediaStoreError('Arquivo não enviado!')
+
+            stream = upload.stream
+            digest = stream.hexdigest()
+            path = self._store(stream, digest, upload.filename)
+            return form, path, digest
+        finally:
+            # Remove os temporários que não foram movidos para o armazenamento
+            for upload in files.values():
+                upload.stream.close()
+                if os.path.exists(upload.stream.path):
+                    os.remove(upload.stream.path)
+
+    def _store(self, stream, digest, filename):
+        stream.flush()
+        path = self._path(digest, self._extension(filename))
+
+        if os.path.exists(path):
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(stream.path, path)
+        return path
+
+    def _path(self, digest, extension):
+        return os.path.join(self.root, digest[:2], f"{digest}{extension}")
+
+    def _extension(self, filename):
+        extension = os.path.splitext(filename)[1].lower()
+        return extension if re.fullmatch(r'\.[a-z0-9]{1,10}', extension) else ''
+
+    # Caminho de um arquivo já armazenado, a partir do hash
+    def find(self, digest):
+        if not re.fullmatch(r'[0-9a-f]{64}', digest or ''):
+            return None
+
+        directory = os.path.join(self.root, digest[:2])
+        if not os.path.isdir(directory):
+            return None
+
+        for name in os.listdir(directory):
+            if name.startswith(digest):
+                return os.path.join(directory, name)
+        return None
+
+    # Caminho de um arquivo gravado pelo armazenamento (dentro de MEDIA_STORE_PATH)
+    def owns(self, path):
+        real = os.path.realpath(path)
+        return real.startswith(os.path.realpath(self.root) + os.sep)
+
+    # Mídia informada pelo cliente: URL http(s) ou `media_hash` de um arquivo
+    # já armazenado (None se o hash não existir). Caminhos locais nunca vêm do
+    # cliente; o serviço WhatsApp leria qualquer arquivo do servidor.
+    def resolve(self, media_url=None, media_hash=None):
+        if media_hash and not media_url:
+            return self.find(media_hash)
+        if not is_remote_url(media_url):
+            raise MediaStoreError('A mídia deve ser uma URL http(s); para arquivos, use o upload ou mediaHash')
+        return media_url
+
+media_store = MediaStore()
@@ -0,0 +1,244 @@
+import datetime
+import json
+import os
+import tempfile
+from sqlalchemy import update
+from src.models.user import db, MessageJob, WhatsAppInstance
+from src.services.background import BackgroundWorker, Periodic, STALE_CHECKS_PER_TIMEOUT
+from src.services.whatsapp_gateway import gateway
+from src.services.circuit_breaker import CircuitOpen
+from src.services.shared_table import SharedTable
+
+# Limite de envios por instância, compartilhado entre os workers do gunicorn
+#
+# Balde de fichas como GCRA (igual ao limitador de requisições): para cada
+# instância guarda-se o instante teórico (TAT) do próximo envio numa
+# SharedTable em MESSAGE_QUEUE_THROTTLE_PATH. Permite rajadas de `burst`
+# envios e repõe uma ficha a cada 1 / rate segundos.
+class InstanceThrottle:
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(int(burst), 1)
+        self.table = SharedTable()
+
+    def open(self, path, slots):
+        self.table.open(path, slots)
+
+    # Retorna 0 se o envio foi liberado ou quantos segundos faltam para o
+    # próximo envio da instância
+    def acquire(self, instance_id):
+        if self.rate <= 0:
+            return 0
+
+        interval = 1.0 / self.rate
+
+        def consume(stored, now):
+            tat = max(stored or now, now)
+            wait = tat - now - (self.burst - 1) * interval
+            if wait > 1e-9:
+                return wait, None
+            return 0, tat + interval
+
+        return self.table.update(f"throttle:{instance_id}", consume)
+
+    # Devolve um envio liberado que acabou não acontecendo
+    def release(self, instance_id):
+        if self.rate <= 0:
+            return
+        interval = 1.0 / self.rate
+        self.table.update(f"throttle:{instance_id}", lambda stored, now: (None, max(stored - interval, now) if stored else None))
+
+# Fila de envio persistida na tabela message_jobs
+#
+# Os jobs são reservados com um UPDATE condicional, então vários processos
+# podem drenar a mesma fila sem broker externo. Jobs presos em 'processing'
+# (processo encerrado no meio do envio) voltam para 'pending' após
+# MESSAGE_QUEUE_LOCK_TIMEOUT segundos; essa verificação roda a cada
+# LOCK_TIMEOUT / STALE_CHECKS_PER_TIMEOUT segundos, não a cada passada.
+class MessageQueue(BackgroundWorker):
+    name = 'message_queue'
+
+    def init_app(self, app):
+        app.config.setdefault('MESSAGE_QUEUE_WORKERS', 2)
+        app.config.setdefault('MESSAGE_QUEUE_POLL_INTERVAL', 1.0)
+        app.config.setdefault('MESSAGE_QUEUE_BATCH_SIZE', 20)
+        app.config.setdefault('MESSAGE_QUEUE_RATE_PER_INSTANCE', 1.0)
+        app.config.setdefault('MESSAGE_QUEUE_BURST_PER_INSTANCE', 1)
+        app.config.setdefault('MESSAGE_QUEUE_MAX_ATTEMPTS', 5)
+        app.config.setdefault('MESSAGE_QUEUE_RETRY_BACKOFF', 5.0)
+        app.config.setdefault('MESSAGE_QUEUE_RETRY_BACKOFF_MAX', 600.0)
+        app.config.setdefault('MESSAGE_QUEUE_LOCK_TIMEOUT', 300)
+        app.config.setdefault('MESSAGE_QUEUE_THROTTLE_PATH', os.path.join(tempfile.gettempdir(), 'sie_api_queue_throttle.bin'))
+        app.config.setdefault('MESSAGE_QUEUE_THROTTLE_SLOTS', 8192)
+
+        super().init_app(app)
+        self.threads = int(app.config['MESSAGE_QUEUE_WORKERS'])
+        self.interval = float(app.config['MESSAGE_QUEUE_POLL_INTERVAL'])
+        self.batch_size = int(app.config['MESSAGE_QUEUE_BATCH_SIZE'])
+        self.max_attempts = int(app.config['MESSAGE_QUEUE_MAX_ATTEMPTS'])
+        self.retry_backoff = float(app.config['MESSAGE_QUEUE_RETRY_BACKOFF'])
+        self.retry_backoff_max = float(app.config['MESSAGE_QUEUE_RETRY_BACKOFF_MAX'])
+        self.lock_timeout = int(app.config['MESSAGE_QUEUE_LOCK_TIMEOUT'])
+        self.stale_check = Periodic(self.lock_timeout / STALE_CHECKS_PER_TIMEOUT)
+        self.throttle = InstanceThrottle(
+            float(app.config['MESSAGE_QUEUE_RATE_PER_INSTANCE']),
+            int(app.config['MESSAGE_QUEUE_BURST_PER_INSTANCE'])
+        )
+        self.throttle.open(app.config['MESSAGE_QUEUE_THROTTLE_PATH'], app.config['MESSAGE_QUEUE_THROTTLE_SLOTS'])
+
+    def enqueue(self, instance, user_id, job_type, payload):
+        job = MessageJob(
+            instance_id=instance.id,
+            user_id=user_id,
+            job_type=job_type,
+            payload=json.dumps(payload),
+            max_attempts=self.max_attempts
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def run_once(self):
+        now = datetime.datetime.utcnow()
+        if self.stale_check.due():
+            self._release_stale(now)
+
+        # Serviço WhatsApp fora do ar: espera o disjuntor em vez de gastar tentativas
+        if gateway.unavailable_for() > 0:
+            return False
+
+        candidates = db.session.execute(
+            db.select(MessageJob.id, MessageJob.instance_id)
+            .where(MessageJob.status == 'pending', MessageJob.next_attempt_at <= now)
+            .order_by(MessageJob.id)
+            .limit(self.batch_size)
+        ).all()
+
+        throttled = {}
+        for job_id, instance_id in candidates:
+            if instance_id in throttled:
+                self._defer(job_id, throttled[instance_id])
+                continue
+
+            wait = self.throttle.acquire(instance_id)
+            if wait > 0:
+                # Instância no limite: adia os jobs dela para o mesmo instante,
+                # mantendo a ordem de chegada e liberando a fila para as demais
+                throttled[instance_id] = now + datetime.timedelta(seconds=wait)
+                self._defer(job_id, throttled[instance_id])
+                continue
+
+            if not self._claim(job_id, now):
+                self.throttle.release(instance_id)
+                continue
+
+            self._process(db.session.get(MessageJob, job_id))
+            return True
+
+        return False
+
+    def _release_stale(self, now):
+        db.session.execute(
+            update(MessageJob)
+            .where(
+                MessageJob.status == 'processing',
+                MessageJob.locked_at < now - datetime.timedelta(seconds=self.lock_timeout)
+            )
+            .values(status='pending', locked_at=None)
+        )
+        db.session.commit()
+
+    def _defer(self, job_id, next_attempt_at):
+        db.session.execute(
+            update(MessageJob)
+            .where(MessageJob.id == job_id, MessageJob.status == 'pending')
+            .values(next_attempt_at=next_attempt_at)
+        )
+        db.session.commit()
+
+    def _claim(self, job_id, now):
+        result = db.session.execute(
+            update(MessageJob)
+            .where(MessageJob.id == job_id, MessageJob.status == 'pending')
+            .values(status='processing', locked_at=now, attempts=MessageJob.attempts + 1)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _process(self, job):
+        instance = db.session.get(WhatsAppInstance, job.instance_id)
+        if not instance:
+            self._finish(job, 'dead', 'Instância não encontrada')
+            return
+
+        payload = json.loads(job.payload)
+        try:
+            if job.job_type == 'message':
+                response = gateway.send_message(
+                    instance.session_id,
+                    payload['to'],
+                    payload['message'],
+                    instance.instance_type
+                )
+            elif job.job_type == 'media':
+                response = gateway.send_media(
+                    instance.session_id,
+                    payload['to'],
+                    payload['mediaUrl'],
+                    payload['mediaType'],
+                    payload.get('caption', ''),
+                    instance.instance_type
+                )
+            else:
+                self._finish(job, 'dead', f"Tipo de job desconhecido: {job.job_type}")
+                return
+        except CircuitOpen as e:
+            self._postpone(job, e.retry_after)
+            return
+        except Exception as e:
+            self._retry(job, str(e))
+            return
+
+        if response.status_code == 200:
+            self._finish(job, 'sent')
+        elif 400 <= response.status_code < 500:
+            # Erros do cliente não melhoram com novas tentativas
+            self._finish(job, 'dead', self._response_error(response))
+        else:
+            self._retry(job, self._response_error(response))
+
+    def _retry(self, job, error):
+        if job.attempts >= job.max_attempts:
+            self._finish(job, 'dead', error)
+            return
+
+        delay = min(self.retry_backoff * (2 ** (job.attempts - 1)), self.retry_backoff_max)
+        job.status = 'pending'
+        job.locked_at = None
+        job.last_error = error
+        job.next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+        db.session.commit()
+
+    # Devolve o job para a fila sem contar a tentativa
+    def _postpone(self, job, delay):
+        job.status = 'pending'
+        job.locked_at = None
+        job.attempts -= 1
+        job.next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=max(delay, 1))
+        db.session.commit()
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.locked_at = None
+        job.last_error = error
+        if status == 'sent':
+            job.sent_at = datetime.datetime.utcnow()
+        db.session.commit()
+
+    def _response_error(self, response):
+        try:
+            return response.json().get('error') or f"HTTP {response.status_code}"
+        except ValueError:
+            return f"HTTP {response.status_code}"
+
+message_queue = MessageQueue()
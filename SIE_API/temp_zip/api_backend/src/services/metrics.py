@@ -0,0 +1,333 @@
+import atexit
+import fcntl
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+# Métricas no formato de texto do Prometheus em /api/metrics
+#
+# Cada processo acumula suas métricas em memória e as grava periodicamente em
+# METRICS_DIR/<pid>.json; a exposição soma os arquivos de todos os processos,
+# de modo que qualquer worker do gunicorn responde pelo conjunto. Contadores
+# e histogramas de processos encerrados continuam somados: o arquivo de cada
+# um é juntado a METRICS_DIR/archive.json (no child_exit do gunicorn e quando
+# um processo inicia as tarefas em segundo plano), o que também impede que um
+# novo processo com o PID de um antigo sobrescreva os totais dele. Gauges só
+# contam processos vivos. Limpe METRICS_DIR ao reiniciar o serviço.
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Contadores e histogramas somados dos processos encerrados
+ARCHIVE = 'archive.json'
+
+METRICS = {
+    'sie_http_requests_total': ('counter', 'Requisições HTTP atendidas'),
+    'sie_http_request_duration_seconds': ('histogram', 'Latência das requisições HTTP'),
+    'sie_http_requests_in_flight': ('gauge', 'Requisições HTTP em andamento'),
+    'sie_gateway_requests_total': ('counter', 'Chamadas ao serviço WhatsApp'),
+    'sie_gateway_request_duration_seconds': ('histogram', 'Latência das chamadas ao serviço WhatsApp'),
+    'sie_gateway_errors_total': ('counter', 'Chamadas ao serviço WhatsApp sem resposta ou com status de erro'),
+    'sie_gateway_circuit_rejections_total': ('counter', 'Chamadas recusadas com o disjuntor do serviço WhatsApp aberto'),
+    'sie_gateway_circuit_transitions_total': ('counter', 'Mudanças de estado do disjuntor do serviço WhatsApp'),
+    'sie_gateway_session_migrations_total': ('counter', 'Sessões migradas entre nós do serviço WhatsApp'),
+    'sie_rate_limit_rejections_total': ('counter', 'Requisições recusadas pelo limitador (429)'),
+    'sie_live_events_subscribers': ('gauge', 'Painéis conectados ao fluxo de eventos em tempo real'),
+    'sie_live_events_overflows_total': ('counter', 'Fluxos de eventos encerrados por fila cheia (painel lento)'),
+    'sie_live_events_upstream_reconnects_total': ('counter', 'Reconexões ao fluxo de eventos do serviço WhatsApp'),
+    'sie_db_queries_total': ('counter', 'Consultas SQL executadas'),
+    'sie_db_query_errors_total': ('counter', 'Consultas SQL que falharam'),
+    'sie_db_query_duration_seconds': ('histogram', 'Duração das consultas SQL'),
+    'sie_db_queries_per_request': ('histogram', 'Consultas SQL por requisição HTTP'),
+    'sie_db_time_per_request_seconds': ('histogram', 'Tempo em consultas SQL por requisição HTTP'),
+}
+
+BUCKETS = {
+    'sie_db_queries_per_request': QUERY_COUNT_BUCKETS,
+}
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+# Soma os contadores e histogramas de `data` (formato de Metrics._snapshot)
+# em `counters` e `histograms`, indexados por (nome, rótulos)
+def _accumulate(counters, histograms, data):
+    for name, labels, value in data['counters']:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+
+    for name, labels, buckets, total, count in data['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+        merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+        merged[1] += total
+        merged[2] += count
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Metrics:
+    def __init__(self, app=None):
+        self.directory = None
+        self.flush_interval = 1.0
+        self.token = None
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'sie_api_metrics'))
+        app.config.setdefault('METRICS_FLUSH_INTERVAL', 1.0)
+        app.config.setdefault('METRICS_TOKEN', None)
+
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = float(app.config['METRICS_FLUSH_INTERVAL'])
+        self.token = app.config['METRICS_TOKEN']
+        os.makedirs(self.directory, exist_ok=True)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/api/metrics', 'metrics', self.expose)
+        app.extensions['metrics'] = self
+        atexit.register(self.flush)
+
+    # Consultas SQL: registrado por engine (chamar dentro do app context)
+    def instrument_engine(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    # Registro
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge_add(self, name, labels=(), amount=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = BUCKETS.get(name, HTTP_BUCKETS)
+        key = (name, tuple(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][index] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def observe_gateway(self, endpoint, duration, status_code=None, error=None):
+        labels = (('endpoint', endpoint),)
+        self.inc('sie_gateway_requests_total', labels + (('status', status_code or 'error'),))
+        self.observe('sie_gateway_request_duration_seconds', labels, duration)
+        if error is not None:
+            self.inc('sie_gateway_errors_total', labels + (('kind', type(error).__name__),))
+        elif status_code >= 400:
+            self.inc('sie_gateway_errors_total', labels + (('kind', f"http_{status_code}"),))
+
+    # Ganchos do Flask
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_time = 0.0
+        self.gauge_add('sie_http_requests_in_flight')
+
+    def _after_request(self, response):
+        if 'metrics_started' in g:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            duration = time.perf_counter() - g.metrics_started
+            labels = (('method', request.method), ('route', route))
+
+            self.inc('sie_http_requests_total', labels + (('status', response.status_code),))
+            self.observe('sie_http_request_duration_seconds', labels, duration)
+            self.observe('sie_db_queries_per_request', (('route', route),), g.metrics_queries)
+            self.observe('sie_db_time_per_request_seconds', (('route', route),), g.metrics_query_time)
+        return response
+
+    def _teardown_request(self, error=None):
+        if g.pop('metrics_started', None) is not None:
+            self.gauge_add('sie_http_requests_in_flight', amount=-1)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._record_query(time.perf_counter() - conn.info['metrics_started'].pop())
+
+    # Consulta que falhou: after_cursor_execute não é chamado, então o início
+    # é retirado aqui (senão fica em conn.info e desalinha as próximas)
+    def _handle_error(self, context):
+        started = context.connection.info.get('metrics_started') if context.connection is not None else None
+        if context.execution_context is None or not started:
+            return
+        self._record_query(time.perf_counter() - started.pop())
+        self.inc('sie_db_query_errors_total', (('kind', type(context.original_exception).__name__),))
+
+    def _record_query(self, duration):
+        self.inc('sie_db_queries_total')
+        self.observe('sie_db_query_duration_seconds', (), duration)
+        if has_request_context() and 'metrics_queries' in g:
+            g.metrics_queries += 1
+            g.metrics_query_time += duration
+
+    # Persistência entre processos
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'gauges': [[name, labels, value] for (name, labels), value in self._gauges.items()],
+                'histograms': [
+                    [name, labels, list(buckets), total, count]
+                    for (name, labels), (buckets, total, count) in self._histograms.items()
+                ]
+            }
+
+    def _write(self, filename, data):
+        fd, temporary = tempfile.mkstemp(dir=self.directory, prefix='.metrics-')
+        with os.fdopen(fd, 'w') as output:
+            json.dump(data, output)
+        os.replace(temporary, os.path.join(self.directory, filename))
+
+    def flush(self):
+        if self.directory is None:
+            return
+        self._last_flush = time.monotonic()
+        self._write(f"{os.getpid()}.json", self._snapshot())
+
+    # Junta a ARCHIVE os arquivos dos processos encerrados (ou só o de `pid`,
+    # no child_exit do gunicorn) e os apaga. O arquivo com o PID deste
+    # processo também entra: se existe antes da primeira gravação, é de um
+    # processo antigo com o mesmo PID. Por isso é chamado na inicialização do
+    # processo, antes de ele atender requisições.
+    def merge_dead_processes(self, pid=None):
+        if self.directory is None:
+            return
+
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            dead = []
+            for filename in os.listdir(self.directory):
+                owner = filename[:-5]
+                if not filename.endswith('.json') or not owner.isdigit():
+                    continue
+                owner = int(owner)
+                if (owner == pid) if pid is not None else (owner == os.getpid() or not self._process_alive(owner)):
+                    dead.append(filename)
+            if not dead:
+                return
+
+            counters, histograms = {}, {}
+            for filename in [ARCHIVE] + dead:
+                try:
+                    with open(os.path.join(self.directory, filename)) as source:
+                        _accumulate(counters, histograms, json.load(source))
+                except (OSError, ValueError):
+                    continue
+
+            self._write(ARCHIVE, {
+                'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+                'gauges': [],
+                'histograms': [
+                    [name, labels, buckets, total, count]
+                    for (name, labels), (buckets, total, count) in histograms.items()
+                ]
+            })
+            for filename in dead:
+                os.remove(os.path.join(self.directory, filename))
+
+    def _process_alive(self, pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def collect(self):
+        self.flush()
+        counters, gauges, histograms = {}, {}, {}
+
+        # Trava compartilhada: uma junção em andamento não conta nada duas vezes
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            files = []
+            for filename in os.listdir(self.directory):
+                if not filename.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(self.directory, filename)) as source:
+                        files.append((filename, json.load(source)))
+                except (OSError, ValueError):
+                    continue
+
+        for filename, data in files:
+            _accumulate(counters, histograms, data)
+            owner = filename[:-5]
+            if owner.isdigit() and self._process_alive(int(owner)):
+                for name, labels, value in data['gauges']:
+                    key = (name, tuple(map(tuple, labels)))
+                    gauges[key] = gauges.get(key, 0) + value
+
+        return counters, gauges, histograms
+
+    def render(self):
+        counters, gauges, histograms = self.collect()
+        samples = {}
+        for (name, labels), value in list(counters.items()) + list(gauges.items()):
+            samples.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), (buckets, total, count) in histograms.items():
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS.get(name, HTTP_BUCKETS), buckets):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        output = []
+        for name, (metric_type, help_text) in METRICS.items():
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(sorted(samples.get(name, [])))
+        return '\n'.join(output) + '\n'
+
+    def expose(self):
+        # Com METRICS_TOKEN definido, exige "Authorization: Bearer <token>"
+        if self.token and not hmac.compare_digest(
+            request.headers.get('Authorization', ''), f"Bearer {self.token}"
+        ):
+            return Response('Não autorizado\n', status=401, mimetype='text/plain')
+        return Response(self.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+metrics = Metrics()
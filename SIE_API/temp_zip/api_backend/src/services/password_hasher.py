@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import jsonify
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class HasherBusy(Exception):
+    pass
+
+# Hash de senhas fora das threads de requisição
+#
+# generate_password_hash/check_password_hash rodam num pool de processos
+# limitado (PASSWORD_HASH_WORKERS). Quando há mais de PASSWORD_HASH_MAX_PENDING
+# hashes em andamento no processo, novas chamadas falham com HasherBusy, que
+# vira um 503 para o cliente em vez de travar todas as threads do Flask.
+# Com PASSWORD_HASH_WORKERS = 0 o hash é calculado na própria thread.
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.method = 'scrypt'
+        self.workers = 0
+        self.max_pending = 0
+        self.timeout = 30
+        self._executor = None
+        self._pid = None
+        self._slots = None
+        self._prefix = None
+        self.start_method = 'spawn'
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 4 * (os.cpu_count() or 1))
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 30)
+        app.config.setdefault('PASSWORD_HASH_START_METHOD', 'fork' if os.name == 'posix' else 'spawn')
+
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = int(app.config['PASSWORD_HASH_WORKERS'])
+        self.max_pending = int(app.config['PASSWORD_HASH_MAX_PENDING'])
+        self.timeout = float(app.config['PASSWORD_HASH_TIMEOUT'])
+        self.start_method = app.config['PASSWORD_HASH_START_METHOD']
+        self._slots = threading.BoundedSemaphore(max(self.max_pending, 1))
+        self._prefix = None
+
+        app.extensions['password_hasher'] = self
+        app.register_error_handler(HasherBusy, self._busy_response)
+
+    # Cria os processos do pool antes de existirem outras threads no processo
+    def warm_up(self):
+        if self.workers > 0:
+            self.executor.submit(int).result()
+
+    def _busy_response(self, error):
+        response = jsonify({'message': 'Servidor ocupado, tente novamente em instantes.'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+
+    @property
+    def executor(self):
+        # O pool é recriado após um fork (workers do gunicorn)
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            with self._lock:
+                if self._executor is None or self._pid != pid:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context(self.start_method)
+                    )
+                    self._pid = pid
+        return self._executor
+
+    def _run(self, function, *args):
+        if self.workers <= 0:
+            return function(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            return self.executor.submit(function, *args).result(timeout=self.timeout)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    # Indica se o hash foi gerado com método/custo diferente do configurado
+    def needs_rehash(self, password_hash):
+        if self._prefix is None:
+            # Método com os parâmetros padrão do werkzeug, ex.: scrypt:32768:8:1
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,159 @@
+import math
+import os
+import re
+import tempfile
+from functools import wraps
+from flask import g, jsonify, request
+from src.services.metrics import metrics
+from src.services.shared_table import SharedTable
+
+PERIODS = {'s': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+LIMIT_FORMAT = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([a-z]*)\s*$')
+
+# Converte '10/minute', '5/hour', '30/10s' ou '100/60' em (limite, período em segundos).
+# Vazio ou '0' desativa a regra (None).
+def parse_limit(value):
+    if value is None or str(value).strip() in ('', '0'):
+        return None
+    match = LIMIT_FORMAT.match(str(value).lower())
+    unit = (match.group(3) or 's') if match else None
+    if unit not in PERIODS and unit and unit.endswith('s'):
+        unit = unit[:-1]
+    if unit not in PERIODS:
+        raise ValueError(f"Limite inválido: {value!r} (use, por exemplo, '10/minute')")
+
+    period = int(match.group(2) or 1) * PERIODS[unit]
+    if int(match.group(1)) <= 0 or period <= 0:
+        return None
+    return int(match.group(1)), float(period)
+
+# Chave de cada tipo de limite; None deixa a requisição sem essa verificação
+def _key_ip(args, kwargs):
+    return request.remote_addr
+
+def _key_user(args, kwargs):
+    return args[0].id if args else None
+
+def _key_instance(args, kwargs):
+    return kwargs.get('instance_id')
+
+def _key_email(args, kwargs):
+    data = request.get_json(silent=True)
+    email = data.get('email') if isinstance(data, dict) else None
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+KEYS = {'ip': _key_ip, 'user': _key_user, 'instance': _key_instance, 'email': _key_email}
+
+# Limitador de requisições compartilhado entre os workers do gunicorn
+#
+# Balde de fichas implementado como GCRA: para cada chave guarda-se só o
+# instante teórico de chegada (TAT) da próxima requisição. A regra
+# '10/minute' permite rajadas de 10 e repõe uma ficha a cada 6 segundos.
+# Os TATs ficam numa SharedTable em RATE_LIMIT_PATH, com uma posição por
+# chave (regra + IP, usuário, instância ou e-mail). Quando falta espaço, a
+# posição reaproveitada é a de menor TAT, que é a de um balde já cheio
+# sempre que houver um; com RATE_LIMIT_SLOTS folgado, isso não acontece com
+# chaves ativas.
+class RateLimiter:
+    def __init__(self, app=None):
+        self.enabled = True
+        self.table = SharedTable()
+        self._limits = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATE_LIMIT_ENABLED', True)
+        app.config.setdefault('RATE_LIMIT_PATH', os.path.join(tempfile.gettempdir(), 'sie_api_rate_limit.bin'))
+        app.config.setdefault('RATE_LIMIT_SLOTS', 65536)
+        app.config.setdefault('RATE_LIMIT_LOGIN', '10/minute')
+        app.config.setdefault('RATE_LIMIT_LOGIN_ACCOUNT', '5/minute')
+        app.config.setdefault('RATE_LIMIT_REGISTER', '5/hour')
+        app.config.setdefault('RATE_LIMIT_FORGOT_PASSWORD', '5/hour')
+        app.config.setdefault('RATE_LIMIT_SEND', '300/minute')
+        app.config.setdefault('RATE_LIMIT_SEND_INSTANCE', '60/minute')
+
+        self.enabled = bool(app.config['RATE_LIMIT_ENABLED'])
+        self._limits = {}
+        for name, value in app.config.items():
+            if name.startswith('RATE_LIMIT_') and name not in ('RATE_LIMIT_ENABLED', 'RATE_LIMIT_PATH', 'RATE_LIMIT_SLOTS'):
+                self._limits[name[len('RATE_LIMIT_'):].lower()] = parse_limit(value)
+
+        if self.enabled:
+            self.table.open(app.config['RATE_LIMIT_PATH'], app.config['RATE_LIMIT_SLOTS'])
+        app.after_request(self._after_request)
+        app.extensions['rate_limiter'] = self
+
+    # Consome uma ficha de `key`. Retorna (permitida, restantes, segundos até
+    # o balde encher, segundos até a próxima ficha quando recusada).
+    def hit(self, key, limit, period):
+        interval = period / limit
+
+        def consume(stored, now):
+            tat = max(stored or now, now)
+            new_tat = tat + interval
+            allow_at = new_tat - period
+            if allow_at > now + 1e-9:
+                return (False, 0, tat - now, allow_at - now), None
+            return (True, int((now - allow_at) / interval + 1e-9), new_tat - now, 0.0), new_tat
+
+        return self.table.update(key, consume)
+
+    # Verifica a regra `name` para a requisição atual; responde 429 se acabou
+    def check(self, name, by, args, kwargs):
+        rule = self._limits.get(name)
+        if not self.enabled or rule is None:
+            return None
+        value = KEYS[by](args, kwargs)
+        if value is None:
+            return None
+
+        limit, period = rule
+        allowed, remaining, reset, retry_after = self.hit(f"{name}:{by}:{value}", limit, period)
+
+        # Os cabeçalhos mostram a regra mais próxima de acabar
+        current = g.get('rate_limit')
+        if current is None or (remaining, -reset) < (current[1], -current[2]):
+            g.rate_limit = (limit, remaining, reset, period)
+
+        if allowed:
+            return None
+
+        metrics.inc('sie_rate_limit_rejections_total', (('rule', name),))
+        wait = max(1, math.ceil(retry_after))
+        response = jsonify({'message': f"Muitas requisições! Tente novamente em {wait} segundos."})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(wait)
+        return response
+
+    def _after_request(self, response):
+        state = g.get('rate_limit')
+        if state is not None:
+            limit, remaining, reset, period = state
+            response.headers['RateLimit-Limit'] = str(limit)
+            response.headers['RateLimit-Remaining'] = str(remaining)
+            response.headers['RateLimit-Reset'] = str(math.ceil(reset))
+            response.headers['RateLimit-Policy'] = f"{limit};w={int(period)}"
+        return response
+
+rate_limiter = RateLimiter()
+
+# Decorator de limite por regra: a regra 'login' usa RATE_LIMIT_LOGIN e `by`
+# escolhe a chave ('ip', 'email', 'user' ou 'instance'). Nas rotas
+# autenticadas, use depois de token_required.
+def rate_limit(name, by='ip'):
+    if by not in KEYS:
+        raise ValueError(f"Chave de limite desconhecida: {by}")
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            rejected = rate_limiter.check(name, by, args, kwargs)
+            if rejected is not None:
+                return rejected
+            return f(*args, **kwargs)
+
+        return decorated
+
+    return decorator
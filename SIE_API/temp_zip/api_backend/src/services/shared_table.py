@@ -0,0 +1,92 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+# Cada conjunto da tabela tem WAYS posições (chave de 64 bits, valor)
+WAYS = 8
+SLOT = struct.Struct('<Qd')
+BUCKET = struct.Struct('<' + 'Qd' * WAYS)
+
+# Tabela chave → número de tamanho fixo, compartilhada entre processos
+#
+# O arquivo em `path` é mapeado em memória (mmap) por todos os workers do
+# gunicorn. A chave escolhe um conjunto de WAYS posições, travado com fcntl
+# só durante a leitura ou a alteração. Os valores são instantes (time.time()):
+# chave nova num conjunto cheio ocupa a posição de menor valor, a mais antiga.
+class SharedTable:
+    def __init__(self):
+        self.path = None
+        self.buckets = 0
+        self._map = None
+        self._fd = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._map is not None
+
+    # Abre (ou cria) a tabela. Um arquivo de tamanho diferente (número de
+    # posições alterado) é zerado.
+    def open(self, path, slots):
+        buckets = max(WAYS, int(slots)) // WAYS
+        size = buckets * BUCKET.size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+
+        self.close()
+        self._fd = fd
+        self._map = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.path = path
+        self.buckets = buckets
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._map = self._fd = None
+
+    # Chama func(valor atual ou None, agora) com o conjunto travado. func
+    # retorna (resultado, novo valor); novo valor None mantém a tabela como está.
+    def update(self, key, func):
+        digest = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        offset = (digest % self.buckets) * BUCKET.size
+
+        with self._lock:
+            # Locks do fcntl são por processo: o threading.Lock separa as threads
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, offset)
+            try:
+                values = BUCKET.unpack_from(self._map, offset)
+                position = None
+                oldest = 0
+                for index in range(WAYS):
+                    if values[2 * index] == digest:
+                        position = index
+                        break
+                    if values[2 * index + 1] < values[2 * oldest + 1]:
+                        oldest = index
+
+                current = values[2 * position + 1] if position is not None else None
+                result, value = func(current, time.time())
+                if value is not None:
+                    SLOT.pack_into(self._map, offset + (oldest if position is None else position) * SLOT.size, digest, value)
+                return result
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, offset)
+
+    def get(self, key):
+        return self.update(key, lambda current, now: (current, None))
+
+    def set(self, key, value):
+        self.update(key, lambda current, now: (None, value))
@@ -0,0 +1,204 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from flask import abort, current_app, request
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# Tipos que valem a pena comprimir (imagens e fontes já vêm comprimidas)
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+# Referências a arquivos locais nas páginas: href="/css/styles.css", src="/js/app.js"
+REFERENCE = re.compile(r'''((?:href|src)=["'])/([^"'?#:]+)(["'])''')
+
+# Um arquivo do painel já lido e comprimido: corpo e ETag por codificação
+class Asset:
+    __slots__ = ('path', 'mimetype', 'bodies', 'etags')
+
+    def __init__(self, path, mimetype, body, digest):
+        self.path = path
+        self.mimetype = mimetype
+        self.bodies = {'identity': body}
+        self.etags = {'identity': digest}
+
+    def add_encoding(self, encoding, body, suffix):
+        # Só guarda a versão comprimida se ela for menor
+        if len(body) < len(self.bodies['identity']):
+            self.bodies[encoding] = body
+            self.etags[encoding] = f"{self.etags['identity']}-{suffix}"
+
+    @property
+    def compressed(self):
+        return len(self.bodies) > 1
+
+# Arquivos estáticos do painel servidos da memória
+#
+# Na inicialização, todos os arquivos de src/static são lidos, recebem um hash
+# do conteúdo e são comprimidos uma única vez com gzip (e brotli, se o pacote
+# estiver instalado). Cada arquivo que não é página também fica disponível num
+# endereço com o hash (/css/styles.3f2a9c1b.css), e as páginas passam a apontar
+# para ele: esses endereços são servidos com "Cache-Control: immutable" e o
+# navegador não os consulta de novo até o conteúdo mudar. As páginas e os
+# endereços sem hash usam "no-cache" com ETag (revalidação com 304). Caminhos
+# desconhecidos recebem o index.html já em memória, sem consultar o disco.
+# Com STATIC_AUTO_RELOAD (ou o app em debug), o manifesto é refeito quando
+# algum arquivo muda.
+class StaticAssets:
+    def __init__(self, app=None):
+        self.root = None
+        self.routes = {}
+        self.manifest = {}
+        self.signature = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STATIC_PRECOMPRESS', True)
+        app.config.setdefault('STATIC_COMPRESS_MIN_SIZE', 512)
+        app.config.setdefault('STATIC_MAX_AGE', 31536000)
+        app.config.setdefault('STATIC_FINGERPRINT_LENGTH', 10)
+        app.config.setdefault('STATIC_FALLBACK', 'index.html')
+        app.config.setdefault('STATIC_AUTO_RELOAD', False)
+
+        self.root = app.static_folder
+        self.precompress = bool(app.config['STATIC_PRECOMPRESS'])
+        self.min_size = int(app.config['STATIC_COMPRESS_MIN_SIZE'])
+        self.max_age = int(app.config['STATIC_MAX_AGE'])
+        self.fingerprint_length = int(app.config['STATIC_FINGERPRINT_LENGTH'])
+        self.fallback = app.config['STATIC_FALLBACK']
+        self.auto_reload = bool(app.config['STATIC_AUTO_RELOAD'])
+        self.build()
+
+        app.add_url_rule('/', 'serve', self.serve, defaults={'path': ''})
+        app.add_url_rule('/<path:path>', 'serve', self.serve)
+        app.extensions['static_assets'] = self
+
+    # Caminhos relativos (com "/") de todos os arquivos, exceto os ocultos
+    def _files(self):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+            for filename in sorted(filenames):
+                if not filename.startswith('.'):
+                    files.append(os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, '/'))
+        return files
+
+    def _signature(self, files):
+        signature = []
+        for path in files:
+            stat = os.stat(os.path.join(self.root, path))
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _asset(self, path, body):
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        asset = Asset(path, mimetype, body, hashlib.sha256(body).hexdigest()[:16])
+
+        if self.precompress and len(body) >= self.min_size and mimetype.startswith(COMPRESSIBLE_TYPES):
+            asset.add_encoding('gzip', gzip.compress(body, compresslevel=9, mtime=0), 'gz')
+            if brotli is not None:
+                asset.add_encoding('br', brotli.compress(body, quality=11), 'br')
+        return asset
+
+    def _fingerprinted(self, path, asset):
+        base, ext = os.path.splitext(path)
+        return f"{base}.{asset.etags['identity'][:self.fingerprint_length]}{ext}"
+
+    # Lê e comprime tudo de novo e troca o manifesto de uma vez
+    def build(self):
+        with self._lock:
+            if not self.root or not os.path.isdir(self.root):
+                self.routes, self.manifest, self.signature = {}, {}, ()
+                return
+
+            files = self._files()
+            signature = self._signature(files)
+            routes = {}
+            manifest = {}
+
+            # Primeiro os arquivos que não são páginas, para que as páginas
+            # possam apontar para os endereços com hash
+            pages = []
+            for path in files:
+                with open(os.path.join(self.root, path), 'rb') as file:
+                    body = file.read()
+                if path.endswith('.html'):
+                    pages.append((path, body))
+                    continue
+
+                asset = self._asset(path, body)
+                fingerprinted = self._fingerprinted(path, asset)
+                routes[path] = (asset, False)
+                routes[fingerprinted] = (asset, True)
+                manifest[path] = fingerprinted
+
+            def rewrite(match):
+                target = manifest.get(match.group(2))
+                if target is None:
+                    return match.group(0)
+                return f"{match.group(1)}/{target}{match.group(3)}"
+
+            for path, body in pages:
+                text = REFERENCE.sub(rewrite, body.decode('utf-8'))
+                routes[path] = (self._asset(path, text.encode('utf-8')), False)
+
+            self.routes, self.manifest, self.signature = routes, manifest, signature
+
+    def _reload_if_changed(self):
+        try:
+            changed = self._signature(self._files()) != self.signature
+        except OSError:
+            changed = True
+        if changed:
+            self.build()
+
+    # Endereço com hash de um arquivo (ex.: url_for('css/styles.css'))
+    def url_for(self, path):
+        return '/' + self.manifest.get(path.lstrip('/'), path.lstrip('/'))
+
+    def _negotiate(self, asset):
+        best, best_quality = 'identity', 0
+        for encoding in ('br', 'gzip'):
+            if encoding in asset.bodies:
+                quality = request.accept_encodings[encoding]
+                if quality > best_quality:
+                    best, best_quality = encoding, quality
+        return best
+
+    def serve(self, path):
+        if self.auto_reload or current_app.debug:
+            self._reload_if_changed()
+
+        entry = self.routes.get(path) or self.routes.get(self.fallback)
+        if entry is None:
+            abort(404)
+        asset, immutable = entry
+
+        encoding = self._negotiate(asset)
+        etag = asset.etags[encoding]
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': f"public, max-age={self.max_age}, immutable" if immutable else 'no-cache'
+        }
+        if asset.compressed:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if request.if_none_match.contains_weak(etag):
+            return current_app.response_class(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return current_app.response_class(asset.bodies[encoding], mimetype=asset.mimetype, headers=headers)
+
+static_assets = StaticAssets()
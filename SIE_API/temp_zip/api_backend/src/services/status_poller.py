@@ -0,0 +1,119 @@
+import datetime
+import os
+import tempfile
+import requests
+from sqlalchemy import or_, true, update
+from src.models.user import db, GatewayNode, WhatsAppInstance
+from src.services.background import BackgroundWorker, LeaderLock
+from src.services.whatsapp_gateway import gateway
+from src.services.gateway_nodes import gateway_nodes
+from src.services.circuit_breaker import CircuitOpen
+
+# Atualiza o status de conexão das instâncias em segundo plano
+#
+# A cada passada faz uma chamada a /instances em cada nó do serviço WhatsApp e
+# grava no banco apenas as instâncias cujo status mudou, em lote e numa só
+# transação (com status_checked_at = horário da mudança). O horário da última
+# verificação fica em gateway_nodes.status_checked_at, uma linha por nó.
+# Instâncias de um nó que não respondeu mantêm o status anterior.
+#
+# Só um processo por servidor faz as passadas: o que conseguir a trava em
+# STATUS_POLL_LOCK_PATH. Os demais workers tentam de novo a cada intervalo.
+class StatusPoller(BackgroundWorker):
+    name = 'status_poller'
+
+    def __init__(self, app=None):
+        self.leader = LeaderLock()
+        super().__init__(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STATUS_POLL_INTERVAL', 15.0)
+        app.config.setdefault('STATUS_POLL_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'sie_api_status_poller.lock'))
+
+        super().init_app(app)
+        self.interval = float(app.config['STATUS_POLL_INTERVAL'])
+        self.leader = LeaderLock(app.config['STATUS_POLL_LOCK_PATH'])
+
+    def run_once(self):
+        if self.leader.acquire():
+            self.poll()
+        # Sempre aguarda o intervalo entre as passadas
+        return False
+
+    def poll(self):
+        nodes = gateway_nodes.snapshot().nodes
+        targets = [(node.id, node.url.rstrip('/')) for node in nodes.values()] or [(None, gateway.base_url)]
+
+        connected_sessions = set()
+        failed_nodes = []
+        for node_id, url in targets:
+            try:
+                response = gateway.list_instances(url)
+                response.raise_for_status()
+            except CircuitOpen:
+                # Nó fora do ar: o disjuntor já registrou a falha
+                failed_nodes.append(node_id)
+                continue
+            except requests.RequestException as e:
+                self.app.logger.warning('Falha ao consultar as instâncias em %s: %s', url, e)
+                failed_nodes.append(node_id)
+                continue
+
+            connected_sessions.update(
+                item['id'] for item in response.json()
+                if item.get('status') == 'connected'
+            )
+
+        if len(failed_nodes) == len(targets):
+            return 0
+        now = datetime.datetime.utcnow()
+
+        table = WhatsAppInstance.__table__
+        checked = or_(table.c.gateway_node_id.is_(None), table.c.gateway_node_id.notin_(failed_nodes)) if failed_nodes else true()
+        rows = db.session.execute(
+            db.select(WhatsAppInstance.id, WhatsAppInstance.session_id, WhatsAppInstance.is_connected).where(checked)
+        ).all()
+
+        became_connected = []
+        became_disconnected = []
+        for instance_id, session_id, is_connected in rows:
+            connected = session_id in connected_sessions
+            if connected != bool(is_connected):
+                (became_connected if connected else became_disconnected).append(instance_id)
+
+        # updated_at é mantido: a mudança de status não é uma edição da instância
+        if became_connected:
+            db.session.execute(
+                update(table)
+                .where(table.c.id.in_(became_connected))
+                .values(is_connected=True, status_checked_at=now, updated_at=table.c.updated_at)
+            )
+        if became_disconnected:
+            db.session.execute(
+                update(table)
+                .where(table.c.id.in_(became_disconnected))
+                .values(is_connected=False, status_checked_at=now, updated_at=table.c.updated_at)
+            )
+        checked_nodes = [node_id for node_id, _ in targets if node_id is not None and node_id not in failed_nodes]
+        if checked_nodes:
+            nodes = GatewayNode.__table__
+            db.session.execute(
+                update(nodes)
+                .where(nodes.c.id.in_(checked_nodes))
+                .values(status_checked_at=now, updated_at=nodes.c.updated_at)
+            )
+        db.session.commit()
+
+        return len(became_connected) + len(became_disconnected)
+
+    # Consulta o status de uma única instância diretamente no serviço
+    def refresh(self, instance):
+        response = gateway.status(instance.session_id, instance.instance_type)
+        status_data = response.json()
+
+        if status_data.get('success'):
+            instance.is_connected = status_data.get('status', {}).get('connected', False)
+            instance.status_checked_at = datetime.datetime.utcnow()
+            db.session.commit()
+
+status_poller = StatusPoller()
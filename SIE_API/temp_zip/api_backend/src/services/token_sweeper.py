@@ -0,0 +1,42 @@
+import datetime
+from sqlalchemy import update
+from src.models.user import db, User
+from src.services.background import BackgroundWorker
+
+# Remove periodicamente os tokens de recuperação de senha expirados
+#
+# Trabalha em lotes de TOKEN_SWEEP_BATCH_SIZE linhas (uma transação curta por
+# lote) para não segurar locks na tabela users.
+class TokenSweeper(BackgroundWorker):
+    name = 'token_sweeper'
+
+    def init_app(self, app):
+        app.config.setdefault('TOKEN_SWEEP_INTERVAL', 3600.0)
+        app.config.setdefault('TOKEN_SWEEP_BATCH_SIZE', 1000)
+
+        super().init_app(app)
+        self.interval = float(app.config['TOKEN_SWEEP_INTERVAL'])
+        self.batch_size = int(app.config['TOKEN_SWEEP_BATCH_SIZE'])
+
+    def run_once(self):
+        # Lote cheio: ainda pode haver tokens expirados, continua sem esperar
+        return self.sweep_batch() == self.batch_size
+
+    def sweep_batch(self):
+        now = datetime.datetime.utcnow()
+        ids = db.session.execute(
+            db.select(User.id)
+            .where(User.reset_token_expires_at < now)
+            .limit(self.batch_size)
+        ).scalars().all()
+
+        if ids:
+            db.session.execute(
+                update(User)
+                .where(User.id.in_(ids))
+                .values(reset_password_token=None, reset_token_expires_at=None, updated_at=User.updated_at)
+            )
+        db.session.commit()
+        return len(ids)
+
+token_sweeper = TokenSweeper()
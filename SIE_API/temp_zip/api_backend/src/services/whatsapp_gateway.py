@@ -0,0 +1,320 @@
+import math
+import os
+import threading
+import time
+import requests
+from flask import jsonify
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from src.services.circuit_breaker import CircuitBreaker, CircuitOpen
+from src.services.metrics import metrics
+
+# Cliente HTTP para o serviço WhatsApp (Node.js)
+#
+# Cada processo (worker do gunicorn) mantém uma única sessão com pool de
+# conexões keep-alive, timeouts de conexão/leitura e retentativas com backoff
+# apenas para chamadas idempotentes (GET). Envios (POST) nunca são repetidos
+# após a requisição ter chegado ao gateway.
+#
+# Um disjuntor (CircuitBreaker) acompanha as falhas de conexão, timeouts e
+# respostas 502/503/504. Com o serviço fora do ar, as chamadas falham na hora
+# com CircuitOpen (503 + Retry-After para o cliente) em vez de esperar pelo
+# timeout, e GET /health decide quando voltar a liberar as chamadas.
+#
+# Com vários nós do serviço WhatsApp, `router` (o gateway_nodes) informa a URL
+# do nó de cada sessão e cada nó tem o seu disjuntor. Sem router, todas as
+# chamadas vão para WHATSAPP_SERVICE_URL.
+class WhatsAppGateway:
+    def __init__(self, app=None):
+        self.base_url = None
+        self.pool_size = 20
+        self.connect_timeout = 3.05
+        self.read_timeout = 30
+        self.max_retries = 2
+        self.retry_backoff = 0.3
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._logger = None
+        self._breaker_options = None
+        self.breakers = {}
+        self.router = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('WHATSAPP_SERVICE_URL', 'http://localhost:3000/api')
+        app.config.setdefault('WHATSAPP_POOL_SIZE', 20)
+        app.config.setdefault('WHATSAPP_CONNECT_TIMEOUT', 3.05)
+        app.config.setdefault('WHATSAPP_READ_TIMEOUT', 30)
+        app.config.setdefault('WHATSAPP_MAX_RETRIES', 2)
+        app.config.setdefault('WHATSAPP_RETRY_BACKOFF', 0.3)
+        app.config.setdefault('WHATSAPP_BREAKER_ENABLED', True)
+        app.config.setdefault('WHATSAPP_BREAKER_FAILURE_RATE', 0.5)
+        app.config.setdefault('WHATSAPP_BREAKER_MIN_CALLS', 5)
+        app.config.setdefault('WHATSAPP_BREAKER_WINDOW', 30)
+        app.config.setdefault('WHATSAPP_BREAKER_OPEN_TIMEOUT', 5)
+        app.config.setdefault('WHATSAPP_BREAKER_MAX_OPEN_TIMEOUT', 60)
+        app.config.setdefault('WHATSAPP_HEALTH_TIMEOUT', 2)
+
+        self.base_url = app.config['WHATSAPP_SERVICE_URL'].rstrip('/')
+        self.pool_size = int(app.config['WHATSAPP_POOL_SIZE'])
+        self.connect_timeout = float(app.config['WHATSAPP_CONNECT_TIMEOUT'])
+        self.read_timeout = float(app.config['WHATSAPP_READ_TIMEOUT'])
+        self.max_retries = int(app.config['WHATSAPP_MAX_RETRIES'])
+        self.retry_backoff = float(app.config['WHATSAPP_RETRY_BACKOFF'])
+        self.health_timeout = float(app.config['WHATSAPP_HEALTH_TIMEOUT'])
+        self._logger = app.logger
+
+        self.breakers = {}
+        self._breaker_options = None
+        if app.config['WHATSAPP_BREAKER_ENABLED']:
+            self._breaker_options = {
+                'failure_rate': float(app.config['WHATSAPP_BREAKER_FAILURE_RATE']),
+                'min_calls': int(app.config['WHATSAPP_BREAKER_MIN_CALLS']),
+                'window': float(app.config['WHATSAPP_BREAKER_WINDOW']),
+                'open_timeout': float(app.config['WHATSAPP_BREAKER_OPEN_TIMEOUT']),
+                'max_open_timeout': float(app.config['WHATSAPP_BREAKER_MAX_OPEN_TIMEOUT'])
+            }
+
+        app.extensions['whatsapp_gateway'] = self
+        app.register_error_handler(CircuitOpen, self._unavailable_response)
+
+    def _unavailable_response(self, error):
+        response = jsonify({
+            'message': 'Serviço WhatsApp indisponível, tente novamente em instantes.',
+            'error': str(error)
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+        return response
+
+    # Disjuntor do nó com a URL base informada, criado no primeiro uso
+    def breaker_for(self, base_url):
+        if self._breaker_options is None:
+            return None
+
+        breaker = self.breakers.get(base_url)
+        if breaker is None:
+            with self._lock:
+                breaker = self.breakers.get(base_url)
+                if breaker is None:
+                    breaker = CircuitBreaker(
+                        'whatsapp_gateway' if base_url == self.base_url else f"whatsapp_gateway {base_url}",
+                        probe=lambda: self._probe(base_url),
+                        on_change=self._breaker_changed,
+                        **self._breaker_options
+                    )
+                    self.breakers[base_url] = breaker
+        return breaker
+
+    # Disjuntor de WHATSAPP_SERVICE_URL
+    @property
+    def breaker(self):
+        return self.breaker_for(self.base_url)
+
+    # URL base do nó que mantém a sessão
+    def url_for(self, session_id):
+        if self.router is None or session_id is None:
+            return self.base_url
+        return self.router.url_for(session_id)
+
+    # URLs base de todos os nós
+    def urls(self):
+        if self.router is None:
+            return [self.base_url]
+        return self.router.urls() or [self.base_url]
+
+    # Verificação leve usada pelo disjuntor: sem retentativas e com timeout curto.
+    # Qualquer resposta abaixo de 500 mostra que o serviço está de pé.
+    def _probe(self, base_url):
+        response = requests.get(f"{base_url}/health", timeout=self.health_timeout)
+        return response.status_code < 500
+
+    def _breaker_changed(self, breaker, previous, state):
+        metrics.inc('sie_gateway_circuit_transitions_total', (('state', state),))
+        if self._logger and state == 'open':
+            self._logger.warning(
+                'Disjuntor %s aberto por %.0fs: %s', breaker.name, breaker.current_timeout, breaker.last_failure
+            )
+        elif self._logger:
+            self._logger.warning('Disjuntor %s: %s -> %s', breaker.name, previous, state)
+
+    # Segundos até o disjuntor permitir chamadas de novo (0 se fechado). Sem
+    # sessão, considera todos os nós: só é maior que 0 com todos fora do ar.
+    def unavailable_for(self, session_id=None):
+        if self._breaker_options is None:
+            return 0
+        if session_id is not None:
+            return self.breaker_for(self.url_for(session_id)).retry_after()
+        return min(self.breaker_for(url).retry_after() for url in self.urls())
+
+    def _build_session(self):
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            status=self.max_retries,
+            backoff_factor=self.retry_backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def session(self):
+        # A sessão é recriada após um fork para não compartilhar sockets
+        # entre processos
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._build_session()
+                    self._pid = pid
+        return self._session
+
+    # `endpoint` identifica a rota nas métricas, sem o ID da sessão. A chamada
+    # vai para o nó da sessão `session_id`, ou para `base_url` quando informado.
+    def _request(self, method, path, endpoint=None, session_id=None, base_url=None, **kwargs):
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        endpoint = endpoint or path
+        base_url = base_url or self.url_for(session_id)
+        breaker = self.breaker_for(base_url)
+
+        if breaker:
+            try:
+                breaker.before_call()
+            except CircuitOpen:
+                metrics.inc('sie_gateway_circuit_rejections_total', (('endpoint', endpoint),))
+                raise
+
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{base_url}{path}", **kwargs)
+        except Exception as e:
+            metrics.observe_gateway(endpoint, time.perf_counter() - started, error=e)
+            if breaker and isinstance(e, requests.RequestException):
+                breaker.record_failure(f"{type(e).__name__}: {e}")
+            raise
+        metrics.observe_gateway(endpoint, time.perf_counter() - started, response.status_code)
+
+        if breaker:
+            if response.status_code in (502, 503, 504):
+                breaker.record_failure(f"HTTP {response.status_code} em {endpoint}")
+            else:
+                breaker.record_success()
+        return response
+
+    # Instâncias
+
+    def list_instances(self, base_url=None):
+        return self._request('GET', '/instances', base_url=base_url)
+
+    def status(self, session_id, instance_type):
+        return self._request(
+            'GET', f"/status/{session_id}", '/status/<session_id>', session_id, params={'type': instance_type}
+        )
+
+    def init(self, session_id, instance_type):
+        return self._request('POST', '/init', session_id=session_id, json={
+            'sessionId': session_id,
+            'type': instance_type
+        })
+
+    def logout(self, session_id):
+        return self._request('POST', '/logout', session_id=session_id, json={'sessionId': session_id})
+
+    # Encerra a sessão no nó sem desconectar o WhatsApp (os dados de login
+    # ficam no diretório de sessões para outro nó continuar de onde parou)
+    def release(self, session_id, base_url):
+        return self._request('POST', '/release', base_url=base_url, json={'sessionId': session_id})
+
+    def set_webhook(self, session_id, url, ignore_groups):
+        return self._request('POST', '/set-webhook', session_id=session_id, json={
+            'sessionId': session_id,
+            'url': url,
+            'ignoreGroups': ignore_groups
+        })
+
+    # Mensagens
+
+    def send_message(self, session_id, to, message, instance_type):
+        return self._request('POST', '/send-message', session_id=session_id, json={
+            'sessionId': session_id,
+            'to': to,
+            'message': message,
+            'type': instance_type
+        })
+
+    def send_media(self, session_id, to, media_url, media_type, caption, instance_type):
+        return self._request('POST', '/send-media', session_id=session_id, json={
+            'sessionId': session_id,
+            'to': to,
+            'mediaUrl': media_url,
+            'caption': caption,
+            'mediaType': media_type,
+            'type': instance_type
+        })
+
+    # Com `participants`, o serviço não consulta os membros do grupo
+    def mention_all(self, session_id, group_id, message, anonymous, instance_type, participants=None):
+        payload = {
+            'sessionId': session_id,
+            'groupId': group_id,
+            'message': message,
+            'anonymous': anonymous,
+            'type': instance_type
+        }
+        if participants is not None:
+            payload['participants'] = participants
+        return self._request('POST', '/mention-all', session_id=session_id, json=payload)
+
+    # Grupos
+
+    def group_participants(self, session_id, group_id, instance_type):
+        return self._request(
+            'GET',
+            f"/group-participants/{session_id}/{quote(group_id, safe='@.')}",
+            '/group-participants/<session_id>/<group_id>',
+            session_id,
+            params={'type': instance_type}
+        )
+
+    # Contatos e conversas
+
+    def contacts(self, session_id, instance_type):
+        return self._request(
+            'GET', f"/contacts/{session_id}", '/contacts/<session_id>', session_id, params={'type': instance_type}
+        )
+
+    def chats(self, session_id, instance_type):
+        return self._request(
+            'GET', f"/chats/{session_id}", '/chats/<session_id>', session_id, params={'type': instance_type}
+        )
+
+    def block_contact(self, session_id, contact_id, instance_type):
+        return self._request('POST', '/block-contact', session_id=session_id, json={
+            'sessionId': session_id,
+            'contactId': contact_id,
+            'type': instance_type
+        })
+
+    def unblock_contact(self, session_id, contact_id, instance_type):
+        return self._request('POST', '/unblock-contact', session_id=session_id, json={
+            'sessionId': session_id,
+            'contactId': contact_id,
+            'type': instance_type
+        })
+
+gateway = WhatsAppGateway()
@@ -0,0 +1,56 @@
+"""Cache de usuários autenticados com vários workers.
+
+Dois AuthCache abertos no mesmo arquivo de instantes fazem o papel de dois
+processos do gunicorn: cada um tem a sua cópia do usuário e a alteração
+registrada por um deles precisa invalidar a cópia do outro.
+"""
+import time
+
+import pytest
+from src.services.auth_cache import AuthCache
+
+class StubUser:
+    def __init__(self, user_id, is_active=True):
+        self.id = user_id
+        self.email = f"usuario{user_id}@teste.local"
+        self.name = f"Usuário {user_id}"
+        self.is_admin = False
+        self.is_active = is_active
+        self.email_confirmed = True
+
+    def to_dict(self):
+        return {'id': self.id, 'email': self.email, 'is_active': self.is_active}
+
+class StubApp:
+    def __init__(self, path):
+        self.config = {'AUTH_CACHE_STAMPS_PATH': path, 'AUTH_CACHE_TTL': 30}
+        self.extensions = {}
+
+@pytest.fixture
+def workers(tmp_path):
+    path = str(tmp_path / 'auth_stamps.bin')
+    return AuthCache(StubApp(path)), AuthCache(StubApp(path))
+
+def test_invalidation_reaches_other_workers(workers):
+    first, second = workers
+    first.set_user(StubUser(1))
+    second.set_user(StubUser(1))
+    second.set_user(StubUser(2))
+
+    first.invalidate_user(1)
+
+    assert first.get_user(1) is None
+    assert second.get_user(1) is None
+    assert second.get_user(2) is not None
+
+    # Cópia lida depois da alteração continua valendo
+    second.set_user(StubUser(1, is_active=False))
+    assert second.get_user(1).is_active is False
+
+def test_change_during_the_database_read_invalidates_the_copy(workers):
+    first, second = workers
+    loaded_at = time.time()
+    first.invalidate_user(1)
+    second.set_user(StubUser(1), loaded_at)
+
+    assert second.get_user(1) is None
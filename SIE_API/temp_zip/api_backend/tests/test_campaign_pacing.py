@@ -0,0 +1,101 @@
+"""Ritmo das campanhas por instância com dois processos enviando.
+
+Dois processos (como dois workers do gunicorn) rodam cada um o seu
+CampaignRunner sobre o mesmo banco SQLite, a mesma CAMPAIGN_PACING_PATH e o
+mesmo serviço WhatsApp (benchmarks/gateway_stub.py). A campanha usa uma única
+instância; a soma dos envios dos dois não pode passar de rate_per_instance.
+"""
+import datetime
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import pytest
+from src.main import create_app
+from src.cli import init_database
+from src.models.user import db, Campaign, CampaignRecipient, User, WhatsAppInstance
+from src.services.campaigns import InstancePacer, campaign_runner
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from gateway_stub import start_stub
+
+RATE = 4.0
+DURATION = 2.0
+
+def build(workdir, gateway_url):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'campaigns.db')}",
+        'WHATSAPP_SERVICE_URL': gateway_url,
+        'CAMPAIGN_PACING_PATH': os.path.join(workdir, 'pacing.bin'),
+        'CAMPAIGN_REFRESH_INTERVAL': 0.2,
+        'DATABASE_ROUTING_PATH': os.path.join(workdir, 'routing.bin'),
+        'RATE_LIMIT_PATH': os.path.join(workdir, 'rate_limit.bin'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics')
+    })
+
+# Processo de envio: roda o runner até `deadline` (relógio de parede)
+def run_sender(workdir, gateway_url, deadline):
+    app = build(workdir, gateway_url)
+    with app.app_context():
+        while time.time() < deadline:
+            if not campaign_runner.run_once():
+                time.sleep(0.005)
+            db.session.remove()
+    os._exit(0)
+
+@pytest.fixture
+def stub():
+    server = start_stub()
+    yield server
+    server.shutdown()
+
+def test_two_runners_share_the_instance_rate(tmp_path, stub):
+    workdir = str(tmp_path)
+    app = build(workdir, stub.url)
+    init_database(app)
+    with app.app_context():
+        admin = User.query.filter_by(email=app.config['ADMIN_EMAIL']).first()
+        instance = WhatsAppInstance(name='Campanha', session_id='session_pacing', user_id=admin.id, is_connected=True)
+        db.session.add(instance)
+        db.session.flush()
+        campaign = Campaign(
+            user_id=admin.id, name='Ritmo', message='Olá', instance_ids=json.dumps([instance.id]),
+            rate_per_instance=RATE, jitter=0.0, status='running', started_at=datetime.datetime.utcnow()
+        )
+        db.session.add(campaign)
+        db.session.flush()
+        campaign_runner.add_recipients(campaign, ((f"55119{index:08d}", {}) for index in range(100)))
+        db.session.commit()
+        campaign_id = campaign.id
+
+    context = multiprocessing.get_context('fork')
+    deadline = time.time() + DURATION
+    senders = [context.Process(target=run_sender, args=(workdir, stub.url, deadline)) for _ in range(2)]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join(DURATION + 10)
+        assert sender.exitcode == 0
+
+    with app.app_context():
+        sent = db.session.execute(
+            db.select(CampaignRecipient.sent_at)
+            .where(CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.status == 'sent')
+        ).all()
+
+    # Um envio logo no início e depois um a cada 1 / RATE segundos
+    assert len(sent) >= RATE * DURATION / 2
+    assert len(sent) <= RATE * DURATION + 1
+
+def test_release_returns_an_unused_reservation(tmp_path):
+    first, second = InstancePacer(), InstancePacer()
+    for pacer in (first, second):
+        pacer.open(str(tmp_path / 'pacing.bin'), 64)
+
+    assert first.reserve(1, 1.0)
+    assert not second.reserve(1, 1.0)
+    first.release(1)
+    assert second.reserve(1, 1.0)
+    assert not first.reserve(1, 1.0)
@@ -0,0 +1,93 @@
+"""Recebimento de eventos do serviço WhatsApp (POST /api/events)."""
+import datetime
+import os
+
+import pytest
+from src.main import create_app
+from src.cli import init_database
+from src.models.user import db, MessageLog, MessageLogKey, User, WhatsAppInstance, MESSAGE_LOG_EPOCH, message_log_id
+
+SECRET = 'segredo-dos-eventos'
+TIMESTAMP = 1767225600  # 2026-01-01 00:00:00 UTC
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'events.db'}",
+        'EVENTS_SECRET': SECRET,
+        'DATABASE_ROUTING_PATH': str(tmp_path / 'routing.bin'),
+        'RATE_LIMIT_PATH': str(tmp_path / 'rate_limit.bin'),
+        'METRICS_DIR': str(tmp_path / 'metrics')
+    })
+    init_database(app)
+    with app.app_context():
+        admin = User.query.filter_by(email=app.config['ADMIN_EMAIL']).first()
+        db.session.add(WhatsAppInstance(name='Eventos', session_id='session_events', user_id=admin.id))
+        db.session.commit()
+    return app
+
+@pytest.fixture
+def instance_id(app):
+    with app.app_context():
+        return WhatsAppInstance.query.filter_by(session_id='session_events').first().id
+
+def message(message_id, **fields):
+    return {'sessionId': 'session_events', 'type': 'message', 'id': message_id, 'chatId': '5511999999999@c.us',
+            'body': 'Olá', 'timestamp': TIMESTAMP, **fields}
+
+def post(app, events):
+    return app.test_client().post('/api/events', json={'events': events}, headers={'X-Events-Secret': SECRET})
+
+def stored(app):
+    with app.app_context():
+        return db.session.execute(db.select(MessageLog.id, MessageLog.message_id).order_by(MessageLog.id)).all()
+
+def test_resent_events_are_not_duplicated(app):
+    batch = [message('A1'), message('A2'), message('A1')]
+
+    response = post(app, batch)
+    assert response.status_code == 200
+    assert response.get_json()['accepted'] == 2
+
+    response = post(app, batch)
+    assert response.get_json()['accepted'] == 0
+    assert sorted(message_id for _, message_id in stored(app)) == ['A1', 'A2']
+
+def test_hash_collision_in_another_batch_is_kept(app, instance_id):
+    timestamp = datetime.datetime.utcfromtimestamp(TIMESTAMP)
+    taken = message_log_id(timestamp, instance_id, 'B1')
+
+    # Outra mensagem já ocupa o id que o hash de B1 gera
+    with app.app_context():
+        db.session.add(MessageLog(id=taken, instance_id=instance_id, message_id='outra', chat_id='x', timestamp=timestamp))
+        db.session.add(MessageLogKey(instance_id=instance_id, message_id='outra', log_id=taken))
+        db.session.commit()
+
+    response = post(app, [message('B1')])
+    assert response.get_json()['accepted'] == 1
+    assert stored(app) == [(taken, 'outra'), (taken + 1, 'B1')]
+
+def test_timestamp_before_epoch_uses_the_arrival_time(app):
+    assert post(app, [message('C1', timestamp=946684800)]).get_json()['accepted'] == 1
+
+    with app.app_context():
+        timestamp = db.session.execute(db.select(MessageLog.timestamp)).scalar_one()
+    assert timestamp > MESSAGE_LOG_EPOCH
+    # O id não fica no segundo 0 da época, onde as colisões se concentrariam
+    assert stored(app)[0][0] >> 32 > 0
+
+def test_malformed_events_are_skipped(app):
+    response = post(app, [
+        message('D1', sessionId=['session_events']),
+        message('D2', sessionId={'id': 'session_events'}),
+        message('D3', timestamp=1e20),
+        message('D4', timestamp=1e300),
+        {'type': 'group_participants', 'sessionId': ['x'], 'groupId': '1@g.us', 'participants': []},
+        {'type': 'group_participants', 'sessionId': 'session_events', 'groupId': ['1@g.us'], 'participants': []},
+        message('D5')
+    ])
+
+    assert response.status_code == 200
+    assert response.get_json()['accepted'] == 1
+    assert response.get_json()['skipped'] == 6
+    assert [message_id for _, message_id in stored(app)] == ['D5']
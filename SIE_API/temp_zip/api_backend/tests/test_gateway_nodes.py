@@ -0,0 +1,48 @@
+"""Rota das sessões para os nós do serviço WhatsApp (gateway_nodes.url_for).
+
+Os nós ficam em memória por GATEWAY_NODES_REFRESH_INTERVAL segundos; os testes
+gravam no banco, depois da primeira leitura, nós e sessões que o processo
+ainda não conhece, como faria outro worker.
+"""
+import pytest
+from src.main import create_app
+from src.cli import init_database
+from src.models.user import db, GatewayNode, User, WhatsAppInstance
+from src.services.gateway_nodes import gateway_nodes
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'nodes.db'}",
+        'WHATSAPP_SERVICE_URL': 'http://no-padrao.local/api',
+        'GATEWAY_NODES_REFRESH_INTERVAL': 3600.0,
+        'DATABASE_ROUTING_PATH': str(tmp_path / 'routing.bin'),
+        'RATE_LIMIT_PATH': str(tmp_path / 'rate_limit.bin'),
+        'METRICS_DIR': str(tmp_path / 'metrics')
+    })
+    init_database(app)
+    with app.app_context():
+        gateway_nodes.ensure_default()
+        gateway_nodes.snapshot()
+    return app
+
+def add_instance(session_id, node_id):
+    admin = User.query.filter_by(email='admin@sieapi.com').first()
+    db.session.add(WhatsAppInstance(name=session_id, session_id=session_id, user_id=admin.id, gateway_node_id=node_id))
+    db.session.commit()
+
+def test_node_added_by_another_worker_is_found(app):
+    with app.app_context():
+        node = GatewayNode(name='segundo', url='http://segundo.local/api')
+        db.session.add(node)
+        db.session.commit()
+        add_instance('sessao_nova', node.id)
+
+        assert gateway_nodes.url_for('sessao_nova') == 'http://segundo.local/api'
+        assert node.id in gateway_nodes.snapshot().nodes
+
+def test_missing_node_falls_back_to_the_ring(app):
+    with app.app_context():
+        add_instance('sessao_orfa', 999)
+
+        assert gateway_nodes.url_for('sessao_orfa') == 'http://no-padrao.local/api'
@@ -0,0 +1,190 @@
+"""Caixa de saída de e-mails contra um servidor SMTP local.
+
+O servidor de teste fala o suficiente de SMTP para o smtplib (EHLO, MAIL,
+RCPT, DATA, RSET, QUIT), guarda as mensagens aceitas e recusa com 451 os
+destinatários em `refused`, como um servidor com falha temporária.
+"""
+import datetime
+import socketserver
+import threading
+
+import pytest
+from src.main import create_app
+from src.cli import init_database
+from src.models.user import db, EmailOutbox
+from src.services.background import Periodic
+from src.services.mail_outbox import mail_outbox
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        recipients = []
+        self.reply('220 teste ESMTP')
+        for raw in self.rfile:
+            command = raw.decode('utf-8').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 teste')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip().strip('<>')
+                if address in server.refused:
+                    self.reply('451 Tente mais tarde')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 Fim com <CRLF>.<CRLF>')
+                lines = []
+                for data in self.rfile:
+                    if data == b'.\r\n':
+                        break
+                    lines.append(data)
+                server.received.append((recipients, b''.join(lines)))
+                self.reply('250 OK')
+            elif verb == 'RSET':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Tchau')
+                return
+            else:
+                self.reply('250 OK')
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.received = []
+        self.refused = set()
+
+@pytest.fixture
+def smtp():
+    server = SMTPStub()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def app(tmp_path, smtp):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'mail.db'}",
+        'MAIL_SERVER': '127.0.0.1',
+        'MAIL_PORT': smtp.server_address[1],
+        'MAIL_USE_TLS': False,
+        'MAIL_USERNAME': '',
+        'MAIL_OUTBOX_RETRY_BACKOFF': 30.0,
+        'MAIL_OUTBOX_LOCK_TIMEOUT': 600,
+        'DATABASE_ROUTING_PATH': str(tmp_path / 'routing.bin'),
+        'RATE_LIMIT_PATH': str(tmp_path / 'rate_limit.bin'),
+        'METRICS_DIR': str(tmp_path / 'metrics')
+    })
+    init_database(app)
+    return app
+
+def enqueue(app, to):
+    with app.app_context():
+        email = mail_outbox.enqueue(to, 'Assunto', '<p>Olá</p>')
+        db.session.commit()
+        return email.id
+
+def load(app, email_id):
+    with app.app_context():
+        email = db.session.get(EmailOutbox, email_id)
+        db.session.expunge(email)
+        return email
+
+def test_sends_pending_email(app, smtp):
+    email_id = enqueue(app, 'cliente@teste.local')
+
+    with app.app_context():
+        mail_outbox.run_once()
+
+    email = load(app, email_id)
+    assert email.status == 'sent'
+    assert email.attempts == 1
+    assert email.sent_at is not None
+    assert [recipients for recipients, _ in smtp.received] == [['cliente@teste.local']]
+    assert b'Assunto' in smtp.received[0][1]
+
+def test_refused_email_is_retried_with_backoff(app, smtp):
+    smtp.refused.add('instavel@teste.local')
+    email_id = enqueue(app, 'instavel@teste.local')
+
+    with app.app_context():
+        mail_outbox.run_once()
+    first = load(app, email_id)
+    assert first.status == 'pending'
+    assert first.attempts == 1
+    assert '451' in first.last_error
+    delay = (first.next_attempt_at - datetime.datetime.utcnow()).total_seconds()
+    assert mail_outbox.retry_backoff - 5 < delay <= mail_outbox.retry_backoff
+
+    # Antes do prazo o e-mail não é tentado de novo
+    with app.app_context():
+        mail_outbox.run_once()
+    assert load(app, email_id).attempts == 1
+
+    # Segunda falha: o intervalo dobra
+    with app.app_context():
+        db.session.get(EmailOutbox, email_id).next_attempt_at = datetime.datetime.utcnow()
+        db.session.commit()
+        mail_outbox.run_once()
+    second = load(app, email_id)
+    assert second.attempts == 2
+    delay = (second.next_attempt_at - datetime.datetime.utcnow()).total_seconds()
+    assert 2 * mail_outbox.retry_backoff - 5 < delay <= 2 * mail_outbox.retry_backoff
+
+    # Servidor de volta: o e-mail sai na próxima tentativa
+    smtp.refused.clear()
+    with app.app_context():
+        db.session.get(EmailOutbox, email_id).next_attempt_at = datetime.datetime.utcnow()
+        db.session.commit()
+        mail_outbox.run_once()
+    assert load(app, email_id).status == 'sent'
+    assert len(smtp.received) == 1
+
+def test_stale_sending_email_is_released(app, smtp):
+    email_id = enqueue(app, 'preso@teste.local')
+    with app.app_context():
+        email = db.session.get(EmailOutbox, email_id)
+        email.status = 'sending'
+        email.attempts = 1
+        email.locked_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=mail_outbox.lock_timeout + 1)
+        db.session.commit()
+
+        mail_outbox.run_once()
+
+    email = load(app, email_id)
+    assert email.status == 'sent'
+    assert email.attempts == 2
+    assert [recipients for recipients, _ in smtp.received] == [['preso@teste.local']]
+
+def test_stale_check_runs_periodically(app, smtp):
+    with app.app_context():
+        mail_outbox.run_once()
+
+    # Travado depois da última verificação: só é liberado na próxima
+    email_id = enqueue(app, 'preso@teste.local')
+    with app.app_context():
+        email = db.session.get(EmailOutbox, email_id)
+        email.status = 'sending'
+        email.locked_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=mail_outbox.lock_timeout + 1)
+        db.session.commit()
+
+        mail_outbox.run_once()
+    assert load(app, email_id).status == 'sending'
+
+    mail_outbox.stale_check = Periodic(0.0)
+    with app.app_context():
+        mail_outbox.run_once()
+    assert load(app, email_id).status == 'sent'
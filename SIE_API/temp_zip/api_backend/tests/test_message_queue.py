@@ -0,0 +1,48 @@
+"""Limite de envios por instância da fila com vários processos."""
+import multiprocessing
+import time
+
+from src.services.message_queue import InstanceThrottle
+
+RATE = 10.0
+BURST = 3
+DURATION = 1.0
+
+# Processo de envio: conta os envios liberados até `deadline`
+def run_sender(path, deadline, granted):
+    throttle = InstanceThrottle(RATE, BURST)
+    throttle.open(path, 64)
+    count = 0
+    while time.time() < deadline:
+        if throttle.acquire(1) == 0:
+            count += 1
+        else:
+            time.sleep(0.001)
+    granted.put(count)
+
+def test_limit_holds_across_processes(tmp_path):
+    context = multiprocessing.get_context('fork')
+    granted = context.Queue()
+    deadline = time.time() + DURATION
+    senders = [context.Process(target=run_sender, args=(str(tmp_path / 'throttle.bin'), deadline, granted)) for _ in range(4)]
+    for sender in senders:
+        sender.start()
+    total = sum(granted.get(timeout=DURATION + 10) for _ in senders)
+    for sender in senders:
+        sender.join()
+
+    # A rajada inicial mais uma ficha a cada 1 / RATE segundos
+    assert RATE * DURATION / 2 <= total <= BURST + RATE * DURATION + 1
+
+def test_acquire_waits_and_release_returns_the_token(tmp_path):
+    throttle = InstanceThrottle(1.0, 2)
+    throttle.open(str(tmp_path / 'throttle.bin'), 64)
+
+    assert throttle.acquire(7) == 0
+    assert throttle.acquire(7) == 0
+    wait = throttle.acquire(7)
+    assert 0.9 < wait <= 1.0
+
+    throttle.release(7)
+    assert throttle.acquire(7) == 0
+    assert throttle.acquire(8) == 0
@@ -0,0 +1,181 @@
+"""Roteamento de leituras para a réplica, com dois arquivos SQLite.
+
+O banco principal é preparado com init_database() e copiado para o arquivo da
+réplica; a cópia não acompanha as escritas seguintes, como uma réplica
+atrasada. Cada teste confere para qual banco foram as consultas (contadas por
+engine) e o que a resposta mostra.
+"""
+import os
+import shutil
+import time
+
+import jwt
+import pytest
+from flask import Response
+from sqlalchemy import event
+from src.main import create_app
+from src.cli import init_database
+from src.models.user import db, User
+
+WINDOW = 0.3
+
+def build(workdir, replica_url=None, **config):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'primary.db')}",
+        'SQLALCHEMY_BINDS': {'replica_1': replica_url} if replica_url else {},
+        'DATABASE_READ_YOUR_WRITES_WINDOW': WINDOW,
+        'DATABASE_ROUTING_PATH': os.path.join(workdir, 'routing.bin'),
+        'RATE_LIMIT_PATH': os.path.join(workdir, 'rate_limit.bin'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'AUTH_CACHE_TTL': 0,
+        **config
+    })
+
+def count_queries(app):
+    counts = {}
+    with app.app_context():
+        for key, engine in db.engines.items():
+            name = 'réplica' if key else 'principal'
+            counts[name] = 0
+
+            def before_cursor_execute(*args, name=name):
+                counts[name] += 1
+
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return counts
+
+def headers_for(app, user_id):
+    token = jwt.encode({'user_id': user_id}, app.config['SECRET_KEY'], algorithm='HS256')
+    return {'Authorization': f"Bearer {token}"}
+
+# Resposta lida por completo (as listagens são geradas em streaming) e fechada
+def finished(response):
+    response.get_data()
+    response.close()
+    return response
+
+# Chama `call` e devolve (resposta, bancos consultados)
+def routed(counts, call):
+    before = dict(counts)
+    response = call()
+    if isinstance(response, Response):
+        finished(response)
+    return response, {name for name in counts if counts[name] > before[name]}
+
+def admin_name(response):
+    return next(user['name'] for user in response.get_json()['users'] if user['email'] == 'admin@sieapi.com')
+
+@pytest.fixture
+def workdir(tmp_path):
+    app = build(str(tmp_path))
+    init_database(app)
+    with app.app_context():
+        user = User('leitor@teste.local', 'senha-de-teste', 'Leitor')
+        user.confirm_email()
+        db.session.add(user)
+        db.session.commit()
+    shutil.copyfile(tmp_path / 'primary.db', tmp_path / 'replica.db')
+    return str(tmp_path)
+
+@pytest.fixture
+def ids(workdir):
+    app = build(workdir)
+    with app.app_context():
+        return {email: user_id for user_id, email in db.session.execute(db.select(User.id, User.email))}
+
+@pytest.fixture
+def app(workdir, ids):
+    return build(workdir, f"sqlite:///{os.path.join(workdir, 'replica.db')}")
+
+def test_read_goes_to_replica(app, ids):
+    counts = count_queries(app)
+    client = app.test_client()
+
+    response, used = routed(counts, lambda: client.get('/api/whatsapp/instances', headers=headers_for(app, ids['admin@sieapi.com'])))
+    assert response.status_code == 200
+    assert used == {'réplica'}
+
+def test_write_goes_to_primary(app, ids):
+    counts = count_queries(app)
+    client = app.test_client()
+
+    response, used = routed(counts, lambda: client.put('/api/auth/update-profile', json={'name': 'Admin Novo'},
+                                                       headers=headers_for(app, ids['admin@sieapi.com'])))
+    assert response.status_code == 200
+    assert used == {'principal'}
+
+def test_read_your_writes_window(app, ids):
+    counts = count_queries(app)
+    client = app.test_client()
+    admin = headers_for(app, ids['admin@sieapi.com'])
+    reader = headers_for(app, ids['leitor@teste.local'])
+
+    assert finished(client.put('/api/auth/update-profile', json={'name': 'Admin Novo'}, headers=admin)).status_code == 200
+
+    # Logo após a escrita, o mesmo usuário lê do principal e vê o dado novo
+    response, used = routed(counts, lambda: client.get('/api/auth/users', headers=admin))
+    assert used == {'principal'}
+    assert admin_name(response) == 'Admin Novo'
+
+    # Outro usuário continua na réplica
+    response, used = routed(counts, lambda: client.get('/api/auth/me', headers=reader))
+    assert response.status_code == 200
+    assert used == {'réplica'}
+
+    # Passada a janela, volta à réplica (atrasada: ainda mostra o nome antigo)
+    time.sleep(WINDOW + 0.1)
+    response, used = routed(counts, lambda: client.get('/api/auth/users', headers=admin))
+    assert used == {'réplica'}
+    assert admin_name(response) == 'Administrador'
+
+def test_queries_outside_requests_use_primary(app):
+    counts = count_queries(app)
+
+    with app.app_context():
+        _, used = routed(counts, lambda: db.session.execute(db.select(User.id)).all())
+    assert used == {'principal'}
+
+def test_fallback_when_replica_fails(workdir, ids):
+    # Réplica num diretório que não existe: toda conexão falha
+    app = build(workdir, f"sqlite:///{os.path.join(workdir, 'ausente', 'replica.db')}", DATABASE_REPLICA_RETRY_AFTER=0.3)
+    client = app.test_client()
+    headers = headers_for(app, ids['admin@sieapi.com'])
+    breaker = app.extensions['replica_router'].breakers['replica_1']
+
+    # A leitura falha na réplica e é repetida no principal
+    response = finished(client.get('/api/auth/users', headers=headers))
+    assert response.status_code == 200
+    assert admin_name(response) == 'Administrador'
+    assert breaker.state == 'open'
+    assert breaker.last_failure
+
+    # Com o disjuntor aberto, a réplica nem é tentada
+    counts = count_queries(app)
+    response, used = routed(counts, lambda: client.get('/api/whatsapp/instances', headers=headers))
+    assert response.status_code == 200
+    assert used == {'principal'}
+
+    # Passado o tempo, o SELECT 1 ainda falha e o disjuntor continua aberto
+    time.sleep(0.4)
+    response, used = routed(counts, lambda: client.get('/api/whatsapp/instances', headers=headers))
+    assert response.status_code == 200
+    assert used == {'principal'}
+    assert breaker.state == 'open'
+
+def test_replica_returns_after_recovery(workdir, ids):
+    replica = os.path.join(workdir, 'depois', 'replica.db')
+    app = build(workdir, f"sqlite:///{replica}", DATABASE_REPLICA_RETRY_AFTER=0.2)
+    client = app.test_client()
+    headers = headers_for(app, ids['admin@sieapi.com'])
+
+    assert finished(client.get('/api/whatsapp/instances', headers=headers)).status_code == 200
+    assert app.extensions['replica_router'].breakers['replica_1'].state == 'open'
+
+    # A réplica volta: depois do tempo do disjuntor, as leituras voltam a ela
+    os.makedirs(os.path.dirname(replica))
+    shutil.copyfile(os.path.join(workdir, 'replica.db'), replica)
+    time.sleep(0.3)
+    counts = count_queries(app)
+    response, used = routed(counts, lambda: client.get('/api/whatsapp/instances', headers=headers))
+    assert response.status_code == 200
+    assert used == {'réplica'}
@@ -0,0 +1,129 @@
+/**
+ * Encaminhamento de eventos para a API Flask
+ * As mensagens recebidas e enviadas (e as mudanças de membros dos grupos) são
+ * acumuladas em memória e enviadas em lotes para POST /api/events. Em caso de falha o
+ * lote volta para o início do buffer e o envio é repetido com backoff.
+ */
+
+const axios = require('axios');
+
+const EVENTS_URL = process.env.EVENTS_URL || '';
+const EVENTS_SECRET = process.env.EVENTS_SECRET || '';
+const EVENTS_BATCH_SIZE = parseInt(process.env.EVENTS_BATCH_SIZE || '500', 10);
+const EVENTS_FLUSH_MS = parseInt(process.env.EVENTS_FLUSH_MS || '500', 10);
+const EVENTS_MAX_BUFFER = parseInt(process.env.EVENTS_MAX_BUFFER || '50000', 10);
+const EVENTS_MAX_BACKOFF_MS = 30000;
+
+let buffer = [];
+let flushing = false;
+let timer = null;
+let backoff = 0;
+
+const schedule = (delay) => {
+  if (!timer) {
+    timer = setTimeout(() => {
+      timer = null;
+      flush();
+    }, delay);
+  }
+};
+
+const flush = async () => {
+  if (flushing || buffer.length === 0) {
+    return;
+  }
+
+  flushing = true;
+  const batch = buffer.splice(0, EVENTS_BATCH_SIZE);
+  try {
+    await axios.post(EVENTS_URL, { events: batch }, {
+      headers: { 'X-Events-Secret': EVENTS_SECRET },
+      timeout: 10000
+    });
+    backoff = 0;
+  } catch (error) {
+    const status = error.response?.status;
+    if (status && status >= 400 && status < 500 && status !== 429) {
+      // Erro do lote (segredo, formato): repetir não resolve
+      console.error(`Lote de ${batch.length} eventos recusado pela API (${status})`);
+    } else {
+      buffer = batch.concat(buffer);
+      backoff = Math.min(backoff ? backoff * 2 : 1000, EVENTS_MAX_BACKOFF_MS);
+      console.error(`Falha ao enviar eventos para a API, nova tentativa em ${backoff}ms:`, error.message);
+    }
+  } finally {
+    flushing = false;
+    if (buffer.length >= EVENTS_BATCH_SIZE && !backoff) {
+      flush();
+    } else if (buffer.length) {
+      schedule(backoff || EVENTS_FLUSH_MS);
+    }
+  }
+};
+
+// Adiciona um evento ao buffer (sem efeito se EVENTS_URL não estiver definido)
+const forwardEvent = (event) => {
+  if (!EVENTS_URL) {
+    return;
+  }
+
+  buffer.push(event);
+  if (buffer.length > EVENTS_MAX_BUFFER) {
+    const dropped = buffer.length - EVENTS_MAX_BUFFER;
+    buffer.splice(0, dropped);
+    console.error(`Buffer de eventos cheio, ${dropped} eventos descartados`);
+  }
+
+  if (buffer.length >= EVENTS_BATCH_SIZE && !backoff) {
+    flush();
+  } else {
+    schedule(backoff || EVENTS_FLUSH_MS);
+  }
+};
+
+// Evento de mensagem do whatsapp-web.js
+const webMessageEvent = (sessionId, message) => {
+  const chatId = message.fromMe ? message.to : message.from;
+  return {
+    sessionId,
+    type: 'message',
+    id: message.id?._serialized,
+    chatId,
+    sender: message.fromMe ? message.from : (message.author || message.from),
+    fromMe: message.fromMe,
+    isGroup: chatId.endsWith('@g.us'),
+    messageType: message.type,
+    body: message.body,
+    hasMedia: message.hasMedia,
+    timestamp: message.timestamp
+  };
+};
+
+// Evento de mensagem do Baileys
+const baileysMessageEvent = (sessionId, message, me) => {
+  const chatId = message.key.remoteJid;
+  return {
+    sessionId,
+    type: 'message',
+    id: message.key.id,
+    chatId,
+    sender: message.key.fromMe ? me : (message.key.participant || chatId),
+    fromMe: !!message.key.fromMe,
+    isGroup: chatId.endsWith('@g.us'),
+    messageType: Object.keys(message.message || {})[0] || 'unknown',
+    body: message.message?.conversation || message.message?.extendedTextMessage?.text || '',
+    hasMedia: !!message.message?.imageMessage || !!message.message?.audioMessage,
+    timestamp: Number(message.messageTimestamp)
+  };
+};
+
+// Entrada/saída de membros de um grupo (atualiza o cache do mention-all na API)
+const groupParticipantsEvent = (sessionId, groupId, action, participants) => ({
+  sessionId,
+  type: 'group_participants',
+  groupId,
+  action,
+  participants: participants.map(p => (typeof p === 'string' ? p : p?.id || p?._serialized)).filter(Boolean)
+});
+
+module.exports = { forwardEvent, webMessageEvent, baileysMessageEvent, groupParticipantsEvent };
@@ -0,0 +1,91 @@
+/**
+ * Fluxo de eventos em tempo real para a API Flask (Server-Sent Events)
+ * Cada processo do backend mantém uma conexão em GET /api/events/stream e repassa
+ * os eventos aos painéis dos usuários. Ao conectar, o backend recebe o estado atual
+ * de todas as sessões e os QR codes pendentes; depois, cada mudança de estado, QR
+ * code e mensagem (só sessionId e direção, para a contagem). Com EVENTS_SECRET
+ * definido, o backend precisa enviar o cabeçalho X-Events-Secret.
+ */
+
+const EVENTS_SECRET = process.env.EVENTS_SECRET || '';
+const EVENTS_STREAM_HEARTBEAT_MS = parseInt(process.env.EVENTS_STREAM_HEARTBEAT_MS || '15000', 10);
+
+const clients = new Set();
+const states = new Map();
+const qrCodes = new Map();
+
+const write = (res, type, data) => {
+  res.write(`event: ${type}\ndata: ${JSON.stringify(data)}\n\n`);
+};
+
+const broadcast = (type, data) => {
+  for (const res of clients) {
+    write(res, type, data);
+  }
+};
+
+// Mudança de estado da sessão: qr, authenticated, connected, disconnected ou released
+const publishState = (sessionId, state, reason) => {
+  const event = { sessionId, state, at: Date.now() };
+  if (reason) {
+    event.reason = String(reason);
+  }
+
+  if (state === 'released') {
+    states.delete(sessionId);
+  } else {
+    states.set(sessionId, event);
+  }
+  if (state !== 'qr') {
+    qrCodes.delete(sessionId);
+  }
+  broadcast('state', event);
+};
+
+const publishQr = (sessionId, qr) => {
+  qrCodes.set(sessionId, qr);
+  publishState(sessionId, 'qr');
+  broadcast('qr', { sessionId, qr });
+};
+
+const publishMessage = (sessionId, fromMe) => {
+  if (clients.size) {
+    broadcast('message', { sessionId, fromMe: !!fromMe });
+  }
+};
+
+const setupEventStream = (app) => {
+  app.get('/api/events/stream', (req, res) => {
+    if (EVENTS_SECRET && req.get('X-Events-Secret') !== EVENTS_SECRET) {
+      return res.status(401).json({ success: false, error: 'Segredo inválido' });
+    }
+
+    res.writeHead(200, {
+      'Content-Type': 'text/event-stream',
+      'Cache-Control': 'no-cache',
+      'Connection': 'keep-alive',
+      'X-Accel-Buffering': 'no'
+    });
+    res.write('retry: 2000\n\n');
+
+    for (const event of states.values()) {
+      write(res, 'state', event);
+    }
+    for (const [sessionId, qr] of qrCodes) {
+      write(res, 'qr', { sessionId, qr });
+    }
+
+    clients.add(res);
+    req.on('close', () => clients.delete(res));
+  });
+
+  // Comentários periódicos mantêm a conexão aberta em proxies e permitem ao
+  // backend detectar uma conexão morta
+  setInterval(() => {
+    for (const res of clients) {
+      res.write(': ping\n\n');
+    }
+  }, EVENTS_STREAM_HEARTBEAT_MS).unref();
+};
+
+module.exports = { setupEventStream, publishState, publishQr, publishMessage };
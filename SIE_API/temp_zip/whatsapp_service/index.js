@@ -10,6 +10,9 @@ const fs = require('fs');
 const path = require('path');
 const axios = require('axios');
 const setupN8nIntegration = require('./n8n_integration');
+const { loadLocalMedia, isRemoteUrl, mediaSource } = require('./local_media');
+const { forwardEvent, webMessageEvent, baileysMessageEvent, groupParticipantsEvent } = require('./event_forwarder');
+const { setupEventStream, publishState, publishQr, publishMessage } = require('./event_stream');
 
 // Configuração do servidor Express
 const app = express();
@@ -26,8 +29,9 @@ app.use(cors());
 app.use(express.json());
 app.use(express.urlencoded({ extended: true }));
 
-// Diretório para armazenar dados das sessões
-const SESSIONS_DIR = path.join(__dirname, 'sessions');
+// Diretório para armazenar dados das sessões; com vários nós, use um volume
+// compartilhado para que uma sessão migrada continue logada no novo nó
+const SESSIONS_DIR = process.env.SESSIONS_DIR || path.join(__dirname, 'sessions');
 if (!fs.existsSync(SESSIONS_DIR)) {
   fs.mkdirSync(SESSIONS_DIR, { recursive: true });
 }
@@ -36,6 +40,11 @@ if (!fs.existsSync(SESSIONS_DIR)) {
 const instances = {};
 const baileysSessions = {};
 
+// Sessões em inicialização pela rota /api/init e sessões liberadas por
+// /api/release (migradas para outro nó), que não devem reconectar aqui
+const initializingSessions = new Set();
+const releasedSessions = new Set();
+
 // Função para criar diretório de sessão
 const createSessionDir = (sessionId) => {
   const sessionDir = path.join(SESSIONS_DIR, sessionId);
@@ -47,6 +56,7 @@ const createSessionDir = (sessionId) => {
 
 // Função para inicializar cliente WhatsApp-Web.js
 const initWhatsAppWebClient = async (sessionId, socketId) => {
+  releasedSessions.delete(sessionId);
   const sessionDir = createSessionDir(sessionId);
   
   const client = new Client({
@@ -61,18 +71,21 @@ const initWhatsAppWebClient = async (sessionId, socketId) => {
     console.log(`QR Code gerado para sessão ${sessionId}`);
     qrcode.generate(qr, { small: true });
     io.to(socketId).emit('qr', { sessionId, qr });
+    publishQr(sessionId, qr);
   });
 
   // Evento de autenticação
   client.on('authenticated', () => {
     console.log(`Sessão ${sessionId} autenticada`);
     io.to(socketId).emit('authenticated', { sessionId });
+    publishState(sessionId, 'authenticated');
   });
 
   // Evento de pronto
   client.on('ready', () => {
     console.log(`Cliente ${sessionId} está pronto`);
     io.to(socketId).emit('ready', { sessionId });
+    publishState(sessionId, 'connected');
   });
 
   // Evento de mensagem recebida
@@ -110,10 +123,28 @@ const initWhatsAppWebClient = async (sessionId, socketId) => {
     }
   });
 
+  // Histórico na API Flask: message_create inclui mensagens recebidas e enviadas
+  client.on('message_create', (message) => {
+    forwardEvent(webMessageEvent(sessionId, message));
+    publishMessage(sessionId, message.fromMe);
+  });
+
+  // Membros que entraram/saíram dos grupos (cache do mention-all na API)
+  client.on('group_join', (notification) => {
+    forwardEvent(groupParticipantsEvent(sessionId, notification.chatId, 'add', notification.recipientIds || []));
+  });
+  client.on('group_leave', (notification) => {
+    forwardEvent(groupParticipantsEvent(sessionId, notification.chatId, 'remove', notification.recipientIds || []));
+  });
+  
   // Evento de desconexão
   client.on('disconnected', (reason) => {
     console.log(`Cliente ${sessionId} desconectado:`, reason);
     io.to(socketId).emit('disconnected', { sessionId, reason });
+    if (releasedSessions.has(sessionId)) {
+      return;
+    }
+    publishState(sessionId, 'disconnected', reason);
     
     // Tentar reconectar automaticamente
     client.initialize().catch(err => {
@@ -134,6 +165,7 @@ const initWhatsAppWebClient = async (sessionId, socketId) => {
 
 // Função para inicializar cliente Baileys
 const initBaileysClient = async (sessionId, socketId) => {
+  releasedSessions.delete(sessionId);
   const sessionDir = createSessionDir(sessionId);
   const { state, saveCreds } = await useMultiFileAuthState(path.join(sessionDir, 'baileys_auth_info'));
   
@@ -149,31 +181,48 @@ const initBaileysClient = async (sessionId, socketId) => {
     if (qr) {
       console.log(`QR Code Baileys gerado para sessão ${sessionId}`);
       io.to(socketId).emit('qr', { sessionId, qr });
+      publishQr(sessionId, qr);
     }
     
     if (connection === 'open') {
       console.log(`Conexão Baileys aberta para sessão ${sessionId}`);
       io.to(socketId).emit('ready', { sessionId });
+      publishState(sessionId, 'connected');
     }
     
     if (connection === 'close') {
-      const shouldReconnect = lastDisconnect?.error?.output?.statusCode !== DisconnectReason.loggedOut;
+      const shouldReconnect = lastDisconnect?.error?.output?.statusCode !== DisconnectReason.loggedOut
+        && !releasedSessions.has(sessionId);
       console.log(`Conexão Baileys fechada para sessão ${sessionId}, reconectar: ${shouldReconnect}`);
       
       if (shouldReconnect) {
+        publishState(sessionId, 'disconnected', lastDisconnect?.error?.message);
         initBaileysClient(sessionId, socketId);
       } else {
         io.to(socketId).emit('disconnected', { sessionId, reason: 'logged_out' });
+        if (!releasedSessions.has(sessionId)) {
+          publishState(sessionId, 'disconnected', 'logged_out');
+        }
       }
     }
   });
   
   // Evento de credenciais atualizadas
   sock.ev.on('creds.update', saveCreds);
+
+  // Membros que entraram/saíram dos grupos (cache do mention-all na API)
+  sock.ev.on('group-participants.update', ({ id, participants, action }) => {
+    forwardEvent(groupParticipantsEvent(sessionId, id, action, participants || []));
+  });
   
   // Evento de mensagem recebida
   sock.ev.on('messages.upsert', async ({ messages }) => {
     for (const message of messages) {
+      if (message.key?.remoteJid && message.message) {
+        forwardEvent(baileysMessageEvent(sessionId, message, sock.user?.id));
+        publishMessage(sessionId, message.key.fromMe);
+      }
+      
       if (!message.key.fromMe) {
         console.log(`Mensagem Baileys recebida na sessão ${sessionId}`);
         
@@ -231,12 +280,7 @@ io.on('connection', (socket) => {
   // Desconectar instância
   socket.on('logout', async ({ sessionId }) => {
     try {
-      if (instances[sessionId]) {
-        await instances[sessionId].client.logout();
-        delete instances[sessionId];
-      } else if (baileysSessions[sessionId]) {
-        delete baileysSessions[sessionId];
-      }
+      await logoutSession(sessionId);
       
       socket.emit('logout_response', { success: true, sessionId });
     } catch (error) {
@@ -255,8 +299,87 @@ io.on('connection', (socket) => {
 // Configurar integração com n8n
 const n8nIntegration = setupN8nIntegration(app, instances, baileysSessions);
 
+// Fluxo de eventos para o backend Flask (GET /api/events/stream)
+setupEventStream(app);
+
 // Rotas da API
 
+// Verificação de saúde (usada pelo disjuntor do backend Flask)
+app.get('/api/health', (req, res) => {
+  res.json({
+    success: true,
+    instances: Object.keys(instances).length + Object.keys(baileysSessions).length,
+    uptime: process.uptime()
+  });
+});
+
+// Iniciar sessão pela API Flask (criação ou migração vinda de outro nó). A
+// inicialização continua em segundo plano; o QR code, se necessário, sai no log.
+app.post('/api/init', (req, res) => {
+  const { sessionId, type = 'whatsapp-web.js' } = req.body;
+  
+  if (!sessionId) {
+    return res.status(400).json({ success: false, error: 'sessionId não fornecido' });
+  }
+  if (instances[sessionId] || baileysSessions[sessionId] || initializingSessions.has(sessionId)) {
+    return res.json({ success: true, sessionId, type, alreadyRunning: true });
+  }
+  
+  initializingSessions.add(sessionId);
+  const init = type === 'baileys' ? initBaileysClient(sessionId, null) : initWhatsAppWebClient(sessionId, null);
+  init
+    .catch(error => console.error(`Erro ao inicializar sessão ${sessionId}:`, error))
+    .finally(() => initializingSessions.delete(sessionId));
+  
+  res.json({ success: true, sessionId, type });
+});
+
+// Logout: desconecta o WhatsApp e encerra a sessão (usado pelo socket e pela API)
+const logoutSession = async (sessionId) => {
+  if (instances[sessionId]) {
+    await instances[sessionId].client.logout();
+    delete instances[sessionId];
+  } else if (baileysSessions[sessionId]) {
+    delete baileysSessions[sessionId];
+  }
+  publishState(sessionId, 'disconnected', 'logout');
+};
+
+app.post('/api/logout', async (req, res) => {
+  try {
+    const { sessionId } = req.body;
+    await logoutSession(sessionId);
+    
+    res.json({ success: true, sessionId });
+  } catch (error) {
+    console.error('Erro ao desconectar sessão:', error);
+    res.status(500).json({ success: false, error: error.message });
+  }
+});
+
+// Liberar sessão sem logout: fecha o cliente e mantém os dados de login no
+// diretório de sessões, para outro nó assumir a sessão
+app.post('/api/release', async (req, res) => {
+  try {
+    const { sessionId } = req.body;
+    releasedSessions.add(sessionId);
+    
+    if (instances[sessionId]) {
+      await instances[sessionId].client.destroy();
+      delete instances[sessionId];
+    } else if (baileysSessions[sessionId]) {
+      baileysSessions[sessionId].sock.end(undefined);
+      delete baileysSessions[sessionId];
+    }
+    publishState(sessionId, 'released');
+    
+    res.json({ success: true, sessionId });
+  } catch (error) {
+    console.error('Erro ao liberar sessão:', error);
+    res.status(500).json({ success: false, error: error.message });
+  }
+});
+
 // Listar todas as instâncias
 app.get('/api/instances', (req, res) => {
   const activeInstances = Object.keys(instances).map(id => ({
@@ -312,25 +435,26 @@ app.post('/api/send-media', async (req, res) => {
       
       const client = instances[sessionId].client;
       let media;
+      let localMedia = null;
       
       // Se for URL, baixar o arquivo
-      if (mediaUrl.startsWith('http')) {
+      if (isRemoteUrl(mediaUrl)) {
         const response = await axios.get(mediaUrl, { responseType: 'arraybuffer' });
         media = Buffer.from(response.data, 'binary');
       } else {
-        // Se for caminho local
-        media = mediaUrl;
+        // Se for caminho local (arquivo enviado por upload para a API)
+        localMedia = loadLocalMedia(mediaUrl);
       }
       
       let result;
       if (mediaType === 'image') {
-        const messageMedia = new (require('whatsapp-web.js')).MessageMedia('image/jpeg', media.toString('base64'));
+        const messageMedia = localMedia || new (require('whatsapp-web.js')).MessageMedia('image/jpeg', media.toString('base64'));
         result = await client.sendMessage(to, messageMedia, { caption });
       } else if (mediaType === 'audio') {
-        const messageMedia = new (require('whatsapp-web.js')).MessageMedia('audio/mp3', media.toString('base64'));
+        const messageMedia = localMedia || new (require('whatsapp-web.js')).MessageMedia('audio/mp3', media.toString('base64'));
         result = await client.sendMessage(to, messageMedia);
       } else if (mediaType === 'document') {
-        const messageMedia = new (require('whatsapp-web.js')).MessageMedia('application/pdf', media.toString('base64'));
+        const messageMedia = localMedia || new (require('whatsapp-web.js')).MessageMedia('application/pdf', media.toString('base64'));
         result = await client.sendMessage(to, messageMedia, { caption });
       }
       
@@ -346,17 +470,17 @@ app.post('/api/send-media', async (req, res) => {
       // Esta parte varia dependendo do tipo de mídia
       if (mediaType === 'image') {
         await sock.sendMessage(to, { 
-          image: { url: mediaUrl }, 
+          image: { url: mediaSource(mediaUrl) }, 
           caption 
         });
       } else if (mediaType === 'audio') {
         await sock.sendMessage(to, { 
-          audio: { url: mediaUrl }, 
+          audio: { url: mediaSource(mediaUrl) }, 
           mimetype: 'audio/mp4'
         });
       } else if (mediaType === 'document') {
         await sock.sendMessage(to, { 
-          document: { url: mediaUrl }, 
+          document: { url: mediaSource(mediaUrl) }, 
           mimetype: 'application/pdf',
           caption
         });
@@ -371,9 +495,12 @@ app.post('/api/send-media', async (req, res) => {
 });
 
 // Marcar todos em um grupo
+// `participants` (opcional) traz os membros já conhecidos pela API, evitando a
+// consulta ao grupo a cada envio
 app.post('/api/mention-all', async (req, res) => {
   try {
     const { sessionId, groupId, message, anonymous = false, type = 'whatsapp-web.js' } = req.body;
+    let { participants } = req.body;
     
     if (type === 'whatsapp-web.js') {
       if (!instances[sessionId]) {
@@ -381,41 +508,31 @@ app.post('/api/mention-all', async (req, res) => {
       }
       
       const client = instances[sessionId].client;
-      const chat = await client.getChatById(groupId);
       
-      if (!chat.isGroup) {
-        return res.status(400).json({ success: false, error: 'O ID fornecido não é de um grupo' });
+      if (!Array.isArray(participants)) {
+        const chat = await client.getChatById(groupId);
+        
+        if (!chat.isGroup) {
+          return res.status(400).json({ success: false, error: 'O ID fornecido não é de um grupo' });
+        }
+        
+        participants = chat.participants.map(p => p.id._serialized);
       }
       
-      const participants = chat.participants.map(p => p.id._serialized);
-      
-      // Se for anônimo, usar a palavra-chave "cita!"
+      // As menções aceitam os IDs diretamente, sem buscar cada contato
       let finalMessage = message;
       if (anonymous && message.includes('cita!')) {
+        // Se for anônimo, usar a palavra-chave "cita!"
         finalMessage = message.replace('cita!', '');
-        
-        // Criar menções para todos os participantes
-        let mentions = [];
-        for (const participant of participants) {
-          mentions.push(await client.getContactById(participant));
-        }
-        
-        await chat.sendMessage(finalMessage, { mentions });
       } else {
         // Mencionar todos normalmente
-        let mentionText = '';
-        let mentions = [];
-        
-        for (const participant of participants) {
-          const contact = await client.getContactById(participant);
-          mentionText += `@${participant.split('@')[0]} `;
-          mentions.push(contact);
-        }
-        
-        await chat.sendMessage(`${mentionText}\n${message}`, { mentions });
+        const mentionText = participants.map(participant => `@${participant.split('@')[0]}`).join(' ');
+        finalMessage = `${mentionText}\n${message}`;
       }
       
-      res.json({ success: true });
+      await client.sendMessage(groupId, finalMessage, { mentions: participants });
+      
+      res.json({ success: true, mentioned: participants.length });
     } else if (type === 'baileys') {
       if (!baileysSessions[sessionId]) {
         return res.status(404).json({ success: false, error: 'Instância Baileys não encontrada' });
@@ -424,11 +541,10 @@ app.post('/api/mention-all', async (req, res) => {
       const sock = baileysSessions[sessionId].sock;
       
       // Obter participantes do grupo
-      const metadata = await sock.groupMetadata(groupId);
-      const participants = metadata.participants.map(p => p.id);
-      
-      // Criar menções
-      const mentions = participants.map(jid => ({ mentioned: jid }));
+      if (!Array.isArray(participants)) {
+        const metadata = await sock.groupMetadata(groupId);
+        participants = metadata.participants.map(p => p.id);
+      }
       
       // Se for anônimo, usar a palavra-chave "cita!"
       let finalMessage = message;
@@ -436,10 +552,7 @@ app.post('/api/mention-all', async (req, res) => {
         finalMessage = message.replace('cita!', '');
       } else {
         // Adicionar @menção para cada participante
-        let mentionText = '';
-        for (const participant of participants) {
-          mentionText += `@${participant.split('@')[0]} `;
-        }
+        const mentionText = participants.map(participant => `@${participant.split('@')[0]}`).join(' ');
         finalMessage = `${mentionText}\n${message}`;
       }
       
@@ -448,7 +561,7 @@ app.post('/api/mention-all', async (req, res) => {
         mentions: participants
       });
       
-      res.json({ success: true });
+      res.json({ success: true, mentioned: participants.length });
     }
   } catch (error) {
     console.error('Erro ao mencionar todos:', error);
@@ -456,6 +569,45 @@ app.post('/api/mention-all', async (req, res) => {
   }
 });
 
+// Membros de um grupo (usado pelo cache de grupos da API)
+app.get('/api/group-participants/:sessionId/:groupId', async (req, res) => {
+  try {
+    const { sessionId, groupId } = req.params;
+    const { type = 'whatsapp-web.js' } = req.query;
+    
+    if (type === 'whatsapp-web.js') {
+      if (!instances[sessionId]) {
+        return res.status(404).json({ success: false, error: 'Instância não encontrada' });
+      }
+      
+      const chat = await instances[sessionId].client.getChatById(groupId);
+      if (!chat.isGroup) {
+        return res.status(400).json({ success: false, error: 'O ID fornecido não é de um grupo' });
+      }
+      
+      res.json({
+        success: true,
+        subject: chat.name,
+        participants: chat.participants.map(p => p.id._serialized)
+      });
+    } else if (type === 'baileys') {
+      if (!baileysSessions[sessionId]) {
+        return res.status(404).json({ success: false, error: 'Instância Baileys não encontrada' });
+      }
+      
+      const metadata = await baileysSessions[sessionId].sock.groupMetadata(groupId);
+      res.json({
+        success: true,
+        subject: metadata.subject,
+        participants: metadata.participants.map(p => p.id)
+      });
+    }
+  } catch (error) {
+    console.error('Erro ao obter membros do grupo:', error);
+    res.status(500).json({ success: false, error: error.message });
+  }
+});
+
 // Bloquear número
 app.post('/api/block-contact', async (req, res) => {
   try {
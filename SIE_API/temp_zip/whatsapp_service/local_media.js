@@ -0,0 +1,76 @@
+/**
+ * Mídias locais enviadas pela API Flask
+ * Os arquivos do armazenamento da API são nomeados pelo hash do conteúdo e
+ * nunca mudam, então a versão já codificada em base64 pode ser reaproveitada
+ * entre destinatários. Só são aceitos arquivos dentro de MEDIA_STORE_PATH (o
+ * mesmo diretório da API); sem ele, nenhum caminho local é aceito.
+ */
+
+const fs = require('fs');
+const path = require('path');
+const { MessageMedia } = require('whatsapp-web.js');
+
+const MEDIA_STORE_PATH = process.env.MEDIA_STORE_PATH || '';
+// Limite do cache em bytes de base64 (padrão: 64 MB)
+const LOCAL_MEDIA_CACHE_BYTES = parseInt(process.env.LOCAL_MEDIA_CACHE_BYTES || String(64 * 1024 * 1024), 10);
+const localMediaCache = new Map();
+let localMediaCacheBytes = 0;
+
+// Caminho real do arquivo, apenas se estiver dentro de MEDIA_STORE_PATH
+const resolveMediaPath = (filePath) => {
+  if (!MEDIA_STORE_PATH) {
+    throw new Error('Arquivos locais desativados: defina MEDIA_STORE_PATH');
+  }
+
+  let root;
+  let resolved;
+  try {
+    root = fs.realpathSync(MEDIA_STORE_PATH);
+    resolved = fs.realpathSync(filePath);
+  } catch (error) {
+    throw new Error('Arquivo de mídia não encontrado');
+  }
+
+  if (!resolved.startsWith(root + path.sep)) {
+    throw new Error('Caminho de mídia não permitido');
+  }
+  return resolved;
+};
+
+const isRemoteUrl = (mediaUrl) => /^https?:\/\//i.test(mediaUrl);
+
+// Origem da mídia para o Baileys, que também lê caminhos locais: URLs
+// http(s) passam direto, caminhos só dentro de MEDIA_STORE_PATH
+const mediaSource = (mediaUrl) => (isRemoteUrl(mediaUrl) ? mediaUrl : resolveMediaPath(mediaUrl));
+
+// Carrega um arquivo local como MessageMedia, usando o cache quando possível
+const loadLocalMedia = (filePath) => {
+  const resolved = resolveMediaPath(filePath);
+
+  if (localMediaCache.has(resolved)) {
+    const media = localMediaCache.get(resolved);
+    // Reinsere para manter a ordem de uso (LRU)
+    localMediaCache.delete(resolved);
+    localMediaCache.set(resolved, media);
+    return media;
+  }
+  
+  const media = MessageMedia.fromFilePath(resolved);
+  const size = media.data.length;
+  
+  // Arquivos maiores que o limite não ficam em cache
+  if (size <= LOCAL_MEDIA_CACHE_BYTES) {
+    localMediaCache.set(resolved, media);
+    localMediaCacheBytes += size;
+    
+    while (localMediaCacheBytes > LOCAL_MEDIA_CACHE_BYTES) {
+      const [oldest, evicted] = localMediaCache.entries().next().value;
+      localMediaCache.delete(oldest);
+      localMediaCacheBytes -= evicted.data.length;
+    }
+  }
+  
+  return media;
+};
+
+module.exports = { loadLocalMedia, isRemoteUrl, mediaSource };
@@ -6,6 +6,7 @@
 const express = require('express');
 const router = express.Router();
 const axios = require('axios');
+const { loadLocalMedia, isRemoteUrl, mediaSource } = require('./local_media');
 
 // Configuração para integração com n8n
 const setupN8nIntegration = (app, instances, baileysSessions) => {
@@ -38,25 +39,26 @@ const setupN8nIntegration = (app, instances, baileysSessions) => {
         if (instanceType === 'whatsapp-web.js') {
           const client = instances[sessionId].client;
           let media;
+          let localMedia = null;
           
           // Se for URL, baixar o arquivo
-          if (mediaUrl.startsWith('http')) {
+          if (isRemoteUrl(mediaUrl)) {
             const response = await axios.get(mediaUrl, { responseType: 'arraybuffer' });
             media = Buffer.from(response.data, 'binary');
           } else {
-            // Se for caminho local
-            media = mediaUrl;
+            // Se for caminho local (arquivo enviado por upload para a API)
+            localMedia = loadLocalMedia(mediaUrl);
           }
           
           let result;
           if (mediaType === 'image') {
-            const messageMedia = new (require('whatsapp-web.js')).MessageMedia('image/jpeg', media.toString('base64'));
+            const messageMedia = localMedia || new (require('whatsapp-web.js')).MessageMedia('image/jpeg', media.toString('base64'));
             result = await client.sendMessage(to, messageMedia, { caption });
           } else if (mediaType === 'audio') {
-            const messageMedia = new (require('whatsapp-web.js')).MessageMedia('audio/mp3', media.toString('base64'));
+            const messageMedia = localMedia || new (require('whatsapp-web.js')).MessageMedia('audio/mp3', media.toString('base64'));
             result = await client.sendMessage(to, messageMedia);
           } else if (mediaType === 'document') {
-            const messageMedia = new (require('whatsapp-web.js')).MessageMedia('application/pdf', media.toString('base64'));
+            const messageMedia = localMedia || new (require('whatsapp-web.js')).MessageMedia('application/pdf', media.toString('base64'));
             result = await client.sendMessage(to, messageMedia, { caption });
           }
           
@@ -66,17 +68,17 @@ const setupN8nIntegration = (app, instances, baileysSessions) => {
           
           if (mediaType === 'image') {
             await sock.sendMessage(to, { 
-              image: { url: mediaUrl }, 
+              image: { url: mediaSource(mediaUrl) }, 
               caption 
             });
           } else if (mediaType === 'audio') {
             await sock.sendMessage(to, { 
-              audio: { url: mediaUrl }, 
+              audio: { url: mediaSource(mediaUrl) }, 
               mimetype: 'audio/mp4'
             });
           } else if (mediaType === 'document') {
             await sock.sendMessage(to, { 
-              document: { url: mediaUrl }, 
+              document: { url: mediaSource(mediaUrl) }, 
               mimetype: 'application/pdf',
               caption
             });